@@ -0,0 +1,308 @@
+"""
+Scriby - Audit logging pipeline
+Request handlers enqueue audit events on a Redis stream; a worker writes them in bulk
+"""
+
+import json
+import logging
+import time
+import uuid
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Constants
+AUDIT_STREAM = 'audit:events'
+AUDIT_GROUP = 'audit-writers'
+FLUSH_BATCH_SIZE = 500
+FLUSH_TIME_BUDGET = 50  # seconds a flush task keeps draining before yielding
+CLAIM_IDLE_MS = 5 * 60 * 1000  # redeliver entries a crashed worker left unacknowledged
+# Above this many queued events producers write synchronously, which slows
+# them down to the database's pace instead of growing Redis without bound
+STREAM_HIGH_WATER = getattr(settings, 'AUDIT_STREAM_HIGH_WATER', 100_000)
+AUDIT_RETENTION_MONTHS = getattr(settings, 'AUDIT_RETENTION_MONTHS', 12)
+PARTITIONS_AHEAD = 2
+
+# KEYS: stream  ARGV: high water mark, then field/value pairs
+# Returns the entry id, or false when the stream is over the high water mark
+ENQUEUE_SCRIPT = """
+if redis.call('XLEN', KEYS[1]) >= tonumber(ARGV[1]) then return false end
+local fields = {}
+for i = 2, #ARGV do fields[#fields + 1] = ARGV[i] end
+return redis.call('XADD', KEYS[1], '*', unpack(fields))
+"""
+
+_client = None
+_enqueue_script = None
+
+
+def _redis():
+    global _client, _enqueue_script
+    if _client is None:
+        from django_redis import get_redis_connection
+        _client = get_redis_connection('default')
+        _enqueue_script = _client.register_script(ENQUEUE_SCRIPT)
+    return _client
+
+
+# =============================================================================
+# PRODUCER
+# =============================================================================
+
+def build_audit_event(user=None, action: str = '', resource_type: str = '',
+                      resource_id: Optional[str] = None, ip_address: Optional[str] = None,
+                      user_agent: str = '', request_data: Any = None, response_data: Any = None,
+                      status_code: Optional[int] = None,
+                      processing_time_ms: Optional[int] = None) -> Dict[str, str]:
+    """Serialize an audit event into flat string fields for the stream."""
+    return {
+        'event_id': uuid.uuid4().hex,
+        'occurred_at': timezone.now().isoformat(),
+        'user_id': str(getattr(user, 'pk', user) or ''),
+        'action': action,
+        'resource_type': resource_type,
+        'resource_id': str(resource_id or ''),
+        'ip_address': ip_address or '',
+        'user_agent': (user_agent or '')[:1000],
+        'request_data': json.dumps(request_data or {}, default=str),
+        'response_data': json.dumps(response_data or {}, default=str),
+        'status_code': str(status_code or ''),
+        'processing_time_ms': str(processing_time_ms or ''),
+    }
+
+
+def _enqueue(event: Dict[str, str]):
+    try:
+        _redis()
+        args = [STREAM_HIGH_WATER]
+        for field, value in event.items():
+            args.extend([field, value])
+        if _enqueue_script(keys=[AUDIT_STREAM], args=args):
+            return
+        logger.warning("Audit stream above high water mark, writing synchronously")
+    except Exception as e:
+        logger.error(f"Audit stream unavailable, writing synchronously: {str(e)}")
+    # Runs from on_commit, after the request's transaction has committed, so a
+    # failure here must not surface as an error on work that already succeeded
+    try:
+        write_audit_events([event])
+    except Exception as e:
+        logger.exception(f"Dropped audit event {event['event_id']}: {str(e)}")
+
+
+def log_audit_event(**kwargs):
+    """
+    Record an audit event without an INSERT on the request path. The event is
+    queued once the surrounding transaction commits, so rolled-back work is
+    not audited; it falls back to a direct write if Redis is unavailable or
+    the queue is backed up.
+    """
+    event = build_audit_event(**kwargs)
+    transaction.on_commit(lambda: _enqueue(event))
+
+
+# =============================================================================
+# CONSUMER
+# =============================================================================
+
+def _decode(entry: Dict) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in entry.items()
+    }
+
+
+def write_audit_events(events: List[Dict[str, str]]) -> int:
+    """
+    Insert events in one statement and return how many new rows were written.
+    The unique (event_id, occurred_at) pair makes redelivered events no-ops, so
+    at-least-once delivery from the stream still yields each row exactly once;
+    events already stored, or repeated within the batch, are not counted.
+    """
+    from .models import AuditLog
+
+    unique_events = {}
+    for event in events:
+        unique_events.setdefault((event['event_id'], event['occurred_at']), event)
+    if not unique_events:
+        return 0
+    occurred = [parse_datetime(occurred_at) for _, occurred_at in unique_events]
+    stored = set(
+        AuditLog.objects.filter(
+            event_id__in={event_id for event_id, _ in unique_events},
+            occurred_at__range=(min(occurred), max(occurred)),
+        ).values_list('event_id', 'occurred_at')
+    )
+
+    rows = []
+    for event in unique_events.values():
+        occurred_at = parse_datetime(event['occurred_at'])
+        if (event['event_id'], occurred_at) in stored:
+            continue
+        rows.append(AuditLog(
+            event_id=event['event_id'],
+            occurred_at=occurred_at,
+            user_id=event['user_id'] or None,
+            action=event['action'],
+            resource_type=event['resource_type'],
+            resource_id=event['resource_id'] or None,
+            ip_address=event['ip_address'] or None,
+            user_agent=event['user_agent'],
+            request_data=json.loads(event['request_data']),
+            response_data=json.loads(event['response_data']),
+            status_code=int(event['status_code']) if event['status_code'] else None,
+            processing_time_ms=int(event['processing_time_ms']) if event['processing_time_ms'] else None,
+        ))
+    AuditLog.objects.bulk_create(rows, batch_size=FLUSH_BATCH_SIZE, ignore_conflicts=True)
+    return len(rows)
+
+
+def _ensure_group(client):
+    try:
+        client.xgroup_create(AUDIT_STREAM, AUDIT_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def flush_audit_stream(consumer: Optional[str] = None, client=None) -> int:
+    """
+    Drain the stream into audit_logs in bulk batches. Entries are acknowledged
+    and deleted only after their batch is committed; entries left pending by a
+    worker that died are reclaimed after CLAIM_IDLE_MS.
+    """
+    client = client or _redis()
+    consumer = consumer or f'worker-{uuid.uuid4().hex[:8]}'
+    _ensure_group(client)
+
+    written = 0
+    deadline = time.monotonic() + FLUSH_TIME_BUDGET
+    reclaim_from = '0-0'
+    while time.monotonic() < deadline:
+        batch = []
+        if reclaim_from is not None:
+            reclaim_from, claimed, *_ = client.xautoclaim(
+                AUDIT_STREAM, AUDIT_GROUP, consumer, CLAIM_IDLE_MS,
+                start_id=reclaim_from, count=FLUSH_BATCH_SIZE
+            )
+            batch.extend(claimed)
+            if reclaim_from in (b'0-0', '0-0'):
+                reclaim_from = None
+        if not batch:
+            response = client.xreadgroup(
+                AUDIT_GROUP, consumer, {AUDIT_STREAM: '>'}, count=FLUSH_BATCH_SIZE
+            )
+            batch = response[0][1] if response else []
+        if not batch:
+            break
+
+        entry_ids = [entry_id for entry_id, _ in batch]
+        events = [_decode(fields) for _, fields in batch if fields]
+        with transaction.atomic():
+            written += write_audit_events(events)
+        client.xack(AUDIT_STREAM, AUDIT_GROUP, *entry_ids)
+        client.xdel(AUDIT_STREAM, *entry_ids)
+    return written
+
+
+# =============================================================================
+# PARTITION MAINTENANCE
+# =============================================================================
+
+# audit_logs is range-partitioned by month on occurred_at; the conversion from
+# a plain table ships as recordings/migrations/0003_partition_audit_logs.py
+
+def audit_logs_partitioned() -> bool:
+    """Whether audit_logs has been converted to a partitioned table."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')")
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"audit_logs_{month:%Y%m}"
+
+
+def audit_partitions() -> List[str]:
+    """Names of the monthly partitions currently attached to audit_logs."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'audit_logs' AND child.relname ~ '^audit_logs_[0-9]{6}$'
+        """)
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def _create_partition(cursor, name: str, start: date, end: date):
+    """
+    Create one monthly partition. Rows already in the default partition for
+    its range would make a plain CREATE fail, so the default is detached, the
+    partition created, those rows moved into it and the default re-attached,
+    all in one transaction that blocks writers until it commits.
+    """
+    bounds = f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    in_range = f"occurred_at >= '{start:%Y-%m-%d}' AND occurred_at < '{end:%Y-%m-%d}'"
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM audit_logs_default WHERE {in_range})")
+    if not cursor.fetchone()[0]:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF audit_logs {bounds}')
+        return
+    cursor.execute('ALTER TABLE audit_logs DETACH PARTITION audit_logs_default')
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF audit_logs {bounds}')
+    cursor.execute(f'INSERT INTO audit_logs SELECT * FROM audit_logs_default WHERE {in_range}')
+    moved = cursor.rowcount
+    cursor.execute(f'DELETE FROM audit_logs_default WHERE {in_range}')
+    cursor.execute('ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT')
+    logger.info(f"Moved {moved} audit rows from the default partition into {name}")
+
+
+def ensure_audit_partitions(months_ahead: int = PARTITIONS_AHEAD) -> List[str]:
+    """Create monthly partitions for the current month and the next few."""
+    today = timezone.now().date()
+    existing = set(audit_partitions())
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(today, offset)
+        name = _partition_name(start)
+        if name not in existing:
+            with transaction.atomic(), connection.cursor() as cursor:
+                _create_partition(cursor, name, start, _month_start(today, offset + 1))
+        created.append(name)
+    return created
+
+
+def drop_expired_audit_partitions(retention_months: int = AUDIT_RETENTION_MONTHS) -> List[str]:
+    """
+    Drop whole monthly partitions older than the retention window (no DELETE
+    scan), and delete expired rows that ended up in the default partition.
+    """
+    cutoff_month = _month_start(timezone.now().date(), -retention_months)
+    cutoff = _partition_name(cutoff_month)
+    dropped = []
+    with connection.cursor() as cursor:
+        for name in audit_partitions():
+            if name < cutoff:
+                cursor.execute(f'ALTER TABLE audit_logs DETACH PARTITION "{name}"')
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped.append(name)
+        cursor.execute(
+            "DELETE FROM audit_logs_default WHERE occurred_at < %s", [cutoff_month.isoformat()]
+        )
+        if cursor.rowcount:
+            logger.info(f"Deleted {cursor.rowcount} expired audit rows from the default partition")
+    if dropped:
+        logger.info(f"Dropped expired audit partitions: {', '.join(dropped)}")
+    return dropped
@@ -0,0 +1,201 @@
+"""
+Cached token authentication for Eskriba backend.
+
+Token lookups go through a small per-process LRU first and the shared cache
+(Redis in production) second, so hot clients authenticate without touching
+the database. Entries are dropped explicitly on logout and on user changes
+such as a new password; other processes forget them within LOCAL_TTL.
+
+Only the user id and a few profile fields are cached, never the password
+hash; other fields load from the database on first access.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TTL = getattr(settings, 'AUTH_TOKEN_LOCAL_TTL', 10)
+LOCAL_MAX_ENTRIES = getattr(settings, 'AUTH_TOKEN_LOCAL_MAX_ENTRIES', 10000)
+SHARED_TTL = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+CACHE_PREFIX = 'authtoken'
+CACHED_USER_FIELDS = getattr(settings, 'AUTH_TOKEN_CACHED_USER_FIELDS', (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined',
+))
+
+
+class LocalTTLCache:
+    """
+    Thread-safe LRU whose entries also expire after a fixed TTL.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local_tokens = LocalTTLCache(LOCAL_MAX_ENTRIES, LOCAL_TTL)
+
+
+def _token_cache_key(key):
+    # Never put raw credentials in Redis key names
+    return f'{CACHE_PREFIX}:key:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def _user_cache_key(user_id):
+    return f'{CACHE_PREFIX}:user:{user_id}'
+
+
+def _token_entry(token):
+    """
+    Plain-data snapshot of a token's user: the fields in CACHED_USER_FIELDS.
+    """
+    user = token.user
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.name in CACHED_USER_FIELDS
+    }
+
+
+def _token_from_entry(key, entry):
+    """
+    Rebuild a token and a partially loaded user from a cache entry. Fields
+    left out of the entry are deferred, so reading one issues a query and
+    save() only writes the loaded fields.
+    """
+    User = get_user_model()
+    field_names = [
+        field.attname for field in User._meta.concrete_fields if field.attname in entry
+    ]
+    user = User.from_db('default', field_names, [entry[name] for name in field_names])
+    return Token(key=key, user=user)
+
+
+def cache_token(token):
+    """
+    Store a token's user snapshot in both cache levels.
+    """
+    entry = _token_entry(token)
+    _local_tokens.set(token.key, entry)
+    try:
+        cache.set_many({
+            _token_cache_key(token.key): entry,
+            _user_cache_key(token.user_id): token.key,
+        }, SHARED_TTL)
+    except Exception as e:
+        logger.warning(f"Could not cache auth token: {str(e)}")
+
+
+def invalidate_token(key, user_id=None):
+    """
+    Forget a token in this process and in the shared cache.
+    """
+    _local_tokens.pop(key)
+    keys = [_token_cache_key(key)]
+    if user_id is not None:
+        keys.append(_user_cache_key(user_id))
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Could not invalidate cached auth token: {str(e)}")
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Forget every cached token of a user, e.g. after a password change.
+    """
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key, user_id)
+
+
+def token_for_user(user):
+    """
+    Return the user's token for a login response. Existing tokens are read
+    from the cache or with a plain SELECT; a row is only written when the
+    user has no token yet. The token is cached so the client's first API
+    call is already a cache hit.
+    """
+    try:
+        key = cache.get(_user_cache_key(user.pk))
+    except Exception:
+        key = None
+    if key:
+        token = Token(key=key, user=user)
+    else:
+        token = Token.objects.filter(user=user).first()
+        if token is None:
+            token, created = Token.objects.get_or_create(user=user)
+        token.user = user
+    cache_token(token)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for DRF's TokenAuthentication that avoids the
+    Token/User query for clients seen recently.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = _local_tokens.get(key)
+        if entry is None:
+            try:
+                entry = cache.get(_token_cache_key(key))
+            except Exception as e:
+                logger.warning(f"Auth token cache unavailable: {str(e)}")
+                entry = None
+            if entry is None:
+                try:
+                    token = Token.objects.select_related('user').get(key=key)
+                except Token.DoesNotExist:
+                    raise exceptions.AuthenticationFailed('Invalid token.')
+                cache_token(token)
+                entry = _token_entry(token)
+            else:
+                _local_tokens.set(key, entry)
+
+        # Every request gets its own user instance built from the entry
+        token = _token_from_entry(key, entry)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
@@ -0,0 +1,199 @@
+"""
+Authentication services for Eskriba backend.
+
+Registration and login shared by the auth endpoints. Password hashing is
+the expensive step, so attempts are rate limited per client IP and per
+account and IP pair before any hashing happens, and the number of hashes running at
+once in a worker is capped so a burst of logins cannot occupy every thread.
+"""
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .backends import token_for_user
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+LOGIN_IP_LIMIT = getattr(settings, 'AUTH_LOGIN_IP_LIMIT', 30)  # attempts per IP per window
+LOGIN_IP_WINDOW = getattr(settings, 'AUTH_LOGIN_IP_WINDOW', 300)
+LOGIN_ACCOUNT_LIMIT = getattr(settings, 'AUTH_LOGIN_ACCOUNT_LIMIT', 10)  # failures per account and IP per window
+LOGIN_ACCOUNT_WINDOW = getattr(settings, 'AUTH_LOGIN_ACCOUNT_WINDOW', 900)
+HASHING_CONCURRENCY = getattr(settings, 'AUTH_HASHING_CONCURRENCY', 2)
+HASHING_WAIT = getattr(settings, 'AUTH_HASHING_WAIT', 2.0)  # seconds to wait for a hashing slot
+NUM_PROXIES = getattr(settings, 'AUTH_NUM_PROXIES', 0)
+
+_hashing_slots = threading.BoundedSemaphore(HASHING_CONCURRENCY)
+
+
+class AuthServiceError(Exception):
+    """
+    Error carrying the HTTP status the endpoint should answer with.
+    """
+    status = 400
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class InvalidCredentials(AuthServiceError):
+    status = 401
+
+
+class TooManyAttempts(AuthServiceError):
+    status = 429
+
+
+class ServiceBusy(AuthServiceError):
+    status = 503
+
+
+def parse_credentials(request, *fields):
+    """
+    Read the given fields from a JSON request body; all are required.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except (TypeError, ValueError):
+        raise AuthServiceError('Invalid JSON body')
+    if not isinstance(data, dict):
+        raise AuthServiceError('Invalid JSON body')
+    values = [data.get(field) for field in fields]
+    if not all(isinstance(value, str) and value for value in values):
+        raise AuthServiceError(f"Missing required fields: {', '.join(fields)}")
+    return values
+
+
+def client_ip(request):
+    """
+    Client address, taken from X-Forwarded-For only as far as the number of
+    trusted proxies in front of the app allows (a client can forge the rest).
+    """
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded and NUM_PROXIES:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        return hops[-min(NUM_PROXIES, len(hops))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+def _ip_key(ip):
+    return f'auth:login:ip:{ip}'
+
+
+def _account_key(username, ip):
+    # Scoped to the client IP too, so failing logins against someone else's
+    # account from one address cannot lock its owner out everywhere
+    return f'auth:login:account:{username.lower()}:{ip}'
+
+
+def _count(key, window):
+    """Fixed-window counter in the shared cache; fails open if it is down."""
+    try:
+        cache.add(key, 0, window)
+        return cache.incr(key)
+    except Exception as e:
+        logger.warning(f"Login rate limiter unavailable: {str(e)}")
+        return 0
+
+
+def _current(key):
+    try:
+        return cache.get(key) or 0
+    except Exception:
+        return 0
+
+
+def check_login_allowed(ip, username):
+    """
+    Refuse the attempt before hashing when the IP has made too many attempts
+    or has too many recent failures against this account.
+    """
+    if _count(_ip_key(ip), LOGIN_IP_WINDOW) > LOGIN_IP_LIMIT:
+        raise TooManyAttempts('Too many login attempts, try again later', retry_after=LOGIN_IP_WINDOW)
+    if _current(_account_key(username, ip)) >= LOGIN_ACCOUNT_LIMIT:
+        raise TooManyAttempts('Too many failed logins for this account, try again later',
+                              retry_after=LOGIN_ACCOUNT_WINDOW)
+
+
+def record_login_failure(username, ip):
+    _count(_account_key(username, ip), LOGIN_ACCOUNT_WINDOW)
+
+
+def reset_login_failures(username, ip):
+    try:
+        cache.delete(_account_key(username, ip))
+    except Exception:
+        pass
+
+
+# =============================================================================
+# PASSWORD HASHING
+# =============================================================================
+
+def run_hashing(func, *args, **kwargs):
+    """
+    Run a password hashing call in one of the worker's few hashing slots.
+    When all slots stay busy for HASHING_WAIT seconds the request is turned
+    away instead of queueing behind an attack.
+    """
+    if not _hashing_slots.acquire(timeout=HASHING_WAIT):
+        raise ServiceBusy('Authentication is busy, try again shortly', retry_after=1)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _hashing_slots.release()
+
+
+# =============================================================================
+# REGISTER / LOGIN
+# =============================================================================
+
+def register_user(username, email, password):
+    """
+    Create a user and return it with its API token. The password is hashed
+    before the transaction opens, so waiting for a hashing slot never holds
+    a database transaction.
+    """
+    if User.objects.filter(username=username).exists():
+        raise AuthServiceError('Username already exists')
+    password_hash = run_hashing(make_password, password)
+    try:
+        with transaction.atomic():
+            user = User(
+                username=User.normalize_username(username),
+                email=User.objects.normalize_email(email),
+                password=password_hash,
+            )
+            user.save()
+    except IntegrityError:
+        raise AuthServiceError('Username already exists')
+    return user, token_for_user(user)
+
+
+def login_user(request, username, password):
+    """
+    Check credentials and return the user with its API token.
+
+    Passwords stored with an older hasher are rehashed with the preferred
+    one (Argon2 in production) by Django when the check succeeds.
+    """
+    ip = client_ip(request)
+    check_login_allowed(ip, username)
+    user = run_hashing(authenticate, request, username=username, password=password)
+    if user is None:
+        record_login_failure(username, ip)
+        raise InvalidCredentials('Invalid credentials')
+    reset_login_failures(username, ip)
+    return user, token_for_user(user)
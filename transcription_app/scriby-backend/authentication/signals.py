@@ -0,0 +1,30 @@
+"""
+Signal receivers that keep the auth token cache in sync with the database.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .backends import invalidate_token, invalidate_user_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """
+    Logout deletes the token; stop accepting it from the cache as well.
+    """
+    invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Password changes, deactivation and profile edits must not be served from
+    a stale cached user. Login only touches last_login, which is skipped.
+    """
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_user_tokens(instance.pk)
@@ -1,3 +1,117 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from . import services
+from .backends import CachedTokenAuthentication, _local_tokens, _token_cache_key, token_for_user
+
+User = get_user_model()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedTokenAuthenticationTest(TestCase):
+    """Test token lookups served from cache and their invalidation"""
+
+    def setUp(self):
+        _local_tokens.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='pass-1234')
+        self.token = Token.objects.create(user=self.user)
+        self.backend = CachedTokenAuthentication()
+
+    def test_repeat_lookups_skip_the_database(self):
+        user, token = self.backend.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.backend.authenticate_credentials(self.token.key)
+        _local_tokens.clear()
+        with self.assertNumQueries(0):
+            self.backend.authenticate_credentials(self.token.key)
+
+    def test_cache_holds_no_password_hash(self):
+        self.backend.authenticate_credentials(self.token.key)
+        entry = cache.get(_token_cache_key(self.token.key))
+        self.assertEqual(entry['id'], self.user.pk)
+        self.assertNotIn('password', entry)
+        user, _ = self.backend.authenticate_credentials(self.token.key)
+        self.assertEqual(user.username, 'cached')
+        self.assertTrue(user.check_password('pass-1234'))
+
+    def test_logout_invalidates_token(self):
+        key = self.token.key
+        self.backend.authenticate_credentials(key)
+        self.token.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.backend.authenticate_credentials(key)
+
+    def test_password_change_drops_cached_user(self):
+        self.backend.authenticate_credentials(self.token.key)
+        self.user.set_password('pass-5678')
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.backend.authenticate_credentials(self.token.key)
+
+    def test_login_reuses_token_without_writes(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(token_for_user(self.user).key, self.token.key)
+        with self.assertNumQueries(0):
+            self.assertEqual(token_for_user(self.user).key, self.token.key)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                      'django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LoginServiceTest(TestCase):
+    """Test login rate limits, bounded hashing and hash upgrades"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', password='right-password')
+        self.request = RequestFactory().post('/auth/login/', REMOTE_ADDR='203.0.113.7')
+
+    def test_account_locks_before_hashing(self):
+        for _ in range(services.LOGIN_ACCOUNT_LIMIT):
+            with self.assertRaises(services.InvalidCredentials):
+                services.login_user(self.request, 'alice', 'wrong')
+        with mock.patch.object(services, 'authenticate') as authenticate:
+            with self.assertRaises(services.TooManyAttempts):
+                services.login_user(self.request, 'alice', 'right-password')
+            authenticate.assert_not_called()
+
+    def test_lockout_does_not_reach_other_addresses(self):
+        for _ in range(services.LOGIN_ACCOUNT_LIMIT):
+            with self.assertRaises(services.InvalidCredentials):
+                services.login_user(self.request, 'alice', 'wrong')
+        owner_request = RequestFactory().post('/auth/login/', REMOTE_ADDR='198.51.100.20')
+        user, token = services.login_user(owner_request, 'alice', 'right-password')
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_register_stores_a_usable_password(self):
+        user, token = services.register_user('bob', 'bob@example.com', 'bob-password')
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('bob-password'))
+        self.assertTrue(token.key)
+
+    def test_busy_hashing_slots_turn_requests_away(self):
+        with mock.patch.object(services, '_hashing_slots', threading.BoundedSemaphore(1)), \
+                mock.patch.object(services, 'HASHING_WAIT', 0.01):
+            services._hashing_slots.acquire()
+            with self.assertRaises(services.ServiceBusy):
+                services.login_user(self.request, 'alice', 'right-password')
+
+    def test_login_upgrades_legacy_hash(self):
+        self.user.password = make_password('right-password', hasher='md5')
+        self.user.save()
+        user, token = services.login_user(self.request, 'alice', 'right-password')
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(token.key)
@@ -5,11 +5,11 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 User = get_user_model()
+from .backends import CachedTokenAuthentication
+from .services import AuthServiceError, login_user
 from .serializers import UserSerializer, RegisterSerializer
 
 
@@ -19,7 +19,7 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
 
@@ -58,18 +58,23 @@ class LoginView(APIView):
         """
         username = request.data.get('username')
         password = request.data.get('password')
-        
+
         if username and password:
-            user = authenticate(username=username, password=password)
-            if user:
-                token, created = Token.objects.get_or_create(user=user)
+            try:
+                user, token = login_user(request._request, username, password)
+            except AuthServiceError as e:
+                headers = {'Retry-After': str(e.retry_after)} if e.retry_after else None
                 return Response({
-                    'status': 'success',
-                    'message': 'Login successful',
-                    'token': token.key,
-                    'user_id': user.id
-                }, status=status.HTTP_200_OK)
-        
+                    'status': 'error',
+                    'message': e.message
+                }, status=e.status, headers=headers)
+            return Response({
+                'status': 'success',
+                'message': 'Login successful',
+                'token': token.key,
+                'user_id': user.id
+            }, status=status.HTTP_200_OK)
+
         return Response({
             'status': 'error',
             'message': 'Invalid credentials'
@@ -80,7 +85,7 @@ class LogoutView(APIView):
     """
     API view for user logout.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -104,7 +109,7 @@ class ProfileView(APIView):
     """
     API view for user profile management.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
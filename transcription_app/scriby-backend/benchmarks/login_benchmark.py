@@ -0,0 +1,153 @@
+"""
+Scriby - Login benchmark
+Runs a credential-stuffing attack against the login service alongside a
+trickle of legitimate logins, with and without the login protections, and
+reports how many password hashes the attack forced and how legitimate
+logins fared
+
+Usage:
+    pip install argon2-cffi  # optional, PBKDF2 is used otherwise
+    python benchmarks/login_benchmark.py --attackers 8 --seconds 10 --ips 20
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import django
+from django.conf import settings
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database: str) -> str:
+    try:
+        import argon2  # noqa: F401
+        hashers = ['django.contrib.auth.hashers.Argon2PasswordHasher']
+    except ImportError:
+        hashers = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+    settings.configure(
+        SECRET_KEY='benchmark',
+        USE_TZ=True,
+        INSTALLED_APPS=[
+            'django.contrib.auth', 'django.contrib.contenttypes',
+            'rest_framework', 'rest_framework.authtoken', 'authentication',
+        ],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database,
+                               'OPTIONS': {'timeout': 30}}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        PASSWORD_HASHERS=hashers,
+        DEFAULT_AUTO_FIELD='django.db.models.BigAutoField',
+    )
+    sys.path.insert(0, str(BACKEND_DIR))
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return hashers[0].rsplit('.', 1)[-1]
+
+
+def run(attackers: int, seconds: float, ips: int, protected: bool) -> dict:
+    from django.contrib.auth.hashers import get_hasher
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import RequestFactory
+
+    from authentication import services
+
+    cache.clear()
+    if protected:
+        services._hashing_slots = threading.BoundedSemaphore(services.HASHING_CONCURRENCY)
+        services.LOGIN_IP_LIMIT = 30
+        services.LOGIN_ACCOUNT_LIMIT = 10
+    else:
+        services._hashing_slots = threading.BoundedSemaphore(attackers + 1)
+        services.LOGIN_IP_LIMIT = services.LOGIN_ACCOUNT_LIMIT = 10 ** 9
+
+    hashes = Counter()
+    hasher = get_hasher()
+    original_verify = hasher.__class__.verify
+
+    def counting_verify(self, password, encoded):
+        hashes['verify'] += 1
+        return original_verify(self, password, encoded)
+
+    hasher.__class__.verify = counting_verify
+    factory = RequestFactory()
+    outcomes = Counter()
+    legit_latencies = []
+    deadline = time.monotonic() + seconds
+
+    def attacker(number):
+        attempt = 0
+        while time.monotonic() < deadline:
+            ip = f'10.0.{number}.{attempt % ips}'
+            request = factory.post('/auth/login/', REMOTE_ADDR=ip)
+            try:
+                services.login_user(request, 'victim', f'guess-{number}-{attempt}')
+            except services.AuthServiceError as e:
+                outcomes[f'attack {e.status}'] += 1
+            attempt += 1
+        connection.close()
+
+    def legitimate():
+        while time.monotonic() < deadline:
+            request = factory.post('/auth/login/', REMOTE_ADDR='192.168.1.1')
+            began = time.perf_counter()
+            try:
+                services.login_user(request, 'regular', 'correct-horse')
+                outcomes['legit 200'] += 1
+                legit_latencies.append(time.perf_counter() - began)
+            except services.AuthServiceError as e:
+                outcomes[f'legit {e.status}'] += 1
+            time.sleep(0.2)
+        connection.close()
+
+    threads = [threading.Thread(target=attacker, args=(n,)) for n in range(attackers)]
+    threads.append(threading.Thread(target=legitimate))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hasher.__class__.verify = original_verify
+
+    legit_latencies.sort()
+    return {
+        'hashes': hashes['verify'],
+        'outcomes': dict(outcomes),
+        'legit_p50_ms': statistics.median(legit_latencies) * 1000 if legit_latencies else None,
+        'legit_max_ms': legit_latencies[-1] * 1000 if legit_latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--attackers', type=int, default=8, help='concurrent attacking threads')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--ips', type=int, default=20, help='source IPs per attacker')
+    args = parser.parse_args(argv)
+
+    with tempfile.NamedTemporaryFile(suffix='.sqlite3') as database:
+        hasher = setup_django(database.name)
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        User.objects.create_user('victim', password='unguessable-secret')
+        User.objects.create_user('regular', password='correct-horse')
+
+        print(f"hasher: {hasher}, {args.attackers} attackers x {args.ips} IPs for {args.seconds:g}s")
+        for protected in (False, True):
+            result = run(args.attackers, args.seconds, args.ips, protected)
+            label = 'protected  ' if protected else 'unprotected'
+            p50 = f"{result['legit_p50_ms']:,.0f} ms" if result['legit_p50_ms'] is not None else 'n/a'
+            worst = f"{result['legit_max_ms']:,.0f} ms" if result['legit_max_ms'] is not None else 'n/a'
+            print(f"{label}  hashes forced: {result['hashes']:>6,}  "
+                  f"legit login p50: {p50:>8}  max: {worst:>8}  outcomes: {result['outcomes']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
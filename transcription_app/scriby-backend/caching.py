@@ -0,0 +1,199 @@
+"""
+Scriby - Response caching
+Stale-while-revalidate caching with single-flight recomputation, versioned keys and hit/miss metrics
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Constants
+CACHE_PREFIX = 'swr'
+LOCK_TIMEOUT = 30  # seconds a recompute may hold the single-flight lock
+WAIT_TIMEOUT = 2.0  # seconds a miss waits for another worker's recompute
+WAIT_INTERVAL = 0.05
+METRICS_FLUSH_INTERVAL = 10  # seconds between pushes of local counters to the shared cache
+METRIC_EVENTS = ('hit', 'stale', 'miss', 'coalesced', 'error')
+# Serve stale entries immediately and refresh them in a background thread;
+# when disabled the caller that wins the lock refreshes inline
+BACKGROUND_REFRESH = getattr(settings, 'SWR_BACKGROUND_REFRESH', True)
+
+
+def _version_key(namespace: str, scope) -> str:
+    return f'{CACHE_PREFIX}:{namespace}:{scope}:version'
+
+
+def _entry_key(namespace: str, scope, version: int) -> str:
+    return f'{CACHE_PREFIX}:{namespace}:{scope}:v{version}'
+
+
+# =============================================================================
+# VERSIONS
+# =============================================================================
+
+def get_cache_version(namespace: str, scope) -> int:
+    return cache.get(_version_key(namespace, scope)) or 0
+
+
+def bump_cache_version(namespace: str, scope, on_commit: bool = True):
+    """
+    Move a cached value to a new key so the next read recomputes it. Runs
+    after the current transaction commits, so the recompute sees the write;
+    entries under older versions simply expire.
+    """
+    def bump():
+        key = _version_key(namespace, scope)
+        try:
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+        except Exception as e:
+            logger.warning(f"Could not bump cache version for {namespace}:{scope}: {str(e)}")
+
+    if on_commit:
+        transaction.on_commit(bump)
+    else:
+        bump()
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+_metrics_flushed_at = time.monotonic()
+
+
+def _metric_key(namespace: str, event: str) -> str:
+    return f'{CACHE_PREFIX}:metrics:{namespace}:{event}'
+
+
+def _record(namespace: str, event: str):
+    """Count an event locally; counters reach the shared cache in periodic batches."""
+    global _metrics_flushed_at
+    with _metrics_lock:
+        _metrics[(namespace, event)] += 1
+        if time.monotonic() - _metrics_flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        pending = dict(_metrics)
+        _metrics.clear()
+        _metrics_flushed_at = time.monotonic()
+    _flush_metrics(pending)
+
+
+def _flush_metrics(pending: Dict):
+    for (namespace, event), count in pending.items():
+        key = _metric_key(namespace, event)
+        try:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+        except Exception as e:
+            logger.warning(f"Could not flush cache metrics: {str(e)}")
+            return
+
+
+def cache_metrics(namespace: str) -> Dict[str, int]:
+    """Hit/stale/miss/coalesced/error counts for a namespace across all workers."""
+    with _metrics_lock:
+        local = {event: _metrics[(namespace, event)] for event in METRIC_EVENTS}
+    shared = cache.get_many([_metric_key(namespace, event) for event in METRIC_EVENTS])
+    return {
+        event: local[event] + shared.get(_metric_key(namespace, event), 0)
+        for event in METRIC_EVENTS
+    }
+
+
+# =============================================================================
+# DECORATOR
+# =============================================================================
+
+def _store(key: str, value, fresh: int, stale: int):
+    cache.set(key, (time.time() + fresh, value), fresh + stale)
+
+
+def _refresh(key: str, lock_key: str, func: Callable, args, kwargs, fresh: int, stale: int):
+    try:
+        value = func(*args, **kwargs)
+        _store(key, value, fresh, stale)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def _refresh_in_background(*refresh_args):
+    def run():
+        try:
+            _refresh(*refresh_args)
+        except Exception as e:
+            logger.error(f"Background cache refresh failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def swr_cached(namespace: str, fresh: int, stale: int, scope: Optional[Callable] = None):
+    """
+    Cache a function's result per scope (by default the first argument's pk).
+
+    Fresh entries are returned as is. Stale entries, up to `stale` seconds
+    past freshness, are returned while a single caller recomputes them.
+    On a miss only the caller holding the lock computes; concurrent
+    callers wait briefly for its result instead of piling onto the
+    database. Call bump_cache_version(namespace, scope) on relevant writes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            scope_id = scope(*args, **kwargs) if scope else getattr(args[0], 'pk', args[0])
+            try:
+                key = _entry_key(namespace, scope_id, get_cache_version(namespace, scope_id))
+                entry = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Cache unavailable for {namespace}: {str(e)}")
+                _record(namespace, 'error')
+                return func(*args, **kwargs)
+
+            lock_key = f'{key}:lock'
+            refresh_args = (key, lock_key, func, args, kwargs, fresh, stale)
+            if entry is not None:
+                fresh_until, value = entry
+                if time.time() < fresh_until:
+                    _record(namespace, 'hit')
+                    return value
+                _record(namespace, 'stale')
+                if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                    if BACKGROUND_REFRESH:
+                        _refresh_in_background(*refresh_args)
+                    else:
+                        return _refresh(*refresh_args)
+                return value
+
+            if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                _record(namespace, 'miss')
+                return _refresh(*refresh_args)
+
+            # Another worker is computing this value; wait for its result
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    _record(namespace, 'coalesced')
+                    return entry[1]
+            _record(namespace, 'miss')
+            value = func(*args, **kwargs)
+            _store(key, value, fresh, stale)
+            return value
+
+        return wrapper
+    return decorator
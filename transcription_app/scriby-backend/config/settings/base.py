@@ -5,6 +5,7 @@ Bot 1: Backend Django Developer
 import os
 from pathlib import Path
 from decouple import config
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -25,6 +26,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # tsvector/trigram search (requires pg_trgm)
 ]
 
 THIRD_PARTY_APPS = [
@@ -107,6 +109,42 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Periodic maintenance run by the `beat` process
+CELERY_BEAT_SCHEDULE = {
+    'expire-bulk-exports': {
+        'task': 'scriby_backend.tasks.expire_bulk_exports',
+        'schedule': crontab(minute=15),
+    },
+    'expire-upload-sessions': {
+        'task': 'scriby_backend.tasks.expire_upload_sessions',
+        'schedule': crontab(minute=45),
+    },
+    'apply-storage-lifecycle': {
+        'task': 'scriby_backend.tasks.apply_storage_lifecycle',
+        'schedule': crontab(minute=0, hour=3),
+    },
+    'flush-audit-events': {
+        'task': 'scriby_backend.tasks.flush_audit_events',
+        'schedule': 60.0,
+    },
+    'maintain-audit-partitions': {
+        'task': 'scriby_backend.tasks.maintain_audit_partitions',
+        'schedule': crontab(minute=30, hour=0),
+    },
+    'rollup-usage-events': {
+        'task': 'scriby_backend.tasks.rollup_usage_events',
+        'schedule': 60.0,
+    },
+    'reconcile-quotas': {
+        'task': 'scriby_backend.tasks.reconcile_quotas',
+        'schedule': crontab(minute='*/15'),
+    },
+    'rollover-monthly-usage': {
+        'task': 'scriby_backend.tasks.rollover_monthly_usage',
+        'schedule': crontab(minute=5, hour=0, day_of_month=1),
+    },
+}
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -156,6 +194,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 GOOGLE_API_KEY = config('GOOGLE_API_KEY', default='')
 
+# Semantic search (local CPU embeddings, per-user float16 vector index)
+SEMANTIC_EMBEDDING_MODEL = config('SEMANTIC_EMBEDDING_MODEL', default='sentence-transformers/all-MiniLM-L6-v2')
+SEMANTIC_INDEX_ROOT = config('SEMANTIC_INDEX_ROOT', default=str(BASE_DIR / 'vector_index'))
+
+# Bulk exports (ZIP archives kept for download, then removed)
+BULK_EXPORT_RETENTION_DAYS = config('BULK_EXPORT_RETENTION_DAYS', default=7, cast=int)
+
+# Resumable uploads (partial files must share a filesystem with MEDIA_ROOT)
+UPLOAD_PARTIAL_DIR = config('UPLOAD_PARTIAL_DIR', default=str(MEDIA_ROOT / 'uploads' / 'partial'))
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)
+
+# Recording audio storage: 'local' (MEDIA_ROOT) or 's3' (any S3-compatible store, e.g. MinIO)
+AUDIO_STORAGE_BACKEND = config('AUDIO_STORAGE_BACKEND', default='local')
+AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default='scriby-audio')
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default='us-east-1')
+AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default=None)
+AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default=None)
+AWS_PRESIGNED_URL_EXPIRY = config('AWS_PRESIGNED_URL_EXPIRY', default=3600, cast=int)
+
+# Storage lifecycle: archived recordings are transcoded to Opus and moved to the cold tier
+COLD_STORAGE_ROOT = config('COLD_STORAGE_ROOT', default=str(BASE_DIR / 'cold_storage'))
+COLD_STORAGE_PREFIX = config('COLD_STORAGE_PREFIX', default='cold')
+COLD_STORAGE_CLASS = config('COLD_STORAGE_CLASS', default='GLACIER_IR')
+OPUS_ARCHIVE_BITRATE = config('OPUS_ARCHIVE_BITRATE', default='32k')
+REHYDRATED_RETENTION_DAYS = config('REHYDRATED_RETENTION_DAYS', default=7, cast=int)
+
+# Playback streaming: hand local files to the front-end server instead of copying them
+# through Python ('x-accel-redirect' for nginx, 'x-sendfile' for Apache/lighttpd). For nginx,
+# STREAMING_ACCEL_PREFIX must be an `internal` location aliasing MEDIA_ROOT.
+STREAMING_OFFLOAD = config('STREAMING_OFFLOAD', default=None)
+STREAMING_ACCEL_PREFIX = config('STREAMING_ACCEL_PREFIX', default='/protected-media/')
+
+# Worker scratch space: per-task workspaces on tmpfs when it has room, else on disk
+SCRATCH_TMPFS_ROOT = config('SCRATCH_TMPFS_ROOT', default='/dev/shm/scriby-scratch')
+SCRATCH_DISK_ROOT = config('SCRATCH_DISK_ROOT', default=str(BASE_DIR / 'scratch'))
+SCRATCH_BUDGET_BYTES = config('SCRATCH_BUDGET_BYTES', default=4 * 1024 ** 3, cast=int)
+SCRATCH_ORPHAN_AGE_SECONDS = config('SCRATCH_ORPHAN_AGE_SECONDS', default=6 * 3600, cast=int)
+
+# Speaker diarization (CPU, runs beside transcription)
+DIARIZATION_MAX_SPEAKERS = config('DIARIZATION_MAX_SPEAKERS', default=8, cast=int)
+DIARIZATION_SIMILARITY_THRESHOLD = config('DIARIZATION_SIMILARITY_THRESHOLD', default=0.35, cast=float)
+
 # Keycloak Configuration
 KEYCLOAK_URL = config('KEYCLOAK_URL', default='http://localhost:8080')
 KEYCLOAK_REALM = config('KEYCLOAK_REALM', default='scriby')
@@ -3,6 +3,7 @@ Django production settings for Eskriba backend - DigitalOcean PostgreSQL
 """
 import os
 from pathlib import Path
+from celery.schedules import crontab
 
 # Build paths
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -83,10 +84,35 @@ DATABASES = {
     }
 }
 
+# Cache - Redis, shared by all app servers (auth tokens, etc.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/1'),
+        'OPTIONS': {
+            # quota, throttling and audit share this connection pool through
+            # django_redis.get_redis_connection('default')
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+# Password hashing - Argon2 for new hashes; older PBKDF2 hashes are
+# upgraded when their owner next logs in
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Login hardening (see authentication/services.py)
+AUTH_NUM_PROXIES = int(os.environ.get('AUTH_NUM_PROXIES', '1'))
+AUTH_HASHING_CONCURRENCY = int(os.environ.get('AUTH_HASHING_CONCURRENCY', '2'))
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'authentication.backends.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -145,6 +171,42 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Periodic maintenance run by the `beat` process
+CELERY_BEAT_SCHEDULE = {
+    'expire-bulk-exports': {
+        'task': 'scriby_backend.tasks.expire_bulk_exports',
+        'schedule': crontab(minute=15),
+    },
+    'expire-upload-sessions': {
+        'task': 'scriby_backend.tasks.expire_upload_sessions',
+        'schedule': crontab(minute=45),
+    },
+    'apply-storage-lifecycle': {
+        'task': 'scriby_backend.tasks.apply_storage_lifecycle',
+        'schedule': crontab(minute=0, hour=3),
+    },
+    'flush-audit-events': {
+        'task': 'scriby_backend.tasks.flush_audit_events',
+        'schedule': 60.0,
+    },
+    'maintain-audit-partitions': {
+        'task': 'scriby_backend.tasks.maintain_audit_partitions',
+        'schedule': crontab(minute=30, hour=0),
+    },
+    'rollup-usage-events': {
+        'task': 'scriby_backend.tasks.rollup_usage_events',
+        'schedule': 60.0,
+    },
+    'reconcile-quotas': {
+        'task': 'scriby_backend.tasks.reconcile_quotas',
+        'schedule': crontab(minute='*/15'),
+    },
+    'rollover-monthly-usage': {
+        'task': 'scriby_backend.tasks.rollover_monthly_usage',
+        'schedule': crontab(minute=5, hour=0, day_of_month=1),
+    },
+}
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
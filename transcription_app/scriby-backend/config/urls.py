@@ -7,184 +7,59 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from django.http import JsonResponse
-from django.contrib.auth import authenticate
-from django.contrib.auth.models import User
-from rest_framework.authtoken.models import Token
-from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-import json
+from authentication.services import AuthServiceError, login_user, parse_credentials, register_user
+import logging
+
+logger = logging.getLogger(__name__)
 
 def api_health(request):
     """Simple health check endpoint"""
     return JsonResponse({'status': 'ok', 'message': 'Eskriba API is running'})
 
-def api_auth_register_simple(request):
-    """Simple register endpoint using same pattern as health"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            username = data.get('username')
-            email = data.get('email') 
-            password = data.get('password')
-            
-            if not all([username, email, password]):
-                return JsonResponse({'error': 'Missing required fields'}, status=400)
-            
-            if User.objects.filter(username=username).exists():
-                return JsonResponse({'error': 'Username already exists'}, status=400)
-            
-            user = User.objects.create_user(username=username, email=email, password=password)
-            token, created = Token.objects.get_or_create(user=user)
-            
-            return JsonResponse({
-                'status': 'success',
-                'message': 'User registered successfully',
-                'token': token.key,
-                'user_id': user.id
-            }, status=201)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
-    else:
-        return JsonResponse({'error': 'Method not allowed'}, status=405)
-
-def api_auth_login_simple(request):
-    """Simple login endpoint using same pattern as health"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            username = data.get('username')
-            password = data.get('password')
-            
-            if not all([username, password]):
-                return JsonResponse({'error': 'Missing username or password'}, status=400)
-            
-            user = authenticate(username=username, password=password)
-            if user:
-                token, created = Token.objects.get_or_create(user=user)
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Login successful',
-                    'token': token.key,
-                    'user_id': user.id
-                })
-            else:
-                return JsonResponse({'error': 'Invalid credentials'}, status=401)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
-    else:
-        return JsonResponse({'error': 'Method not allowed'}, status=405)
-
-@csrf_exempt
-def api_auth_register(request):
-    """Register endpoint integrated with health pattern"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            username = data.get('username')
-            email = data.get('email') 
-            password = data.get('password')
-            
-            if not all([username, email, password]):
-                return JsonResponse({'error': 'Missing required fields'}, status=400)
-            
-            if User.objects.filter(username=username).exists():
-                return JsonResponse({'error': 'Username already exists'}, status=400)
-            
-            user = User.objects.create_user(username=username, email=email, password=password)
-            token, created = Token.objects.get_or_create(user=user)
-            
-            return JsonResponse({
-                'status': 'success',
-                'message': 'User registered successfully',
-                'token': token.key,
-                'user_id': user.id
-            }, status=201)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
-    else:
-        return JsonResponse({'error': 'Method not allowed'}, status=405)
-
-@csrf_exempt
-def api_auth_login(request):
-    """Login endpoint integrated with health pattern"""
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            username = data.get('username')
-            password = data.get('password')
-            
-            if not all([username, password]):
-                return JsonResponse({'error': 'Missing username or password'}, status=400)
-            
-            user = authenticate(username=username, password=password)
-            if user:
-                token, created = Token.objects.get_or_create(user=user)
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Login successful',
-                    'token': token.key,
-                    'user_id': user.id
-                })
-            else:
-                return JsonResponse({'error': 'Invalid credentials'}, status=401)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
-    else:
-        return JsonResponse({'error': 'Method not allowed'}, status=405)
+def _auth_error(error):
+    response = JsonResponse({'error': error.message}, status=error.status)
+    if error.retry_after:
+        response['Retry-After'] = str(error.retry_after)
+    return response
 
-@csrf_exempt
 @require_http_methods(["POST"])
-def api_register(request):
-    """Simple register endpoint"""
+def api_auth_register(request):
+    """Register a user and return its API token"""
     try:
-        data = json.loads(request.body)
-        username = data.get('username')
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not all([username, email, password]):
-            return JsonResponse({'error': 'Missing required fields'}, status=400)
-        
-        if User.objects.filter(username=username).exists():
-            return JsonResponse({'error': 'Username already exists'}, status=400)
-        
-        user = User.objects.create_user(username=username, email=email, password=password)
-        token, created = Token.objects.get_or_create(user=user)
-        
-        return JsonResponse({
-            'status': 'success',
-            'message': 'User registered successfully',
-            'token': token.key,
-            'user_id': user.id
-        }, status=201)
+        username, email, password = parse_credentials(request, 'username', 'email', 'password')
+        user, token = register_user(username, email, password)
+    except AuthServiceError as e:
+        return _auth_error(e)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error(f"Registration failed: {str(e)}")
+        return JsonResponse({'error': 'Registration failed'}, status=500)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'User registered successfully',
+        'token': token.key,
+        'user_id': user.id
+    }, status=201)
 
-@csrf_exempt
 @require_http_methods(["POST"])
-def api_login(request):
-    """Simple login endpoint"""
+def api_auth_login(request):
+    """Log a user in and return its API token"""
     try:
-        data = json.loads(request.body)
-        username = data.get('username')
-        password = data.get('password')
-        
-        if not all([username, password]):
-            return JsonResponse({'error': 'Missing username or password'}, status=400)
-        
-        user = authenticate(username=username, password=password)
-        if user:
-            token, created = Token.objects.get_or_create(user=user)
-            return JsonResponse({
-                'status': 'success',
-                'message': 'Login successful',
-                'token': token.key,
-                'user_id': user.id
-            })
-        else:
-            return JsonResponse({'error': 'Invalid credentials'}, status=401)
+        username, password = parse_credentials(request, 'username', 'password')
+        user, token = login_user(request, username, password)
+    except AuthServiceError as e:
+        return _auth_error(e)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        logger.error(f"Login failed: {str(e)}")
+        return JsonResponse({'error': 'Login failed'}, status=500)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Login successful',
+        'token': token.key,
+        'user_id': user.id
+    })
 
 # API Router
 router = DefaultRouter()
@@ -192,8 +67,8 @@ router = DefaultRouter()
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health/', api_health, name='api-health'),
-    path('auth/register/', api_auth_register_simple, name='auth-register'),
-    path('auth/login/', api_auth_login_simple, name='auth-login'),
+    path('auth/register/', api_auth_register, name='auth-register'),
+    path('auth/login/', api_auth_login, name='auth-login'),
     path('api/', include(router.urls)),
     path('api/', include('recordings.urls')),
     path('api/', include('transcriptions.urls')),
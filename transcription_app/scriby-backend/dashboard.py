@@ -0,0 +1,221 @@
+"""
+Scriby - Analytics dashboard
+Per-user analytics totals and daily activity kept up to date incrementally from model events
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Constants
+RECENT_ACTIVITY_DAYS = 7
+# Cached views derived from the rollups (see caching.py)
+STATS_CACHE_NAMESPACES = ('analytics', 'usage_stats')
+
+
+def invalidate_analytics(user_id):
+    """Move the user's cached dashboard and usage stats to a new version on commit."""
+    from .caching import bump_cache_version
+
+    for namespace in STATS_CACHE_NAMESPACES:
+        bump_cache_version(namespace, user_id)
+
+
+# =============================================================================
+# INCREMENTAL UPDATES
+# =============================================================================
+
+def _bump(model, lookup: Dict, deltas: Dict) -> bool:
+    """
+    Add `deltas` to the row matching `lookup` with F() expressions.
+    Returns False when there is no such row yet.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return True
+    return bool(model.objects.filter(**lookup).update(**updates))
+
+
+def _bump_daily(user_id, day, deltas: Dict):
+    from .models import DailyActivity
+
+    if _bump(DailyActivity, {'user_id': user_id, 'day': day}, deltas):
+        return
+    try:
+        with transaction.atomic():
+            DailyActivity.objects.create(user_id=user_id, day=day, **deltas)
+    except IntegrityError:
+        # Created concurrently; add to the winner's row
+        _bump(DailyActivity, {'user_id': user_id, 'day': day}, deltas)
+
+
+def apply_analytics_event(user_id, day, totals: Dict, daily: Optional[Dict] = None,
+                          rebuild_missing: bool = True):
+    """
+    Fold one event into the user's rollups. A user without a totals row yet
+    is rebuilt from source instead; the rebuild already sees this event,
+    since it runs in the transaction that caused it. Deletions skip the
+    rebuild, as they may be part of deleting the user itself.
+    """
+    from .models import UserAnalytics
+
+    if not _bump(UserAnalytics, {'user_id': user_id}, totals):
+        if not rebuild_missing:
+            return
+        try:
+            rebuild_user_analytics(user_id)
+        except IntegrityError:
+            logger.warning(f"Concurrent analytics rebuild for user {user_id}")
+    elif daily:
+        _bump_daily(user_id, day, daily)
+    invalidate_analytics(user_id)
+
+
+def record_recording_created(recording):
+    apply_analytics_event(
+        recording.user_id, timezone.localdate(recording.created_at),
+        {'total_recordings': 1, 'total_duration_seconds': recording.duration_seconds or 0},
+        {'recordings': 1},
+    )
+
+
+def record_recording_duration_changed(recording, previous_seconds):
+    delta = (recording.duration_seconds or 0) - (previous_seconds or 0)
+    if delta:
+        apply_analytics_event(recording.user_id, None, {'total_duration_seconds': delta})
+
+
+def record_recording_deleted(recording):
+    apply_analytics_event(
+        recording.user_id, timezone.localdate(recording.created_at),
+        {'total_recordings': -1, 'total_duration_seconds': -(recording.duration_seconds or 0)},
+        {'recordings': -1}, rebuild_missing=False,
+    )
+
+
+def _transcription_deltas(transcription, sign: int):
+    scored = transcription.confidence_score is not None
+    return {
+        'total_transcriptions': sign,
+        'confidence_sum': sign * (transcription.confidence_score or 0.0),
+        'confidence_count': sign if scored else 0,
+    }
+
+
+def record_transcription_created(transcription, user_id):
+    apply_analytics_event(
+        user_id, timezone.localdate(transcription.created_at),
+        _transcription_deltas(transcription, 1), {'transcriptions': 1},
+    )
+
+
+def record_transcription_confidence_changed(transcription, user_id, previous_score):
+    # Transcriptions are created before Whisper runs and scored when it finishes
+    current = transcription.confidence_score
+    deltas = {
+        'confidence_sum': (current or 0.0) - (previous_score or 0.0),
+        'confidence_count': (current is not None) - (previous_score is not None),
+    }
+    if any(deltas.values()):
+        apply_analytics_event(user_id, None, deltas)
+
+
+def record_transcription_deleted(transcription, user_id):
+    apply_analytics_event(
+        user_id, timezone.localdate(transcription.created_at),
+        _transcription_deltas(transcription, -1), {'transcriptions': -1}, rebuild_missing=False,
+    )
+
+
+# =============================================================================
+# REBUILD
+# =============================================================================
+
+def rebuild_user_analytics(user_id):
+    """Recompute a user's totals and daily series from recordings and transcriptions."""
+    from .models import DailyActivity, Recording, Transcription, UserAnalytics
+
+    recordings = Recording.objects.filter(user_id=user_id)
+    transcriptions = Transcription.objects.filter(recording__user_id=user_id)
+    recording_totals = recordings.aggregate(
+        count=Count('id'),
+        duration=Coalesce(Sum('duration_seconds'), Value(0)),
+    )
+    transcription_totals = transcriptions.aggregate(
+        count=Count('id'),
+        confidence_sum=Coalesce(Sum('confidence_score'), Value(0.0)),
+        confidence_count=Count('id', filter=Q(confidence_score__isnull=False)),
+    )
+
+    daily = {}
+    for day, count in recordings.values_list('created_at__date').annotate(count=Count('id')).order_by():
+        daily.setdefault(day, {'recordings': 0, 'transcriptions': 0})['recordings'] = count
+    for day, count in transcriptions.values_list('created_at__date').annotate(count=Count('id')).order_by():
+        daily.setdefault(day, {'recordings': 0, 'transcriptions': 0})['transcriptions'] = count
+
+    with transaction.atomic():
+        UserAnalytics.objects.update_or_create(user_id=user_id, defaults={
+            'total_recordings': recording_totals['count'],
+            'total_duration_seconds': recording_totals['duration'],
+            'total_transcriptions': transcription_totals['count'],
+            'confidence_sum': transcription_totals['confidence_sum'],
+            'confidence_count': transcription_totals['confidence_count'],
+        })
+        DailyActivity.objects.filter(user_id=user_id).delete()
+        DailyActivity.objects.bulk_create(
+            [DailyActivity(user_id=user_id, day=day, **counts) for day, counts in daily.items()],
+            batch_size=1000,
+        )
+    invalidate_analytics(user_id)
+
+
+# =============================================================================
+# READ PATH
+# =============================================================================
+
+def build_dashboard(user) -> Dict:
+    """
+    Dashboard payload read from the rollups: one totals row plus at most a
+    month and a week of daily rows, independent of how much the user has.
+    """
+    from .models import DailyActivity, UserAnalytics
+
+    totals = UserAnalytics.objects.filter(user_id=user.pk).first()
+    if totals is None:
+        rebuild_user_analytics(user.pk)
+        totals = UserAnalytics.objects.get(user_id=user.pk)
+
+    today = timezone.localdate()
+    month_start = today.replace(day=1)
+    week_start = today - timedelta(days=RECENT_ACTIVITY_DAYS)
+    days = DailyActivity.objects.filter(
+        user_id=user.pk, day__gte=min(month_start, week_start)
+    ).values_list('day', 'recordings').order_by('day')
+
+    recordings_this_month = 0
+    recent_activity = []
+    for day, recordings in days:
+        if day >= month_start:
+            recordings_this_month += recordings
+        if day >= week_start and recordings > 0:
+            recent_activity.append({'created_at__date': day, 'count': recordings})
+
+    return {
+        'overview': {
+            'total_recordings': totals.total_recordings,
+            'total_transcriptions': totals.total_transcriptions,
+            'total_duration_hours': totals.total_duration_seconds / 3600,
+            'avg_confidence_score': totals.average_confidence,
+        },
+        'monthly_stats': {
+            'recordings_this_month': recordings_this_month,
+        },
+        'recent_activity': recent_activity,
+    }
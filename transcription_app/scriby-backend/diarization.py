@@ -0,0 +1,314 @@
+"""
+Scriby - Speaker diarization
+CPU speaker diarization: windowed MFCC speaker embeddings (numpy only) clustered online in bounded memory,
+producing speaker turns that are merged onto transcript segments afterwards
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Constants
+WINDOW_SECONDS = 1.5  # audio per speaker embedding
+WINDOWS_PER_BLOCK = 20  # 30 s decoded at a time
+N_MFCC = 20
+SILENCE_DBFS = -45.0  # windows quieter than this are not embedded
+WARMUP_WINDOWS = 40  # speech windows used to fix feature normalization before clustering
+SIMILARITY_THRESHOLD = getattr(settings, 'DIARIZATION_SIMILARITY_THRESHOLD', 0.35)  # cosine, to join a speaker
+MAX_SPEAKERS = getattr(settings, 'DIARIZATION_MAX_SPEAKERS', 8)
+MIN_SPEAKER_SECONDS = 6.0  # clusters with less speech are folded into neighbouring speakers
+MIN_SUSTAINED_TURN_SECONDS = 3.0  # ...as are clusters that never hold the floor this long
+MIN_TURN_SECONDS = 1.5  # shorter turns between two turns of one speaker are absorbed
+
+Turn = Tuple[float, float, str]  # start, end, speaker (seconds)
+
+
+_filterbanks: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+def _mel_filterbank(sample_rate: int, n_fft: int, bands: int = 40) -> np.ndarray:
+    key = (sample_rate, n_fft)
+    if key not in _filterbanks:
+        mel = np.linspace(0, 2595 * np.log10(1 + sample_rate / 2 / 700), bands + 2)
+        bins = np.floor((n_fft + 1) * 700 * (10 ** (mel / 2595) - 1) / sample_rate).astype(int)
+        bank = np.zeros((bands, n_fft // 2 + 1), dtype=np.float32)
+        for band in range(bands):
+            left, center, right = bins[band], bins[band + 1], bins[band + 2]
+            bank[band, left:center] = (np.arange(left, center) - left) / max(center - left, 1)
+            bank[band, center:right] = (right - np.arange(center, right)) / max(right - center, 1)
+        _filterbanks[key] = bank
+    return _filterbanks[key]
+
+
+def _dct_matrix(bands: int) -> np.ndarray:
+    n = np.arange(bands)
+    return np.cos(np.pi / bands * (n[None, :] + 0.5) * np.arange(N_MFCC)[:, None]).astype(np.float32)
+
+
+def mfcc(block: np.ndarray, sample_rate: int) -> np.ndarray:
+    """MFCCs of the voiced 25 ms frames (every 10 ms) of a block, (N_MFCC, frames)."""
+    n_fft, hop = int(0.025 * sample_rate), sample_rate // 100
+    frames = 1 + (len(block) - n_fft) // hop
+    if frames <= 0:
+        return np.zeros((N_MFCC, 0), dtype=np.float32)
+    strides = (block.strides[0] * hop, block.strides[0])
+    framed = np.lib.stride_tricks.as_strided(block, shape=(frames, n_fft), strides=strides)
+    # Silent frames would dominate the log spectrum; pool over speech only
+    level = 10 * np.log10(np.maximum(np.mean(framed ** 2, axis=1), 1e-10))
+    framed = framed[level > SILENCE_DBFS]
+    power = np.abs(np.fft.rfft(framed * np.hamming(n_fft).astype(np.float32), axis=1)) ** 2
+    bank = _mel_filterbank(sample_rate, n_fft)
+    log_mel = np.log(power @ bank.T + 1e-10)
+    return _dct_matrix(bank.shape[0]) @ log_mel.T
+
+
+def window_embeddings(block: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Speaker features for each whole window in a mono block: mean and
+    standard deviation of MFCCs 1..N (c0, the loudness term, is dropped).
+    Returns (features, speech mask), one row per window.
+    """
+    window = int(WINDOW_SECONDS * sample_rate)
+    count = len(block) // window
+    if not count:
+        return np.zeros((0, 2 * (N_MFCC - 1)), dtype=np.float32), np.zeros(0, dtype=bool)
+    windows = np.ascontiguousarray(block[:count * window], dtype=np.float32).reshape(count, window)
+
+    rms = np.sqrt(np.mean(windows ** 2, axis=1))
+    speech = 20 * np.log10(np.maximum(rms, 1e-10)) > SILENCE_DBFS
+
+    features = np.empty((count, 2 * (N_MFCC - 1)), dtype=np.float32)
+    for index, samples in enumerate(windows):
+        coefficients = mfcc(samples, sample_rate)[1:]
+        if coefficients.shape[1] < 2:
+            speech[index] = False
+            continue
+        features[index] = np.concatenate([coefficients.mean(axis=1), coefficients.std(axis=1)])
+    return features, speech
+
+
+class OnlineSpeakerClusterer:
+    """
+    Incremental clustering of window embeddings. Only one running centroid
+    per speaker (at most MAX_SPEAKERS) and the list of speaker turns are
+    kept, so memory does not grow with the number of windows. Once every
+    slot is taken, windows go to the nearest existing speaker.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_speakers: int = MAX_SPEAKERS):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self.sums: List[np.ndarray] = []
+        self.counts: List[int] = []
+        self.alias: Dict[int, int] = {}  # merged cluster -> surviving cluster
+        self.turns: List[List] = []  # [start, end, cluster]
+        self._warmup: List[Tuple[float, np.ndarray]] = []
+        self._mean = self._scale = None
+
+    # Feature normalization is fixed from the first speech windows so every
+    # embedding is comparable with every centroid for the whole recording
+    def add(self, start: float, features: np.ndarray):
+        if self._mean is None:
+            self._warmup.append((start, features))
+            if len(self._warmup) >= WARMUP_WINDOWS:
+                self._fix_normalization()
+            return
+        self._assign(start, self._embed(features))
+
+    def _fix_normalization(self):
+        stacked = np.stack([features for _, features in self._warmup])
+        self._mean = stacked.mean(axis=0)
+        self._scale = stacked.std(axis=0) + 1e-6
+        warmup, self._warmup = self._warmup, []
+        for start, features in warmup:
+            self._assign(start, self._embed(features))
+
+    def _embed(self, features: np.ndarray) -> np.ndarray:
+        vector = (features - self._mean) / self._scale
+        return vector / (np.linalg.norm(vector) + 1e-9)
+
+    def _centroids(self) -> np.ndarray:
+        centroids = np.stack(self.sums) / np.array(self.counts)[:, None]
+        return centroids / (np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-9)
+
+    def _live(self) -> List[int]:
+        return [cluster for cluster in range(len(self.sums)) if cluster not in self.alias]
+
+    def _assign(self, start: float, vector: np.ndarray):
+        live = self._live()
+        cluster = None
+        if live:
+            similarities = self._centroids()[live] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold or len(live) >= self.max_speakers:
+                cluster = live[best]
+        if cluster is None:
+            cluster = len(self.sums)
+            self.sums.append(np.zeros_like(vector))
+            self.counts.append(0)
+        self.sums[cluster] += vector
+        self.counts[cluster] += 1
+
+        end = start + WINDOW_SECONDS
+        if self.turns and self.turns[-1][2] == cluster and start - self.turns[-1][1] < 1e-6:
+            self.turns[-1][1] = end
+        else:
+            self.turns.append([start, end, cluster])
+
+    def _merge(self, source: int, target: int):
+        self.sums[target] += self.sums[source]
+        self.counts[target] += self.counts[source]
+        self.sums[source] = np.zeros_like(self.sums[source])
+        self.alias[source] = target
+
+    def _resolve(self, cluster: int) -> int:
+        while cluster in self.alias:
+            cluster = self.alias[cluster]
+        return cluster
+
+    def finish(self) -> List[Turn]:
+        """Final speaker turns, labelled "Speaker 1", "Speaker 2", ... by first appearance."""
+        if self._mean is None and self._warmup:
+            self._fix_normalization()
+        if not self.sums:
+            return []
+
+        # Speakers whose centroids drifted together
+        while True:
+            live = self._live()
+            if len(live) < 2:
+                break
+            centroids = self._centroids()[live]
+            similarity = centroids @ centroids.T
+            np.fill_diagonal(similarity, -np.inf)
+            a, b = np.unravel_index(int(np.argmax(similarity)), similarity.shape)
+            if similarity[a, b] < self.threshold:
+                break
+            self._merge(live[b], live[a])
+
+        turns = _coalesce([[start, end, self._resolve(cluster)] for start, end, cluster in self.turns])
+        longest: Dict[int, float] = {}
+        for start, end, cluster in turns:
+            longest[cluster] = max(longest.get(cluster, 0.0), end - start)
+        live = self._live()
+        major = {
+            cluster for cluster in live
+            if self.counts[cluster] * WINDOW_SECONDS >= MIN_SPEAKER_SECONDS
+            and longest.get(cluster, 0.0) >= MIN_SUSTAINED_TURN_SECONDS
+        } or {max(live, key=lambda cluster: self.counts[cluster])}
+
+        # Minor clusters are mostly windows straddling a change of speaker
+        # (or coughs, laughter): hand them to the speaker talking around them
+        labels = [cluster if cluster in major else None for _, _, cluster in turns]
+        for index in range(1, len(labels)):
+            labels[index] = labels[index] if labels[index] is not None else labels[index - 1]
+        for index in range(len(labels) - 2, -1, -1):
+            labels[index] = labels[index] if labels[index] is not None else labels[index + 1]
+        for turn, label in zip(turns, labels):
+            turn[2] = label
+        turns = _smooth(_coalesce(turns))
+        names: Dict[int, str] = {}
+        for turn in turns:
+            names.setdefault(turn[2], f'Speaker {len(names) + 1}')
+        return [(round(float(start), 3), round(float(end), 3), names[cluster]) for start, end, cluster in turns]
+
+
+def _coalesce(turns: List[List]) -> List[List]:
+    merged = []
+    for turn in turns:
+        if merged and merged[-1][2] == turn[2] and turn[0] - merged[-1][1] <= WINDOW_SECONDS:
+            merged[-1][1] = turn[1]
+        else:
+            merged.append(list(turn))
+    return merged
+
+
+def _smooth(turns: List[List]) -> List[List]:
+    """Absorb blips: a short turn between two turns of the same speaker."""
+    for index in range(1, len(turns) - 1):
+        turn = turns[index]
+        if turn[1] - turn[0] < MIN_TURN_SECONDS and turns[index - 1][2] == turns[index + 1][2]:
+            turn[2] = turns[index - 1][2]
+    return _coalesce(turns)
+
+
+def diarize_blocks(blocks: Iterable[np.ndarray], sample_rate: int,
+                   max_speakers: Optional[int] = None) -> List[Turn]:
+    """Speaker turns for consecutive PCM blocks, each a whole number of windows long."""
+    clusterer = OnlineSpeakerClusterer(max_speakers=max_speakers or MAX_SPEAKERS)
+    offset = 0.0
+    for block in blocks:
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        features, speech = window_embeddings(block, sample_rate)
+        for index in np.flatnonzero(speech):
+            clusterer.add(offset + index * WINDOW_SECONDS, features[index])
+        offset += len(block) / sample_rate
+    return clusterer.finish()
+
+
+def diarize_file(path: str, max_speakers: Optional[int] = None) -> List[Turn]:
+    """
+    Speaker turns for an audio file, decoded block by block so memory stays
+    flat however long the recording is. Safe to run in a thread beside
+    transcription of the same file.
+    """
+    import soundfile as sf
+
+    with sf.SoundFile(path) as audio:
+        block_frames = int(WINDOW_SECONDS * audio.samplerate) * WINDOWS_PER_BLOCK
+        blocks = audio.blocks(blocksize=block_frames, dtype='float32')
+        return diarize_blocks(blocks, audio.samplerate, max_speakers)
+
+
+# =============================================================================
+# MERGING WITH THE TRANSCRIPT
+# =============================================================================
+
+def assign_speakers(segments: List[Dict], turns: List[Turn]) -> int:
+    """
+    Label each transcript segment (in place) with the speaker who overlaps
+    it most. Both lists are time-ordered, so this is one linear sweep.
+    Returns the number of speakers detected.
+    """
+    if not turns:
+        return 1
+    first = 0
+    for segment in segments:
+        start, end = float(segment.get('start') or 0.0), float(segment.get('end') or 0.0)
+        while first < len(turns) and turns[first][1] <= start:
+            first += 1
+        overlap: Dict[str, float] = {}
+        index = first
+        while index < len(turns) and turns[index][0] < end:
+            turn_start, turn_end, speaker = turns[index]
+            overlap[speaker] = overlap.get(speaker, 0.0) + min(end, turn_end) - max(start, turn_start)
+            index += 1
+        if overlap:
+            segment['speaker'] = max(overlap, key=overlap.get)
+    return len({speaker for _, _, speaker in turns})
+
+
+def speaker_labels(segments: List[Dict]) -> List[Dict]:
+    """
+    Transcription.speaker_labels: each speaker's segment indices and speaking
+    time. Indices are TranscriptSegment.index values, so segments without
+    text are not counted.
+    """
+    from .models import TranscriptSegment
+
+    labels: Dict[str, Dict] = {}
+    for index, segment, _ in TranscriptSegment.indexed_payload(segments):
+        speaker = segment.get('speaker')
+        if not speaker:
+            continue
+        entry = labels.setdefault(speaker, {'speaker': speaker, 'segments': [], 'speaking_time': 0.0})
+        entry['segments'].append(index)
+        entry['speaking_time'] = round(
+            entry['speaking_time'] + float(segment.get('end') or 0.0) - float(segment.get('start') or 0.0), 3
+        )
+    return list(labels.values())
@@ -0,0 +1,378 @@
+"""
+Scriby - Transcript export engine
+Streams SRT, VTT, TXT, JSON, DOCX and PDF renderings built from segments,
+with rendered artifacts cached per transcription version and ETag support
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+from django.core.cache import cache
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.text import slugify
+from rest_framework.negotiation import DefaultContentNegotiation
+
+logger = logging.getLogger(__name__)
+
+# Constants
+EXPORT_RENDERER_VERSION = 2  # bump to invalidate every cached artifact
+EXPORT_CACHE_TTL = 7 * 24 * 3600
+EXPORT_CACHE_MAX_BYTES = 5 * 1024 * 1024  # larger artifacts are re-rendered
+STREAM_CHUNK_SIZE = 64 * 1024
+SEGMENT_BATCH_SIZE = 500
+BULK_EXPORT_BATCH_SIZE = 200  # recordings fetched per server-side cursor round trip
+
+EXPORT_FORMATS = {
+    'srt': ('application/x-subrip; charset=utf-8', 'srt'),
+    'vtt': ('text/vtt; charset=utf-8', 'vtt'),
+    'txt': ('text/plain; charset=utf-8', 'txt'),
+    'json': ('application/json', 'json'),
+    'docx': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'docx'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+OPTIONAL_DEPENDENCIES = {
+    'docx': ('docx', 'python-docx'),
+    'pdf': ('reportlab', 'reportlab'),
+}
+
+
+class ExportError(Exception):
+    """Raised when a transcript cannot be rendered in the requested format"""
+    pass
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """Ignore ?format=, which names the export format rather than a DRF renderer."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+# =============================================================================
+# SEGMENT SOURCE
+# =============================================================================
+
+def iter_segments(transcription) -> Iterator[dict]:
+    """Yield segments in order, falling back to one segment spanning the text."""
+    rows = transcription.segments.order_by('index').values(
+        'start', 'end', 'speaker', 'text'
+    ).iterator(chunk_size=SEGMENT_BATCH_SIZE)
+    found = False
+    for row in rows:
+        found = True
+        yield row
+    if not found and transcription.text:
+        duration = transcription.recording.duration_seconds or 0
+        yield {'start': 0.0, 'end': float(duration), 'speaker': '', 'text': transcription.text}
+
+
+def format_timestamp(seconds: float, separator: str = ',') -> str:
+    """Format seconds as HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT)."""
+    total_ms = int(round(max(seconds or 0.0, 0.0) * 1000))
+    hours, rest = divmod(total_ms, 3_600_000)
+    minutes, rest = divmod(rest, 60_000)
+    secs, ms = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{ms:03d}"
+
+
+# =============================================================================
+# TEXT RENDERERS
+# =============================================================================
+
+def render_srt(transcription, segments: Iterable[dict]) -> Iterator[str]:
+    for number, segment in enumerate(segments, start=1):
+        speaker = f"{segment['speaker']}: " if segment.get('speaker') else ''
+        yield (
+            f"{number}\n"
+            f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
+            f"{speaker}{segment['text']}\n\n"
+        )
+
+
+def escape_vtt(text: str) -> str:
+    """
+    Escape cue text per WebVTT: '&' and '<' would start entities and tags,
+    and escaping '>' also rules out '-->'. Blank lines would end the cue early.
+    """
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return '\n'.join(line for line in text.splitlines() if line.strip())
+
+
+def render_vtt(transcription, segments: Iterable[dict]) -> Iterator[str]:
+    yield "WEBVTT\n\n"
+    for segment in segments:
+        voice = f"<v {escape_vtt(segment['speaker'])}>" if segment.get('speaker') else ''
+        yield (
+            f"{format_timestamp(segment['start'], '.')} --> {format_timestamp(segment['end'], '.')}\n"
+            f"{voice}{escape_vtt(segment['text'])}\n\n"
+        )
+
+
+def render_txt(transcription, segments: Iterable[dict]) -> Iterator[str]:
+    previous_speaker = None
+    for segment in segments:
+        speaker = segment.get('speaker')
+        if speaker and speaker != previous_speaker:
+            yield f"\n{speaker}:\n"
+            previous_speaker = speaker
+        yield f"{segment['text']}\n"
+
+
+def render_json(transcription, segments: Iterable[dict]) -> Iterator[str]:
+    header = {
+        'id': str(transcription.id),
+        'recording_id': str(transcription.recording_id),
+        'title': transcription.recording.title,
+        'language': transcription.recording.language,
+        'version': transcription.version,
+        'confidence_score': transcription.confidence_score,
+    }
+    # Stream the segments array without materializing it
+    yield json.dumps(header)[:-1] + ', "segments": ['
+    for number, segment in enumerate(segments):
+        yield (', ' if number else '') + json.dumps(segment)
+    yield ']}'
+
+
+# =============================================================================
+# DOCUMENT RENDERERS (optional dependencies)
+# =============================================================================
+
+def _chunk_bytes(data: bytes) -> Iterator[bytes]:
+    for start in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[start:start + STREAM_CHUNK_SIZE]
+
+
+def render_docx(transcription, segments: Iterable[dict]) -> Iterator[bytes]:
+    try:
+        from docx import Document
+    except ImportError:
+        raise ExportError("DOCX export requires python-docx")
+
+    document = Document()
+    document.add_heading(transcription.recording.title, level=1)
+    for segment in segments:
+        paragraph = document.add_paragraph()
+        paragraph.add_run(f"[{format_timestamp(segment['start'])[:8]}] ").bold = True
+        if segment.get('speaker'):
+            paragraph.add_run(f"{segment['speaker']}: ").italic = True
+        paragraph.add_run(segment['text'])
+    buffer = io.BytesIO()
+    document.save(buffer)
+    # The zip container is only complete once saved, so it streams afterwards
+    yield from _chunk_bytes(buffer.getvalue())
+
+
+def render_pdf(transcription, segments: Iterable[dict]) -> Iterator[bytes]:
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, SimpleDocTemplate
+    except ImportError:
+        raise ExportError("PDF export requires reportlab")
+
+    from xml.sax.saxutils import escape
+
+    styles = getSampleStyleSheet()
+    story = [Paragraph(escape(transcription.recording.title), styles['Title'])]
+    for segment in segments:
+        speaker = f"<i>{escape(segment['speaker'])}:</i> " if segment.get('speaker') else ''
+        story.append(Paragraph(
+            f"<b>[{format_timestamp(segment['start'])[:8]}]</b> {speaker}{escape(segment['text'])}",
+            styles['BodyText']
+        ))
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(story)
+    yield from _chunk_bytes(buffer.getvalue())
+
+
+RENDERERS = {
+    'srt': render_srt,
+    'vtt': render_vtt,
+    'txt': render_txt,
+    'json': render_json,
+    'docx': render_docx,
+    'pdf': render_pdf,
+}
+
+
+def ensure_format_available(export_format: str):
+    """Fail before streaming starts if a document renderer's library is missing."""
+    if export_format not in RENDERERS:
+        raise ExportError(f"Unsupported export format: {export_format}")
+    module, package = OPTIONAL_DEPENDENCIES.get(export_format, (None, None))
+    if module and importlib.util.find_spec(module) is None:
+        raise ExportError(f"{export_format.upper()} export requires {package}")
+
+
+def render_export(transcription, export_format: str) -> Iterator[bytes]:
+    """Yield the rendered export as UTF-8 byte chunks."""
+    if export_format not in RENDERERS:
+        raise ExportError(f"Unsupported export format: {export_format}")
+    for chunk in RENDERERS[export_format](transcription, iter_segments(transcription)):
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+# =============================================================================
+# CACHING AND HTTP
+# =============================================================================
+
+def export_etag(transcription, export_format: str) -> str:
+    """Strong ETag identifying one rendering of one transcription version."""
+    basis = ':'.join([
+        str(transcription.id),
+        str(transcription.version),
+        transcription.updated_at.isoformat() if transcription.updated_at else '',
+        export_format,
+        str(EXPORT_RENDERER_VERSION),
+    ])
+    return hashlib.sha256(basis.encode('utf-8')).hexdigest()[:32]
+
+
+def _export_cache_key(etag: str) -> str:
+    return f"export_artifact_{etag}"
+
+
+def _render_and_cache(transcription, export_format: str, cache_key: str) -> Iterator[bytes]:
+    """Stream a fresh rendering, keeping a copy for the cache if it is small enough."""
+    buffered = []
+    size = 0
+    for chunk in render_export(transcription, export_format):
+        if buffered is not None:
+            size += len(chunk)
+            if size <= EXPORT_CACHE_MAX_BYTES:
+                buffered.append(chunk)
+            else:
+                buffered = None
+        yield chunk
+    if buffered is not None:
+        cache.set(cache_key, b''.join(buffered), EXPORT_CACHE_TTL)
+
+
+def if_none_match(request, etag: str) -> bool:
+    """True when the client already holds this ETag."""
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    candidates = {value.strip().removeprefix('W/').strip('"') for value in header.split(',')}
+    return etag in candidates or '*' in candidates
+
+
+def export_response(request, transcription, export_format: str):
+    """Build a streaming (or 304) response for a transcription export."""
+    ensure_format_available(export_format)
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    etag = export_etag(transcription, export_format)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, max-age=0, must-revalidate'}
+
+    if if_none_match(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        cache_key = _export_cache_key(etag)
+        cached: Optional[bytes] = cache.get(cache_key)
+        if cached is not None:
+            body = _chunk_bytes(cached)
+        else:
+            logger.debug(f"Rendering {export_format} export for transcription {transcription.id}")
+            body = _render_and_cache(transcription, export_format, cache_key)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        filename = slugify(transcription.recording.title) or 'transcription'
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+# =============================================================================
+# BULK ARCHIVES
+# =============================================================================
+
+def bulk_export_queryset(job):
+    """Recordings selected by a BulkExportJob, using the RecordingViewSet filterset."""
+    from .filters import RecordingFilter
+    from .models import Recording
+
+    queryset = Recording.objects.filter(
+        user=job.user, transcription__isnull=False
+    ).select_related('transcription').order_by('created_at', 'id')
+    if job.include_analyses:
+        queryset = queryset.prefetch_related('transcription__analyses')
+    filterset = RecordingFilter(job.filters, queryset=queryset)
+    if not filterset.is_valid():
+        raise ExportError(f"Invalid recording filters: {dict(filterset.errors)}")
+    return filterset.qs
+
+
+def _archive_folder(recording) -> str:
+    return f"{slugify(recording.title) or 'recording'}-{str(recording.id)[:8]}"
+
+
+def _write_entry(archive: zipfile.ZipFile, name: str, chunks: Iterable[bytes]) -> int:
+    size = 0
+    with archive.open(name, 'w', force_zip64=True) as entry:
+        for chunk in chunks:
+            entry.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def _render_analysis(analysis, as_json: bool) -> Iterator[bytes]:
+    if as_json:
+        yield json.dumps({
+            'id': str(analysis.id),
+            'analysis_type': analysis.analysis_type,
+            'content': analysis.content,
+            'structured_data': analysis.structured_data,
+            'confidence_score': analysis.confidence_score,
+            'created_at': analysis.created_at.isoformat() if analysis.created_at else None,
+        }, ensure_ascii=False).encode('utf-8')
+    else:
+        yield analysis.content.encode('utf-8')
+
+
+def write_bulk_archive(job, fileobj: BinaryIO) -> int:
+    """
+    Write the job's ZIP archive to `fileobj` and return the recording count.
+    Recordings are read through a server-side cursor in fixed-size chunks and
+    each entry is streamed into the archive, so memory stays flat however many
+    recordings the filter selects.
+    """
+    for export_format in job.formats:
+        ensure_format_available(export_format)
+
+    manifest: List[dict] = []
+    analyses_as_json = 'json' in job.formats
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        recordings = bulk_export_queryset(job).iterator(chunk_size=BULK_EXPORT_BATCH_SIZE)
+        for recording in recordings:
+            transcription = recording.transcription
+            folder = _archive_folder(recording)
+            files = []
+            for export_format in job.formats:
+                _, extension = EXPORT_FORMATS[export_format]
+                name = f"{folder}/transcript.{extension}"
+                _write_entry(archive, name, render_export(transcription, export_format))
+                files.append(name)
+            if job.include_analyses:
+                for analysis in transcription.analyses.all():
+                    extension = 'json' if analyses_as_json else 'txt'
+                    name = f"{folder}/analyses/{analysis.analysis_type}-{str(analysis.id)[:8]}.{extension}"
+                    _write_entry(archive, name, _render_analysis(analysis, analyses_as_json))
+                    files.append(name)
+            manifest.append({
+                'recording_id': str(recording.id),
+                'title': recording.title,
+                'transcription_version': transcription.version,
+                'files': files,
+            })
+        archive.writestr('manifest.json', json.dumps({
+            'export_id': str(job.id),
+            'formats': job.formats,
+            'recordings': manifest,
+        }, ensure_ascii=False, indent=2))
+    return len(manifest)
@@ -0,0 +1,21 @@
+"""
+Scriby - Shared filtersets
+Filter definitions reused by list endpoints and background jobs
+"""
+
+import django_filters
+
+from .models import Recording
+
+
+class RecordingFilter(django_filters.FilterSet):
+    """
+    Recording filters used by RecordingViewSet and bulk exports, so an export
+    job selects exactly what the same query string lists.
+    """
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Recording
+        fields = ['status', 'language', 'file_format']
@@ -0,0 +1,310 @@
+"""
+Scriby - Storage lifecycle
+Opus transcoding of archived originals, intermediate cleanup, hot/cold tiering with lazy rehydration
+and cached low-bitrate playback renditions
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+from datetime import timedelta
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .scratch import scratch_workspace
+from .storage import cold_storage, local_audio_copy
+
+logger = logging.getLogger(__name__)
+
+# Constants
+FFMPEG_BINARY = getattr(settings, 'FFMPEG_BINARY', 'ffmpeg')
+OPUS_ARCHIVE_BITRATE = getattr(settings, 'OPUS_ARCHIVE_BITRATE', '32k')  # transparent for speech
+TRANSCODE_TIMEOUT = 30 * 60  # seconds
+# Rehydrated archives stay hot this long before the lifecycle moves them back
+REHYDRATED_RETENTION_DAYS = getattr(settings, 'REHYDRATED_RETENTION_DAYS', 7)
+LIFECYCLE_BATCH_SIZE = 200
+# Playback renditions: quality name -> Opus bitrate
+RENDITIONS = {'low': '24k'}
+RENDITION_LOCK_TIMEOUT = 30 * 60  # seconds one worker may spend building a rendition
+
+# Content types for playback of stored formats
+CONTENT_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'm4a': 'audio/mp4',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg; codecs=opus',
+}
+
+
+class LifecycleError(Exception):
+    """Storage lifecycle step could not be applied"""
+
+
+def _recordings():
+    from .models import Recording
+
+    return Recording.objects
+
+
+# =============================================================================
+# INTERMEDIATES
+# =============================================================================
+
+def discard_processed_audio(recording) -> int:
+    """Delete the transcription WAV once it has served its purpose. Returns bytes freed."""
+    processed = recording.processed_audio_file
+    if not processed:
+        return 0
+    name, storage = processed.name, processed.storage
+    try:
+        size = storage.size(name)
+    except (OSError, ValueError):
+        size = 0
+
+    if not _recordings().filter(pk=recording.pk, processed_audio_file=name).update(
+        processed_audio_file='', reclaimed_bytes=F('reclaimed_bytes') + size
+    ):
+        return 0
+    recording.processed_audio_file.name = ''
+    transaction.on_commit(lambda: storage.delete(name))
+    return size
+
+
+# =============================================================================
+# TRANSCODING
+# =============================================================================
+
+def encode_opus(source: str, target: str, bitrate: str):
+    """Encode any ffmpeg-readable file to Ogg Opus tuned for speech."""
+    try:
+        subprocess.run(
+            [FFMPEG_BINARY, '-nostdin', '-v', 'error', '-y', '-i', source, '-vn',
+             '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip', '-f', 'ogg', target],
+            check=True, capture_output=True, timeout=TRANSCODE_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        detail = getattr(e, 'stderr', b'') or b''
+        raise LifecycleError(f"Opus transcode failed: {str(e)} {detail.decode(errors='replace')}") from e
+
+
+def transcode_to_opus(recording) -> int:
+    """
+    Replace an archived original with an Ogg Opus encode, if that is smaller.
+    ffmpeg streams the conversion, so memory use does not grow with length.
+    Returns bytes saved.
+    """
+    if recording.file_format == 'opus':
+        return 0
+    original = recording.audio_file
+    name, storage = original.name, original.storage
+
+    with scratch_workspace('opus') as workspace, local_audio_copy(original, workspace) as source:
+        target = workspace.path_for('.opus')
+        encode_opus(source, target, OPUS_ARCHIVE_BITRATE)
+
+        old_size = storage.size(name)
+        new_size = os.path.getsize(target)
+        if new_size >= old_size:
+            return 0
+        with open(target, 'rb') as encoded:
+            new_name = storage.save(os.path.splitext(name)[0] + '.opus', File(encoded))
+
+    saved = old_size - new_size
+    if not _recordings().filter(pk=recording.pk, audio_file=name).update(
+        audio_file=new_name,
+        file_format='opus',
+        file_size_bytes=new_size,
+        bitrate=int(OPUS_ARCHIVE_BITRATE.rstrip('k')) * 1000,
+        reclaimed_bytes=F('reclaimed_bytes') + saved,
+    ):
+        storage.delete(new_name)  # changed underneath us; keep what is there
+        return 0
+    recording.audio_file.name, recording.file_format, recording.file_size_bytes = new_name, 'opus', new_size
+    transaction.on_commit(lambda: storage.delete(name))
+    logger.info(f"Transcoded recording {recording.pk} to Opus, saved {saved} bytes")
+    return saved
+
+
+# =============================================================================
+# TIERING
+# =============================================================================
+
+def move_to_cold(recording) -> bool:
+    """Copy the recording's audio to the cold tier, then drop the hot copy."""
+    if recording.storage_tier == 'cold':
+        return False
+    hot, cold = recording.audio_file.storage, cold_storage()
+    name = recording.audio_file.name
+
+    with hot.open(name, 'rb') as source:
+        cold_name = cold.save(name, source)
+    if cold.size(cold_name) != hot.size(name):
+        cold.delete(cold_name)
+        raise LifecycleError(f"Cold copy of {name} is incomplete")
+
+    if not _recordings().filter(pk=recording.pk, storage_tier='hot', audio_file=name).update(
+        storage_tier='cold', audio_file=cold_name, tier_changed_at=timezone.now()
+    ):
+        cold.delete(cold_name)
+        return False
+    recording.storage_tier, recording.audio_file.name = 'cold', cold_name
+    transaction.on_commit(lambda: hot.delete(name))
+    return True
+
+
+def ensure_hot(recording):
+    """
+    Rehydrate a cold recording on first access. The row lock makes
+    concurrent readers wait for one copy instead of each making their own.
+    """
+    if recording.storage_tier != 'cold':
+        return recording
+    hot, cold = recording.audio_file.storage, cold_storage()
+
+    with transaction.atomic():
+        locked = _recordings().select_for_update().only('storage_tier', 'audio_file').get(pk=recording.pk)
+        if locked.storage_tier == 'cold':
+            cold_name = locked.audio_file.name
+            with cold.open(cold_name, 'rb') as source:
+                hot_name = hot.save(cold_name, source)
+            try:
+                _recordings().filter(pk=recording.pk).update(
+                    storage_tier='hot', audio_file=hot_name, tier_changed_at=timezone.now()
+                )
+            except Exception:
+                hot.delete(hot_name)
+                raise
+            transaction.on_commit(lambda: cold.delete(cold_name))
+            logger.info(f"Rehydrated recording {recording.pk} from cold storage")
+        else:
+            hot_name = locked.audio_file.name
+    recording.storage_tier, recording.audio_file.name = 'hot', hot_name
+    return recording
+
+
+def open_audio(recording):
+    """Open a recording's audio for playback: (file, size, content type)."""
+    ensure_hot(recording)
+    audio = recording.audio_file
+    return (
+        audio.storage.open(audio.name, 'rb'),
+        audio.storage.size(audio.name),
+        CONTENT_TYPES.get(recording.file_format, 'application/octet-stream'),
+    )
+
+
+# =============================================================================
+# PLAYBACK RENDITIONS
+# =============================================================================
+
+def rendition_name(recording, quality: str) -> str:
+    # Keyed by the source file, so a re-encoded original gets fresh renditions
+    source = hashlib.sha1(recording.audio_file.name.encode()).hexdigest()[:12]
+    return f'renditions/{recording.pk}/{quality}-{source}.opus'
+
+
+def build_rendition(recording, quality: str) -> str:
+    """Encode and store a playback rendition; returns its storage name."""
+    storage = recording.audio_file.storage
+    name = rendition_name(recording, quality)
+    try:
+        if storage.exists(name):
+            return name
+        ensure_hot(recording)
+        with scratch_workspace('rendition') as workspace, local_audio_copy(recording.audio_file, workspace) as source:
+            target = workspace.path_for('.opus')
+            encode_opus(source, target, RENDITIONS[quality])
+            with open(target, 'rb') as encoded:
+                stored = storage.save(name, File(encoded))
+        if stored != name:  # lost a race with another builder
+            storage.delete(stored)
+        return name
+    finally:
+        cache.delete(_rendition_lock_key(name))
+
+
+def _rendition_lock_key(name: str) -> str:
+    return f'rendition:{name}:lock'
+
+
+def playback_source(recording, quality: str = 'original'):
+    """
+    Storage, name and content type to play a recording from. A missing
+    rendition is queued for building (once, across workers) and the
+    original is served meanwhile; the last item says which was chosen.
+    """
+    storage = recording.audio_file.storage
+    if quality in RENDITIONS:
+        name = rendition_name(recording, quality)
+        if storage.exists(name):
+            return storage, name, CONTENT_TYPES['opus'], quality
+        if cache.add(_rendition_lock_key(name), 1, RENDITION_LOCK_TIMEOUT):
+            from .tasks import build_playback_rendition
+
+            transaction.on_commit(lambda: build_playback_rendition.delay(str(recording.pk), quality))
+
+    ensure_hot(recording)
+    content_type = CONTENT_TYPES.get(recording.file_format, 'application/octet-stream')
+    return storage, recording.audio_file.name, content_type, 'original'
+
+
+# =============================================================================
+# LIFECYCLE PASS
+# =============================================================================
+
+def apply_storage_lifecycle(limit: int = LIFECYCLE_BATCH_SIZE) -> Dict:
+    """
+    One pass of the lifecycle: delete transcription WAVs left behind by
+    finished recordings, then transcode archived recordings to Opus and
+    move them to the cold tier.
+    """
+    stats = {'intermediates_deleted': 0, 'transcoded': 0, 'moved_to_cold': 0, 'bytes_reclaimed': 0, 'errors': 0}
+
+    leftovers = _recordings().filter(status__in=['completed', 'archived']).exclude(processed_audio_file='')
+    for recording in leftovers.only('id', 'processed_audio_file')[:limit]:
+        freed = discard_processed_audio(recording)
+        stats['intermediates_deleted'] += 1 if freed else 0
+        stats['bytes_reclaimed'] += freed
+
+    rehydrated_until = timezone.now() - timedelta(days=REHYDRATED_RETENTION_DAYS)
+    archived = _recordings().filter(status='archived', storage_tier='hot').filter(
+        Q(tier_changed_at__isnull=True) | Q(tier_changed_at__lt=rehydrated_until)
+    )
+    for recording in archived[:limit]:
+        try:
+            saved = transcode_to_opus(recording)
+            stats['transcoded'] += 1 if saved else 0
+            stats['bytes_reclaimed'] += saved
+            if move_to_cold(recording):
+                stats['moved_to_cold'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            logger.error(f"Storage lifecycle failed for recording {recording.pk}: {str(e)}")
+    return stats
+
+
+def storage_report() -> Dict:
+    """Bytes stored per tier and bytes the lifecycle has reclaimed so far."""
+    report = {'hot_bytes': 0, 'cold_bytes': 0, 'hot_recordings': 0, 'cold_recordings': 0}
+    tiers = _recordings().values('storage_tier').annotate(
+        recordings=Count('id'), bytes=Sum('file_size_bytes')
+    ).order_by()
+    for tier in tiers:
+        report[f"{tier['storage_tier']}_bytes"] = tier['bytes'] or 0
+        report[f"{tier['storage_tier']}_recordings"] = tier['recordings']
+    totals = _recordings().aggregate(
+        reclaimed=Sum('reclaimed_bytes'),
+        pending=Count('id', filter=~Q(processed_audio_file='')),
+    )
+    report['reclaimed_bytes'] = totals['reclaimed'] or 0
+    report['pending_intermediates'] = totals['pending']
+    return report
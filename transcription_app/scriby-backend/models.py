@@ -10,12 +10,61 @@ Tech Stack: Django 4.2, PostgreSQL, Celery, Redis, OpenAI Whisper
 import uuid
 from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
 from django.utils import timezone
 from django.urls import reverse
 import json
 
+from .quota import minutes_for
+from .revisions import record_revision
+from .storage import audio_storage
+
+
+# Postgres text search configurations keyed by the language prefix of
+# Recording.language ("pt-BR" -> "portuguese"). Unknown languages fall back to
+# the "simple" config, which lowercases without stemming.
+SEARCH_CONFIGS = {
+    'da': 'danish',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'fi': 'finnish',
+    'fr': 'french',
+    'hu': 'hungarian',
+    'it': 'italian',
+    'nl': 'dutch',
+    'no': 'norwegian',
+    'pt': 'portuguese',
+    'ro': 'romanian',
+    'ru': 'russian',
+    'sv': 'swedish',
+    'tr': 'turkish',
+}
+DEFAULT_SEARCH_CONFIG = 'simple'
+
+
+def search_config_for_language(language):
+    """Return the Postgres text search config for a language code like 'en-US'."""
+    if not language:
+        return DEFAULT_SEARCH_CONFIG
+    prefix = language.replace('_', '-').split('-')[0].lower()
+    return SEARCH_CONFIGS.get(prefix, DEFAULT_SEARCH_CONFIG)
+
+
+def document_search_vector(title, field, config):
+    """
+    tsvector for a transcript or analysis: the recording title (weight A) so
+    title searches still match, followed by the document field (weight B).
+    """
+    return (
+        SearchVector(Value(title or ''), weight='A', config=config)
+        + SearchVector(field, weight='B', config=config)
+    )
+
 
 class TimestampedModel(models.Model):
     """Abstract base model with created_at and updated_at timestamps."""
@@ -86,14 +135,12 @@ class User(AbstractUser):
         return f"{self.first_name} {self.last_name}".strip()
 
     def can_transcribe_minutes(self, minutes):
-        """Check if user can transcribe given minutes based on plan limits."""
-        if not self.subscription_plan:
-            return False
-        monthly_limit = self.subscription_plan.monthly_transcription_minutes
-        return (self.monthly_transcription_minutes + minutes) <= monthly_limit
+        """Check if user can transcribe given minutes, counting outstanding reservations."""
+        from .quota import check_quota
+        return check_quota(self, 'transcription_minutes', minutes)
 
     def reset_monthly_usage(self):
-        """Reset monthly usage counters (called by Celery task)."""
+        """Reset this user's counters; month-end resets use usage.rollover_usage_period."""
         self.monthly_transcription_minutes = 0
         self.monthly_api_calls = 0
         self.save(update_fields=['monthly_transcription_minutes', 'monthly_api_calls'])
@@ -111,7 +158,7 @@ class UserProfile(TimestampedModel):
     notification_preferences = models.JSONField(default=dict)
     
     # API and usage quotas
-    api_rate_limit_per_hour = models.PositiveIntegerField(default=100)
+    api_rate_limit_per_hour = models.PositiveIntegerField(null=True, blank=True)  # overrides the plan's limit
     max_file_size_mb = models.PositiveIntegerField(default=100)
     max_recording_duration_minutes = models.PositiveIntegerField(default=180)
     
@@ -186,7 +233,11 @@ class Recording(TimestampedModel):
     file_size_bytes = models.PositiveBigIntegerField(null=True, blank=True)
     
     # File storage
-    audio_file = models.FileField(upload_to='recordings/%Y/%m/%d/')
+    audio_file = models.FileField(upload_to='recordings/%Y/%m/%d/', storage=audio_storage)
+    # 16 kHz mono WAV made for transcription; deleted once the transcript exists
+    processed_audio_file = models.FileField(upload_to='processed/%Y/%m/%d/', storage=audio_storage, blank=True)
+    # Multi-resolution min/max peaks for the player (see waveforms.py)
+    waveform_file = models.FileField(upload_to='waveforms/%Y/%m/%d/', storage=audio_storage, blank=True)
     original_filename = models.CharField(max_length=255)
     file_format = models.CharField(
         max_length=10,
@@ -196,9 +247,17 @@ class Recording(TimestampedModel):
             ('m4a', 'M4A'),
             ('flac', 'FLAC'),
             ('ogg', 'OGG'),
+            ('opus', 'Opus'),  # archived originals (see lifecycle.py)
         ]
     )
     
+    # Storage lifecycle (see lifecycle.py)
+    storage_tier = models.CharField(
+        max_length=10, choices=[('hot', 'Hot'), ('cold', 'Cold')], default='hot', db_index=True
+    )
+    tier_changed_at = models.DateTimeField(null=True, blank=True)
+    reclaimed_bytes = models.PositiveBigIntegerField(default=0)  # freed by transcoding and cleanup
+    
     # Audio properties
     sample_rate = models.PositiveIntegerField(null=True, blank=True)
     channels = models.PositiveSmallIntegerField(null=True, blank=True)
@@ -223,6 +282,9 @@ class Recording(TimestampedModel):
     language = models.CharField(max_length=10, default='en-US')
     tags = models.JSONField(default=list)
     
+    # Outstanding transcription-minutes hold (see quota.QuotaService)
+    quota_reservation = models.CharField(max_length=200, blank=True, editable=False)
+    
     class Meta:
         db_table = 'recordings'
         indexes = [
@@ -254,6 +316,95 @@ class Recording(TimestampedModel):
     def get_absolute_url(self):
         return reverse('recording_detail', kwargs={'pk': self.pk})
 
+    # Status, duration and title as loaded from the database; None for unsaved or deferred rows
+    _loaded_status = None
+    _loaded_duration = None
+    _loaded_title = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_duration = instance.__dict__.get('duration_seconds')
+        instance._loaded_title = instance.__dict__.get('title')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save, counting a transition to 'completed' against the owner's usage.
+        The transition is detected from the in-memory loaded status, so plain
+        saves cost no extra query.
+        """
+        update_fields = kwargs.get('update_fields')
+        completing = (
+            not self._state.adding
+            and self.status == 'completed'
+            and self._loaded_status != 'completed'
+            and (update_fields is None or 'status' in update_fields)
+        )
+        duration_changed = (
+            not self._state.adding
+            and 'duration_seconds' in self.__dict__
+            and self.duration_seconds != self._loaded_duration
+            and (update_fields is None or 'duration_seconds' in update_fields)
+        )
+        title_changed = (
+            not self._state.adding
+            and 'title' in self.__dict__
+            and self.title != self._loaded_title
+            and (update_fields is None or 'title' in update_fields)
+        )
+        if completing or duration_changed:
+            with transaction.atomic():
+                if completing:
+                    self._claim_completion()
+                super().save(*args, **kwargs)
+                if duration_changed:
+                    from .dashboard import record_recording_duration_changed
+                    record_recording_duration_changed(self, self._loaded_duration)
+        else:
+            super().save(*args, **kwargs)
+        if title_changed:
+            self.update_search_vectors()
+        self._loaded_status = self.status
+        self._loaded_duration = self.__dict__.get('duration_seconds')
+        self._loaded_title = self.__dict__.get('title')
+
+    def update_search_vectors(self):
+        """Rebuild the transcript and analysis vectors, which carry this recording's title."""
+        Transcription.objects.filter(recording=self).update(
+            search_vector=document_search_vector(self.title, 'text', F('search_config'))
+        )
+        Analysis.objects.filter(transcription__recording=self).update(
+            search_vector=document_search_vector(self.title, 'content', F('search_config'))
+        )
+
+    def mark_completed(self):
+        """
+        Move the recording to 'completed' and bump the owner's counters.
+        Returns False when another worker already completed it.
+        """
+        with transaction.atomic():
+            claimed = self._claim_completion()
+        self.status = self._loaded_status = 'completed'
+        return claimed
+
+    def _claim_completion(self):
+        """
+        Conditionally flip the row to 'completed'; only the caller whose UPDATE
+        matched increments the counters, using F() so concurrent completions
+        for the same user cannot overwrite each other.
+        """
+        claimed = Recording.objects.filter(pk=self.pk).exclude(status='completed').update(
+            status='completed', updated_at=timezone.now()
+        )
+        if claimed:
+            User.objects.filter(pk=self.user_id).update(
+                total_recordings=F('total_recordings') + 1,
+                monthly_transcription_minutes=F('monthly_transcription_minutes') + minutes_for(self.duration_seconds),
+            )
+        return bool(claimed)
+
 
 class Transcription(TimestampedModel):
     """
@@ -275,6 +426,8 @@ class Transcription(TimestampedModel):
     srt_format = models.TextField(blank=True)  # SubRip format
     vtt_format = models.TextField(blank=True)  # WebVTT format
     json_format = models.JSONField(default=dict)  # Structured data with timestamps
+    # Word-level timestamps as packed columns (see word_timings.WordTimings), kept out of the row
+    word_timings_file = models.FileField(upload_to='word_timings/%Y/%m/%d/', storage=audio_storage, blank=True)
     
     # Processing details
     processing_time_seconds = models.FloatField(null=True, blank=True)
@@ -293,10 +446,9 @@ class Transcription(TimestampedModel):
     speakers_detected = models.PositiveSmallIntegerField(default=1)
     speaker_labels = models.JSONField(default=list)  # [{"speaker": "Speaker 1", "segments": [...]}]
     
-    # Version control for manual edits
+    # Version control for manual edits; earlier versions live in TranscriptionRevision
     version = models.PositiveSmallIntegerField(default=1)
     is_manually_edited = models.BooleanField(default=False)
-    edit_history = models.JSONField(default=list)
     
     # Status and quality
     status = models.CharField(
@@ -311,11 +463,17 @@ class Transcription(TimestampedModel):
         db_index=True
     )
     
+    # Full-text search, derived from text and Recording.language on save
+    search_config = models.CharField(max_length=20, default=DEFAULT_SEARCH_CONFIG, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         db_table = 'transcriptions'
         indexes = [
             models.Index(fields=['recording', 'status']),
             models.Index(fields=['created_at', 'confidence_score']),
+            GinIndex(fields=['search_vector'], name='transcriptions_search_gin'),
+            GinIndex(fields=['text'], name='transcriptions_text_trgm', opclasses=['gin_trgm_ops']),
         ]
 
     def __str__(self):
@@ -331,18 +489,176 @@ class Transcription(TimestampedModel):
         """Return confidence score as percentage."""
         return round(self.confidence_score * 100, 1) if self.confidence_score else None
 
+    # Text and confidence as loaded from the database; None for unsaved or deferred rows
+    _loaded_text = None
+    _loaded_confidence = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_text = instance.__dict__.get('text')
+        instance._loaded_confidence = instance.__dict__.get('confidence_score')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save, refreshing the search vector only when the text changed and
+        folding a new confidence score into the owner's analytics rollups.
+        """
+        if self._state.adding or not self.search_config:
+            self.search_config = search_config_for_language(self.recording.language)
+        update_fields = kwargs.get('update_fields')
+        text_changed = (
+            (self._state.adding or ('text' in self.__dict__ and self.text != self._loaded_text))
+            and (update_fields is None or 'text' in update_fields)
+        )
+        confidence_changed = (
+            not self._state.adding
+            and 'confidence_score' in self.__dict__
+            and self.confidence_score != self._loaded_confidence
+            and (update_fields is None or 'confidence_score' in update_fields)
+        )
+        adding = self._state.adding
+        if confidence_changed:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                from .dashboard import record_transcription_confidence_changed
+                record_transcription_confidence_changed(
+                    self, self.recording.user_id, self._loaded_confidence
+                )
+        else:
+            super().save(*args, **kwargs)
+        if adding:
+            from .search import note_search_config
+            note_search_config(self.search_config)
+        if text_changed:
+            self.update_search_vector()
+        self._loaded_text = self.__dict__.get('text')
+        self._loaded_confidence = self.__dict__.get('confidence_score')
+
+    def update_search_vector(self):
+        """Recompute the tsvector for the current text in the database."""
+        Transcription.objects.filter(pk=self.pk).update(
+            search_vector=document_search_vector(self.recording.title, 'text', self.search_config)
+        )
+
     def create_new_version(self, new_text, edited_by):
-        """Create a new version when manually edited."""
-        self.edit_history.append({
-            'version': self.version,
-            'text': self.text,
-            'edited_by': str(edited_by),
-            'edited_at': timezone.now().isoformat(),
-        })
-        self.text = new_text
-        self.version += 1
-        self.is_manually_edited = True
-        self.save()
+        """Create a new version when manually edited, recording it as a revision diff."""
+        with transaction.atomic():
+            revision = record_revision(self, new_text, edited_by)
+            self.text = new_text
+            self.version = revision.version
+            self.is_manually_edited = True
+            self.save()
+
+    def replace_segments(self, segments):
+        """Replace stored segment rows with a fresh Whisper segments payload."""
+        rows = TranscriptSegment.build_from_payload(self, segments)
+        with transaction.atomic():
+            self.segments.all().delete()
+            TranscriptSegment.objects.bulk_create(rows, batch_size=500)
+            self.segments.update(
+                search_vector=SearchVector('text', config=self.search_config)
+            )
+        return len(rows)
+
+
+class TranscriptSegment(models.Model):
+    """
+    Timed segment of a transcription, normalized from the Whisper segments
+    payload. Indexed for full-text search so hits can seek straight to the
+    audio position without loading the full transcript.
+    """
+    id = models.BigAutoField(primary_key=True)
+    transcription = models.ForeignKey(Transcription, on_delete=models.CASCADE, related_name='segments')
+    recording = models.ForeignKey(Recording, on_delete=models.CASCADE, related_name='segments')
+    
+    # Position in the transcript
+    index = models.PositiveIntegerField()
+    start = models.FloatField()  # seconds
+    end = models.FloatField()  # seconds
+    speaker = models.CharField(max_length=50, blank=True)
+    
+    # Content
+    text = models.TextField()
+    confidence = models.FloatField(null=True, blank=True)
+    
+    # Full-text search, shares the transcription's search config
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    class Meta:
+        db_table = 'transcript_segments'
+        ordering = ['transcription', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['transcription', 'index'], name='transcript_segments_unique_index'),
+        ]
+        indexes = [
+            models.Index(fields=['recording', 'start']),
+            GinIndex(fields=['search_vector'], name='transcript_segments_search_gin'),
+            GinIndex(fields=['text'], name='transcript_segments_text_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f"[{self.start:.2f}-{self.end:.2f}] {self.text[:50]}"
+
+    @staticmethod
+    def indexed_payload(segments):
+        """
+        Yield (index, segment, text) for the Whisper segments stored as rows.
+        Segments without text are skipped and take no index; anything that
+        refers to segments by index (e.g. speaker_labels) must count the same way.
+        """
+        index = 0
+        for segment in segments or []:
+            text = (segment.get('text') or '').strip()
+            if text:
+                yield index, segment, text
+                index += 1
+
+    @classmethod
+    def build_from_payload(cls, transcription, segments):
+        """Build unsaved segment rows from a list of Whisper segment dicts."""
+        rows = []
+        for index, segment, text in cls.indexed_payload(segments):
+            start = float(segment.get('start') or 0.0)
+            end = max(float(segment.get('end') or start), start)
+            rows.append(cls(
+                transcription=transcription,
+                recording_id=transcription.recording_id,
+                index=index,
+                start=round(start, 3),
+                end=round(end, 3),
+                speaker=segment.get('speaker') or '',
+                text=text,
+                confidence=segment.get('confidence'),
+            ))
+        return rows
+
+
+class TranscriptionRevision(models.Model):
+    """
+    One version of a transcription's text, kept out of the transcription row.
+    Either a full snapshot or a word-level diff against the previous version
+    (see revisions.py); any version is rebuilt from the nearest snapshot.
+    """
+    id = models.BigAutoField(primary_key=True)
+    transcription = models.ForeignKey(Transcription, on_delete=models.CASCADE, related_name='revisions')
+    version = models.PositiveSmallIntegerField()
+    is_snapshot = models.BooleanField(default=True)
+    snapshot = models.TextField(blank=True)
+    diff = models.JSONField(null=True, blank=True)  # [[start token, end token, replacement], ...]
+    edited_by = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'transcription_revisions'
+        ordering = ['transcription', 'version']
+        constraints = [
+            models.UniqueConstraint(fields=['transcription', 'version'], name='transcription_revisions_unique_version'),
+        ]
+
+    def __str__(self):
+        return f"Version {self.version} of {self.transcription_id}"
 
 
 class Analysis(TimestampedModel):
@@ -403,11 +719,17 @@ class Analysis(TimestampedModel):
     template_used = models.CharField(max_length=100, blank=True)
     custom_parameters = models.JSONField(default=dict)
     
+    # Full-text search, inherits the transcription's search config
+    search_config = models.CharField(max_length=20, default=DEFAULT_SEARCH_CONFIG, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         db_table = 'analyses'
         indexes = [
             models.Index(fields=['transcription', 'analysis_type']),
             models.Index(fields=['created_at', 'analysis_type']),
+            GinIndex(fields=['search_vector'], name='analyses_search_gin'),
+            GinIndex(fields=['content'], name='analyses_content_trgm', opclasses=['gin_trgm_ops']),
         ]
 
     def __str__(self):
@@ -418,6 +740,33 @@ class Analysis(TimestampedModel):
         """Return confidence score as percentage."""
         return round(self.confidence_score * 100, 1) if self.confidence_score else None
 
+    # Content as loaded from the database; None for unsaved or deferred rows
+    _loaded_content = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_content = instance.__dict__.get('content')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save, refreshing the search vector only when the content changed."""
+        if self._state.adding or not self.search_config:
+            self.search_config = self.transcription.search_config
+        update_fields = kwargs.get('update_fields')
+        content_changed = (
+            (self._state.adding or ('content' in self.__dict__ and self.content != self._loaded_content))
+            and (update_fields is None or 'content' in update_fields)
+        )
+        super().save(*args, **kwargs)
+        if content_changed:
+            Analysis.objects.filter(pk=self.pk).update(
+                search_vector=document_search_vector(
+                    self.transcription.recording.title, 'content', self.search_config
+                )
+            )
+        self._loaded_content = self.__dict__.get('content')
+
     @property
     def sentiment_label(self):
         """Return sentiment label based on score."""
@@ -431,6 +780,181 @@ class Analysis(TimestampedModel):
             return "Neutral"
 
 
+class UserUsageHistory(models.Model):
+    """
+    Archived monthly usage counters, one row per user per closed period.
+    Written by the bulk usage rollover before the live counters are reset.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_history')
+    period_start = models.DateField()
+    transcription_minutes = models.PositiveIntegerField(default=0)
+    api_calls = models.PositiveIntegerField(default=0)
+    total_recordings = models.PositiveIntegerField(default=0)
+    subscription_plan = models.ForeignKey(
+        SubscriptionPlan, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'user_usage_history'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period_start'], name='unique_user_usage_period'),
+        ]
+        indexes = [
+            models.Index(fields=['period_start']),
+        ]
+
+    def __str__(self):
+        return f"Usage for user {self.user_id} in {self.period_start:%Y-%m}"
+
+
+class UsageRollover(TimestampedModel):
+    """
+    Progress of one usage-period rollover. `last_user_id` is the keyset
+    watermark, so an interrupted rollover resumes after the last batch.
+    """
+    period_start = models.DateField(unique=True)
+    last_user_id = models.UUIDField(null=True, blank=True)
+    users_processed = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'usage_rollovers'
+
+    def __str__(self):
+        state = 'completed' if self.completed_at else f'at {self.last_user_id}'
+        return f"Usage rollover {self.period_start:%Y-%m} ({state})"
+
+
+class UsageEvent(models.Model):
+    """
+    Append-only usage ledger. Each pipeline stage records what it consumed;
+    dashboards and billing read the UsageRollup aggregates built from it.
+    """
+    STAGE_CHOICES = [
+        ('upload', 'Upload'),
+        ('transcription', 'Transcription'),
+        ('analysis', 'Analysis'),
+        ('embedding', 'Embedding'),
+        ('export', 'Export'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_events')
+    recording = models.ForeignKey(
+        Recording, on_delete=models.SET_NULL, null=True, blank=True, related_name='usage_events'
+    )
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES)
+    minutes = models.FloatField(default=0.0)
+    tokens = models.PositiveIntegerField(default=0)
+    api_calls = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=Decimal('0'))
+    occurred_at = models.DateTimeField(default=timezone.now)
+    # Database wall-clock time of the insert; the rollup safety lag is measured against it
+    recorded_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        db_table = 'usage_events'
+        indexes = [
+            models.Index(fields=['user', 'occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.stage} usage for user {self.user_id} at {self.occurred_at}"
+
+
+class UsageRollup(models.Model):
+    """Pre-aggregated usage per user, stage and hour/day/month bucket."""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+        ('month', 'Monthly'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_rollups')
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    stage = models.CharField(max_length=20, choices=UsageEvent.STAGE_CHOICES)
+    minutes = models.FloatField(default=0.0)
+    tokens = models.PositiveBigIntegerField(default=0)
+    api_calls = models.PositiveBigIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=6, default=Decimal('0'))
+
+    class Meta:
+        db_table = 'usage_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'bucket_start', 'stage'],
+                name='unique_usage_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.stage} usage for user {self.user_id} from {self.bucket_start}"
+
+
+class UsageRollupState(models.Model):
+    """Watermark of the last UsageEvent folded into UsageRollup."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'usage_rollup_state'
+
+    def __str__(self):
+        return f"{self.name} at event {self.last_event_id}"
+
+
+class UserAnalytics(models.Model):
+    """
+    Running dashboard totals per user, maintained incrementally by the
+    analytics signal handlers (see dashboard.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='analytics')
+    total_recordings = models.IntegerField(default=0)
+    total_duration_seconds = models.BigIntegerField(default=0)
+    total_transcriptions = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    confidence_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_analytics'
+
+    def __str__(self):
+        return f"Analytics for user {self.user_id}"
+
+    @property
+    def average_confidence(self):
+        """Mean transcription confidence, 0 when nothing was scored."""
+        return self.confidence_sum / self.confidence_count if self.confidence_count else 0
+
+
+class DailyActivity(models.Model):
+    """Materialized per-day recording and transcription counts for a user."""
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_activity')
+    day = models.DateField()
+    recordings = models.IntegerField(default=0)
+    transcriptions = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'user_daily_activity'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_activity'),
+        ]
+
+    def __str__(self):
+        return f"Activity for user {self.user_id} on {self.day}"
+
+
 class UsageMetrics(TimestampedModel):
     """
     AARRR metrics tracking for business intelligence and user analytics.
@@ -571,11 +1095,19 @@ class AuditLog(TimestampedModel):
     status_code = models.PositiveSmallIntegerField(null=True, blank=True)
     processing_time_ms = models.PositiveIntegerField(null=True, blank=True)
     
+    # Delivery: events are written asynchronously (see audit.py); occurred_at
+    # is the request time and the monthly partition key of audit_logs
+    event_id = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    
     class Meta:
         db_table = 'audit_logs'
+        constraints = [
+            models.UniqueConstraint(fields=['event_id', 'occurred_at'], name='unique_audit_event'),
+        ]
         indexes = [
             models.Index(fields=['user', 'action']),
-            models.Index(fields=['created_at', 'action']),
+            models.Index(fields=['occurred_at', 'action']),
             models.Index(fields=['resource_type', 'resource_id']),
         ]
 
@@ -584,8 +1116,115 @@ class AuditLog(TimestampedModel):
         return f"{self.action} by {user_info} at {self.created_at}"
 
 
+class BulkExportJob(TimestampedModel):
+    """
+    Asynchronous export of a filtered set of recordings as one ZIP archive.
+    `filters` holds RecordingFilter query parameters, so a job selects exactly
+    what the recordings list endpoint returns for the same query string.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bulk_exports')
+
+    # Selection
+    filters = models.JSONField(default=dict, blank=True)
+    formats = models.JSONField(default=list)
+    include_analyses = models.BooleanField(default=True)
+
+    # Processing state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    recordings_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    # Result
+    archive_file = models.FileField(upload_to='exports/%Y/%m/%d/', null=True, blank=True)
+    archive_size_bytes = models.PositiveBigIntegerField(default=0)
+    archive_sha256 = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        db_table = 'bulk_export_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Bulk export {self.id} ({self.status})"
+
+    @property
+    def is_downloadable(self):
+        return (
+            self.status == 'completed' and bool(self.archive_file)
+            and (self.expires_at is None or self.expires_at > timezone.now())
+        )
+
+
+
+class UploadSession(TimestampedModel):
+    """
+    Resumable chunked upload of one recording. Chunks are appended in order
+    to a partial file on local disk; `offset` is the number of bytes durably
+    received, which clients query to resume after a dropped connection.
+    Direct uploads instead POST the whole file to object storage at
+    `storage_key` through a presigned form.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+        ('expired', 'Expired'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+
+    # Declared by the client at initiation
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # optional whole-file checksum
+    metadata = models.JSONField(default=dict, blank=True)  # title, description, language, tags
+
+    # Progress
+    offset = models.PositiveBigIntegerField(default=0)
+    chunks_received = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading', db_index=True)
+    partial_path = models.CharField(max_length=500, editable=False, blank=True)
+    storage_key = models.CharField(max_length=500, blank=True)  # direct-to-storage uploads
+    expires_at = models.DateTimeField()
+
+    # Result
+    recording = models.OneToOneField(
+        Recording, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+
+    class Meta:
+        db_table = 'upload_sessions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.total_size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.offset == self.total_size
+
 # Signal handlers for automatic model updates
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 @receiver(post_save, sender=User)
@@ -600,17 +1239,70 @@ def create_usage_metrics(sender, instance, created, **kwargs):
     if created:
         UsageMetrics.objects.create(user=instance)
 
-@receiver(pre_save, sender=Recording)
-def update_user_stats(sender, instance, **kwargs):
-    """Update user statistics when recording status changes."""
-    if instance.pk:  # Only for existing records
-        try:
-            old_instance = Recording.objects.get(pk=instance.pk)
-            if old_instance.status != 'completed' and instance.status == 'completed':
-                instance.user.total_recordings += 1
-                if instance.duration_seconds:
-                    minutes = instance.duration_seconds / 60
-                    instance.user.monthly_transcription_minutes += int(minutes)
-                instance.user.save(update_fields=['total_recordings', 'monthly_transcription_minutes'])
-        except Recording.DoesNotExist:
-            pass
+@receiver(post_save, sender=User)
+def create_user_analytics(sender, instance, created, **kwargs):
+    """Start new users with empty analytics rollups."""
+    if created:
+        UserAnalytics.objects.create(user=instance)
+
+@receiver(post_save, sender=Recording)
+def count_recording_created(sender, instance, created, **kwargs):
+    """Add a new recording to the owner's analytics rollups."""
+    if created:
+        from .dashboard import record_recording_created
+        record_recording_created(instance)
+
+@receiver(post_save, sender=Recording)
+def record_upload_usage(sender, instance, created, **kwargs):
+    """Meter each uploaded recording in the usage ledger."""
+    if created:
+        from .usage import record_usage_event
+        record_usage_event(instance.user_id, 'upload', api_calls=1, recording_id=instance.pk)
+
+@receiver(post_delete, sender=Recording)
+def count_recording_deleted(sender, instance, **kwargs):
+    """Remove a deleted recording from the owner's analytics rollups."""
+    from .dashboard import record_recording_deleted
+    record_recording_deleted(instance)
+
+@receiver(post_save, sender=Transcription)
+def count_transcription_created(sender, instance, created, **kwargs):
+    """Add a finished transcription to the owner's analytics rollups."""
+    if created:
+        from .dashboard import record_transcription_created
+        record_transcription_created(instance, instance.recording.user_id)
+
+@receiver(post_delete, sender=Transcription)
+def count_transcription_deleted(sender, instance, **kwargs):
+    """Remove a deleted transcription from the owner's analytics rollups."""
+    user_id = Recording.objects.filter(pk=instance.recording_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        from .dashboard import record_transcription_deleted
+        record_transcription_deleted(instance, user_id)
+
+@receiver(post_save, sender=User)
+def invalidate_user_stats(sender, instance, created, update_fields=None, **kwargs):
+    """Recompute cached usage stats when the user changes plans."""
+    if not created and (update_fields is None or 'subscription_plan' in update_fields):
+        from .caching import bump_cache_version
+        bump_cache_version('usage_stats', instance.pk)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_rate_limit(sender, instance, created, update_fields=None, **kwargs):
+    """Drop the user's cached API rate limit when their override may have changed."""
+    if not created and (update_fields is None or 'api_rate_limit_per_hour' in update_fields):
+        from .throttling import invalidate_plan_cache
+        invalidate_plan_cache(instance.user_id)
+
+@receiver(post_save, sender=SubscriptionPlan)
+def invalidate_plan_rate_limits(sender, instance, **kwargs):
+    """Drop all cached API rate limits when a plan is edited."""
+    from .throttling import invalidate_plan_cache
+    invalidate_plan_cache()
+
+@receiver(post_save, sender=User)
+def invalidate_user_rate_limit(sender, instance, created, update_fields=None, **kwargs):
+    """Drop the user's cached API rate limit when they change plans."""
+    if not created and (update_fields is None or 'subscription_plan' in update_fields):
+        from .throttling import invalidate_plan_cache
+        invalidate_plan_cache(instance.pk)
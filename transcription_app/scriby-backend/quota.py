@@ -0,0 +1,317 @@
+"""
+Scriby - Quota enforcement
+Atomic reserve/commit/release quota counters in Redis, reconciled against Postgres
+"""
+
+import logging
+import math
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db.models import Count, Sum
+from django.db.models.functions import Ceil
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Constants
+QUOTA_KEY_PREFIX = 'quota'
+EXPIRIES_KEY = f'{QUOTA_KEY_PREFIX}:expiries'  # zset of "<counters key>|<reservation id>" by deadline
+ACTIVE_KEY = f'{QUOTA_KEY_PREFIX}:active'  # set of counters keys to reconcile
+RESERVATION_TTL = 6 * 3600  # abandoned reservations are released after this
+COUNTER_TTL = 40 * 24 * 3600  # counters outlive their calendar month
+UNLIMITED = -1
+RECONCILE_BATCH_SIZE = 1000
+
+QUOTA_RESOURCES = ('transcription_minutes', 'recordings', 'ai_analysis')
+
+# KEYS: counters, holds, expiries  ARGV: reservation id, amount, deadline, ttl
+RESERVE_SCRIPT = """
+local limit = redis.call('HGET', KEYS[1], 'limit')
+if not limit then return -2 end
+limit = tonumber(limit)
+local used = tonumber(redis.call('HGET', KEYS[1], 'used') or '0')
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+local amount = tonumber(ARGV[2])
+if limit >= 0 and used + reserved + amount > limit then return -1 end
+redis.call('HINCRBYFLOAT', KEYS[1], 'reserved', ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[3], KEYS[1] .. '|' .. ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+# KEYS: counters, holds, expiries  ARGV: reservation id, amount to charge ('' releases)
+SETTLE_SCRIPT = """
+local held = redis.call('HGET', KEYS[2], ARGV[1])
+if held then
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  redis.call('ZREM', KEYS[3], KEYS[1] .. '|' .. ARGV[1])
+  redis.call('HINCRBYFLOAT', KEYS[1], 'reserved', '-' .. held)
+end
+if ARGV[2] ~= '' then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'used', ARGV[2])
+end
+if held then return 1 end
+return 0
+"""
+
+# KEYS: counters, active set  ARGV: used from Postgres, limit, ttl, exact ('1' or '')
+# `used` only moves up unless exact: Redis may be ahead of Postgres while a
+# commit is in flight, but an explicit reconcile must be able to correct it
+SYNC_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'used') or '-1')
+if ARGV[4] == '1' or tonumber(ARGV[1]) > current then redis.call('HSET', KEYS[1], 'used', ARGV[1]) end
+redis.call('HSET', KEYS[1], 'limit', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], KEYS[1])
+return 1
+"""
+
+# KEYS: counters  ARGV: amount
+CHECK_SCRIPT = """
+local limit = redis.call('HGET', KEYS[1], 'limit')
+if not limit then return -2 end
+limit = tonumber(limit)
+if limit < 0 then return 1 end
+local used = tonumber(redis.call('HGET', KEYS[1], 'used') or '0')
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+if used + reserved + tonumber(ARGV[1]) > limit then return 0 end
+return 1
+"""
+
+
+class QuotaError(Exception):
+    """Raised for unknown quota resources or malformed reservations"""
+    pass
+
+
+def current_period(now: Optional[datetime] = None) -> str:
+    """Quota period label (calendar month), matching the monthly usage rollover."""
+    return (now or timezone.now()).strftime('%Y%m')
+
+
+def counters_key(user_id, resource: str, period: Optional[str] = None) -> str:
+    if resource not in QUOTA_RESOURCES:
+        raise QuotaError(f"Unknown quota resource: {resource}")
+    return f"{QUOTA_KEY_PREFIX}:{user_id}:{resource}:{period or current_period()}"
+
+
+def _period_start(period: str) -> datetime:
+    return timezone.make_aware(datetime(int(period[:4]), int(period[4:]), 1))
+
+
+# =============================================================================
+# POSTGRES STATE
+# =============================================================================
+
+def _plan_limit(resource: str, plan_minutes, features) -> float:
+    if resource == 'transcription_minutes':
+        return plan_minutes if plan_minutes is not None else 0
+    features = features or {}
+    if resource == 'ai_analysis':
+        if features.get('ai_analysis') is False:
+            return 0
+        return features.get('monthly_ai_analyses', UNLIMITED)
+    return features.get('monthly_recordings', UNLIMITED)
+
+
+def database_usage(resource: str, user_ids: Iterable, period: str) -> Dict[str, Tuple[float, float]]:
+    """Committed usage in `period` and plan limit per user id, read from Postgres."""
+    from .models import Analysis, Recording, UsageEvent, User
+
+    user_ids = list(user_ids)
+    users = User.objects.filter(pk__in=user_ids).values_list(
+        'pk', 'subscription_plan__monthly_transcription_minutes', 'subscription_plan__features'
+    )
+    state = {
+        str(pk): (0, _plan_limit(resource, plan_minutes, features))
+        for pk, plan_minutes, features in users
+    }
+
+    period_start = _period_start(period)
+    if resource == 'transcription_minutes':
+        # Charged per recording in whole minutes, as minutes_for() commits them
+        counts = UsageEvent.objects.filter(
+            user_id__in=user_ids, stage='transcription', occurred_at__gte=period_start
+        ).values_list('user_id').annotate(total=Sum(Ceil('minutes')))
+    elif resource == 'recordings':
+        counts = Recording.objects.filter(user_id__in=user_ids, created_at__gte=period_start)
+        counts = counts.values_list('user_id').annotate(total=Count('id'))
+    else:
+        counts = Analysis.objects.filter(
+            transcription__recording__user_id__in=user_ids, created_at__gte=period_start
+        ).values_list('transcription__recording__user_id').annotate(total=Count('id'))
+    for pk, total in counts.order_by():
+        if str(pk) in state:
+            state[str(pk)] = (total or 0, state[str(pk)][1])
+    return state
+
+
+# =============================================================================
+# QUOTA SERVICE
+# =============================================================================
+
+class QuotaService:
+    """
+    Per-user, per-month quota counters kept in one Redis hash per resource:
+    `used` (committed), `reserved` (outstanding holds) and `limit`. Admission
+    is decided inside a Lua script, so concurrent requests cannot both pass a
+    check before either is counted, and rejections never touch Postgres.
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        self.client = client
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._settle = client.register_script(SETTLE_SCRIPT)
+        self._sync = client.register_script(SYNC_SCRIPT)
+        self._check = client.register_script(CHECK_SCRIPT)
+
+    def sync(self, user_id, resource: str, used: float, limit: float, period: Optional[str] = None,
+             exact: bool = False):
+        """
+        Load committed usage and the plan limit for one counter. `used` is only
+        raised unless `exact`, which also lowers it to the Postgres figure.
+        """
+        key = counters_key(user_id, resource, period)
+        self._sync(keys=[key, ACTIVE_KEY], args=[used, limit, COUNTER_TTL, '1' if exact else ''])
+
+    def _prime(self, user_id, resource: str, period: str):
+        used, limit = database_usage(resource, [user_id], period).get(str(user_id), (0, 0))
+        self.sync(user_id, resource, used, limit, period)
+
+    def reserve(self, user, resource: str, amount: float = 1) -> Optional[str]:
+        """
+        Hold `amount` against the user's quota. Returns a reservation token to
+        commit or release, or None when the hold would exceed the plan limit.
+        """
+        user_id = getattr(user, 'pk', user)
+        period = current_period()
+        key = counters_key(user_id, resource, period)
+        reservation_id = uuid.uuid4().hex
+        args = [reservation_id, amount, int(time.time()) + RESERVATION_TTL, COUNTER_TTL]
+        keys = [key, f'{key}:holds', EXPIRIES_KEY]
+
+        result = self._reserve(keys=keys, args=args)
+        if result == -2:
+            # First use this period (or Redis lost the key): load it once
+            self._prime(user_id, resource, period)
+            result = self._reserve(keys=keys, args=args)
+        if result != 1:
+            logger.info(f"Quota exceeded for user {user_id}: {resource} +{amount}")
+            return None
+        return f'{key}|{reservation_id}'
+
+    def commit(self, token: str, amount: Optional[float] = None) -> bool:
+        """Convert a reservation into usage, charging `amount` (default: the held amount)."""
+        key, reservation_id = self._split(token)
+        if amount is None:
+            amount = float(self.client.hget(f'{key}:holds', reservation_id) or 0)
+        return bool(self._settle(keys=[key, f'{key}:holds', EXPIRIES_KEY], args=[reservation_id, amount]))
+
+    def release(self, token: str) -> bool:
+        """Return a reservation's amount to the quota without charging it."""
+        key, reservation_id = self._split(token)
+        return bool(self._settle(keys=[key, f'{key}:holds', EXPIRIES_KEY], args=[reservation_id, '']))
+
+    def check(self, user, resource: str, amount: float = 0) -> bool:
+        """True when `amount` more would still fit, without reserving it."""
+        user_id = getattr(user, 'pk', user)
+        period = current_period()
+        key = counters_key(user_id, resource, period)
+        result = self._check(keys=[key], args=[amount])
+        if result == -2:
+            self._prime(user_id, resource, period)
+            result = self._check(keys=[key], args=[amount])
+        return result == 1
+
+    @staticmethod
+    def _split(token: str) -> Tuple[str, str]:
+        try:
+            key, reservation_id = token.rsplit('|', 1)
+        except (AttributeError, ValueError):
+            raise QuotaError(f"Malformed quota reservation: {token!r}")
+        return key, reservation_id
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+    # ------------------------------------------------------------------
+
+    def release_expired(self, now: Optional[float] = None) -> int:
+        """Release reservations whose holder never committed or released them."""
+        released = 0
+        now = now or time.time()
+        while True:
+            members = self.client.zrangebyscore(EXPIRIES_KEY, '-inf', now, start=0, num=RECONCILE_BATCH_SIZE)
+            if not members:
+                return released
+            for member in members:
+                member = member.decode() if isinstance(member, bytes) else member
+                if self.release(member):
+                    released += 1
+                else:
+                    self.client.zrem(EXPIRIES_KEY, member)
+
+    def reconcile(self) -> int:
+        """
+        Re-sync active counters with Postgres usage and current plan limits.
+        Postgres is authoritative here, so counters that drifted high come down.
+        """
+        period = current_period()
+        pending: Dict[str, list] = {resource: [] for resource in QUOTA_RESOURCES}
+        stale = []
+        for key in self.client.sscan_iter(ACTIVE_KEY, count=RECONCILE_BATCH_SIZE):
+            key = key.decode() if isinstance(key, bytes) else key
+            _, user_id, resource, key_period = key.split(':')
+            if key_period != period or resource not in pending:
+                stale.append(key)
+            else:
+                pending[resource].append(user_id)
+        if stale:
+            self.client.srem(ACTIVE_KEY, *stale)
+
+        synced = 0
+        for resource, user_ids in pending.items():
+            for start in range(0, len(user_ids), RECONCILE_BATCH_SIZE):
+                batch = user_ids[start:start + RECONCILE_BATCH_SIZE]
+                for user_id, (used, limit) in database_usage(resource, batch, period).items():
+                    self.sync(user_id, resource, used, limit, period, exact=True)
+                    synced += 1
+        return synced
+
+
+_service = None
+
+
+def get_quota_service() -> QuotaService:
+    global _service
+    if _service is None:
+        _service = QuotaService()
+    return _service
+
+
+def reserve_quota(user, resource: str, amount: float = 1) -> Optional[str]:
+    return get_quota_service().reserve(user, resource, amount)
+
+
+def commit_quota(token: str, amount: Optional[float] = None) -> bool:
+    return get_quota_service().commit(token, amount)
+
+
+def release_quota(token: str) -> bool:
+    return get_quota_service().release(token)
+
+
+def check_quota(user, resource: str, amount: float = 0) -> bool:
+    return get_quota_service().check(user, resource, amount)
+
+
+def minutes_for(duration_seconds) -> int:
+    """Whole minutes a recording counts against the transcription quota."""
+    return math.ceil((duration_seconds or 0) / 60)
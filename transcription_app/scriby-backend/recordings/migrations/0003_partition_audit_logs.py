@@ -0,0 +1,66 @@
+# Converts audit_logs into a table range-partitioned by month on occurred_at
+# (see audit.py for the partition maintenance that relies on it)
+
+from django.db import migrations
+
+
+# audit_logs belongs to the unmigrated project models, which `migrate` creates
+# before applying app migrations. The conversion only runs while it is still a
+# plain table, so re-running it, or running it before the table exists, is a
+# no-op. Postgres requires the partition key in the primary key.
+#
+# Monthly partitions are created for every month holding legacy rows through
+# audit.PARTITIONS_AHEAD (2) months from now before the rows are copied, so
+# nothing lands in the default partition that a later monthly partition would
+# have to claim.
+PARTITION_AUDIT_LOGS_SQL = """
+DO $$
+DECLARE
+    partition_start timestamptz;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')) IS DISTINCT FROM 'r' THEN
+        RETURN;
+    END IF;
+    ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+    ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey;
+    ALTER TABLE audit_logs_legacy RENAME CONSTRAINT unique_audit_event TO unique_audit_event_legacy;
+    CREATE TABLE audit_logs (LIKE audit_logs_legacy INCLUDING DEFAULTS)
+        PARTITION BY RANGE (occurred_at);
+    CREATE SEQUENCE audit_logs_partitioned_id_seq OWNED BY audit_logs.id;
+    ALTER TABLE audit_logs ALTER COLUMN id SET DEFAULT nextval('audit_logs_partitioned_id_seq');
+    ALTER TABLE audit_logs ADD PRIMARY KEY (id, occurred_at);
+    ALTER TABLE audit_logs ADD CONSTRAINT unique_audit_event UNIQUE (event_id, occurred_at);
+    CREATE INDEX ON audit_logs (user_id, action);
+    CREATE INDEX ON audit_logs (occurred_at, action);
+    CREATE INDEX ON audit_logs (resource_type, resource_id);
+    FOR partition_start IN
+        SELECT generate_series(
+            date_trunc('month', LEAST((SELECT MIN(occurred_at) FROM audit_logs_legacy), now())),
+            date_trunc('month', now()) + interval '2 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF audit_logs FOR VALUES FROM (%L) TO (%L)',
+            'audit_logs_' || to_char(partition_start, 'YYYYMM'),
+            partition_start, partition_start + interval '1 month'
+        );
+    END LOOP;
+    CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT;
+    INSERT INTO audit_logs SELECT * FROM audit_logs_legacy;
+    PERFORM setval('audit_logs_partitioned_id_seq', (SELECT COALESCE(MAX(id), 0) + 1 FROM audit_logs), false);
+    DROP TABLE audit_logs_legacy;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recordings', '0002_fix_user_field'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION_AUDIT_LOGS_SQL, reverse_sql="SELECT 1;"),
+    ]
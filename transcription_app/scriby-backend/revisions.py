@@ -0,0 +1,133 @@
+"""
+Scriby - Transcript revisions
+Edit history as compact token diffs between versions, with periodic full snapshots
+"""
+
+import difflib
+import logging
+import re
+from typing import TYPE_CHECKING, List, Optional
+
+from django.db import transaction
+
+if TYPE_CHECKING:
+    from .models import TranscriptionRevision
+
+logger = logging.getLogger(__name__)
+
+# Constants
+SNAPSHOT_INTERVAL = 10  # a full snapshot at least every N versions bounds replay
+SNAPSHOT_DIFF_RATIO = 0.5  # ...or whenever a diff would be over half the size of the text
+
+# Words with their trailing whitespace (plus any leading run), so joining gives back the text exactly
+_TOKENS = re.compile(r'\s+|\S+\s*')
+
+Diff = List[list]  # [start token, end token, replacement text], against the previous version
+
+
+class RevisionError(Exception):
+    """Requested transcript version cannot be reconstructed"""
+
+
+def _revisions():
+    from .models import TranscriptionRevision
+
+    return TranscriptionRevision.objects
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKENS.findall(text)
+
+
+def make_diff(old: str, new: str) -> Diff:
+    """Word-level edits turning `old` into `new`."""
+    old_tokens, new_tokens = tokenize(old), tokenize(new)
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    return [
+        [i1, i2, ''.join(new_tokens[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+
+
+def apply_diff(old: str, diff: Diff) -> str:
+    tokens = tokenize(old)
+    # Back to front, so earlier token positions stay valid
+    for start, end, replacement in reversed(diff):
+        tokens[start:end] = [replacement]
+    return ''.join(tokens)
+
+
+def _diff_size(diff: Diff) -> int:
+    return sum(len(replacement) + 16 for _, _, replacement in diff)
+
+
+# =============================================================================
+# RECORDING
+# =============================================================================
+
+def record_revision(transcription, new_text: str, edited_by) -> 'TranscriptionRevision':
+    """
+    Store the next version of a transcription's text. The first edit also
+    stores the original as version 1's snapshot. Callers update the
+    transcription itself in the same transaction.
+
+    The transcription row is locked for the rest of the transaction, so
+    concurrent edits take versions one after the other, and the diff is
+    taken against the stored text rather than a possibly stale instance.
+    """
+    with transaction.atomic():
+        current = type(transcription)._default_manager.select_for_update().only(
+            'text', 'version'
+        ).get(pk=transcription.pk)
+        latest = _revisions().filter(transcription=transcription).order_by('-version').first()
+        if latest is None:
+            latest = _revisions().create(
+                transcription=transcription, version=current.version,
+                snapshot=current.text, edited_by='',
+            )
+
+        version = latest.version + 1
+        diff = make_diff(current.text, new_text)
+        last_snapshot = _revisions().filter(
+            transcription=transcription, is_snapshot=True
+        ).order_by('-version').values_list('version', flat=True).first()
+        if version - last_snapshot >= SNAPSHOT_INTERVAL or _diff_size(diff) > len(new_text) * SNAPSHOT_DIFF_RATIO:
+            return _revisions().create(
+                transcription=transcription, version=version, snapshot=new_text, edited_by=str(edited_by),
+            )
+        return _revisions().create(
+            transcription=transcription, version=version, is_snapshot=False, diff=diff, edited_by=str(edited_by),
+        )
+
+
+def text_at_version(transcription, version: int) -> str:
+    """Text of any stored version: the nearest snapshot at or before it, then diffs forward."""
+    if version == transcription.version:
+        return transcription.text
+    base = _revisions().filter(
+        transcription=transcription, is_snapshot=True, version__lte=version
+    ).order_by('-version').first()
+    if base is None:
+        raise RevisionError(f"Version {version} of transcription {transcription.pk} does not exist")
+
+    text = base.snapshot
+    steps = _revisions().filter(
+        transcription=transcription, version__gt=base.version, version__lte=version
+    ).order_by('version').values_list('version', 'diff')
+    expected = base.version
+    for step_version, diff in steps:
+        expected += 1
+        if step_version != expected:
+            raise RevisionError(f"Version {expected} of transcription {transcription.pk} is missing")
+        text = apply_diff(text, diff)
+    if expected != version:
+        raise RevisionError(f"Version {version} of transcription {transcription.pk} does not exist")
+    return text
+
+
+def revision_history(transcription, limit: Optional[int] = None) -> List[dict]:
+    """Version metadata, newest first, without any text."""
+    rows = _revisions().filter(transcription=transcription).order_by('-version').values(
+        'version', 'edited_by', 'created_at', 'is_snapshot'
+    )
+    return list(rows[:limit] if limit else rows)
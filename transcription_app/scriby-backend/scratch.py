@@ -0,0 +1,291 @@
+"""
+Scriby - Scratch space
+Per-task scratch workspaces on tmpfs where possible, with a per-worker disk budget,
+guaranteed cleanup and an orphan sweeper
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Constants
+# tmpfs first (fast, no disk wear); the disk root takes over when tmpfs is short of space
+SCRATCH_TMPFS_ROOT = getattr(settings, 'SCRATCH_TMPFS_ROOT', '/dev/shm/scriby-scratch')
+SCRATCH_DISK_ROOT = getattr(settings, 'SCRATCH_DISK_ROOT', os.path.join(tempfile.gettempdir(), 'scriby-scratch'))
+SCRATCH_BUDGET_BYTES = getattr(settings, 'SCRATCH_BUDGET_BYTES', 4 * 1024 ** 3)  # per worker process
+SCRATCH_MIN_FREE_BYTES = 256 * 1024 * 1024  # left free on a root for everything else
+SCRATCH_ORPHAN_AGE = getattr(settings, 'SCRATCH_ORPHAN_AGE_SECONDS', 6 * 3600)
+SCRATCH_SWEEP_INTERVAL = getattr(settings, 'SCRATCH_SWEEP_INTERVAL_SECONDS', 15 * 60)
+METRICS_TTL = 3600
+HOSTNAME = socket.gethostname()
+
+
+class ScratchBudgetExceeded(Exception):
+    """Worker would go over its scratch-space budget"""
+
+
+def _roots() -> List[str]:
+    roots = [SCRATCH_DISK_ROOT]
+    if SCRATCH_TMPFS_ROOT and os.path.isdir(os.path.dirname(SCRATCH_TMPFS_ROOT)):
+        roots.insert(0, SCRATCH_TMPFS_ROOT)
+    return roots
+
+
+def _worker_dir(root: str, pid: Optional[int] = None) -> str:
+    return os.path.join(root, f'{HOSTNAME}-{pid or os.getpid()}')
+
+
+def _tree_usage(path: str) -> Tuple[int, int]:
+    """(files, bytes) under a directory."""
+    files = size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+                files += 1
+            except FileNotFoundError:
+                pass
+    return files, size
+
+
+def worker_usage() -> int:
+    """Bytes this worker process currently holds in scratch space."""
+    return sum(_tree_usage(_worker_dir(root))[1] for root in _roots())
+
+
+# =============================================================================
+# WORKSPACES
+# =============================================================================
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+class Workspace:
+    """A private scratch directory; everything in it is removed on exit."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def claim(self, nbytes: int):
+        """Fail early if writing `nbytes` more would exceed the worker's budget."""
+        used = worker_usage()
+        if used + nbytes > SCRATCH_BUDGET_BYTES:
+            raise ScratchBudgetExceeded(
+                f"Scratch budget exceeded: {used} bytes used, {nbytes} more requested, "
+                f"budget {SCRATCH_BUDGET_BYTES}"
+            )
+
+    def path_for(self, suffix: str = '', expected_bytes: int = 0) -> str:
+        """A fresh file path inside the workspace."""
+        if expected_bytes:
+            self.claim(expected_bytes)
+        return os.path.join(self.path, f'{uuid.uuid4().hex}{suffix}')
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _choose_root(expected_bytes: int) -> str:
+    for root in _roots():
+        try:
+            os.makedirs(_worker_dir(root), exist_ok=True)
+            if shutil.disk_usage(root).free >= expected_bytes + SCRATCH_MIN_FREE_BYTES:
+                return root
+        except OSError:
+            continue
+    raise ScratchBudgetExceeded(f"No scratch root has {expected_bytes} bytes free")
+
+
+@contextmanager
+def scratch_workspace(label: str = 'task', expected_bytes: int = 0):
+    """
+    Per-task scratch directory, on tmpfs when it has room for
+    `expected_bytes`. Removed when the block exits however it exits; the
+    worker's signal handlers and the sweeper cover exits that skip this.
+    """
+    root = _choose_root(expected_bytes)
+    workspace = Workspace(os.path.join(_worker_dir(root), f'{label}-{uuid.uuid4().hex[:12]}'))
+    os.makedirs(workspace.path)
+    if expected_bytes:
+        try:
+            workspace.claim(expected_bytes)
+        except ScratchBudgetExceeded:
+            workspace.cleanup()
+            raise
+    with _active_lock:
+        _active.add(workspace)
+    try:
+        yield workspace
+    finally:
+        with _active_lock:
+            _active.discard(workspace)
+        workspace.cleanup()
+
+
+def cleanup_active_workspaces():
+    """Remove every workspace this process still holds."""
+    with _active_lock:
+        workspaces = list(_active)
+        _active.clear()
+    for workspace in workspaces:
+        workspace.cleanup()
+
+
+def install_signal_handlers(signals=(signal.SIGTERM,)):
+    """
+    Clean up scratch space when the worker process is told to stop, then
+    defer to whatever handler was installed before. SIGINT is left alone:
+    prefork children ignore it so a Ctrl-C warm shutdown lets running tasks
+    finish, and cleaning up then would delete their workspaces. Any signal
+    the process ignores stays ignored for the same reason.
+    """
+    for signum in signals:
+        previous = signal.getsignal(signum)
+        if previous == signal.SIG_IGN:
+            continue
+
+        def handler(received, frame, previous=previous):
+            cleanup_active_workspaces()
+            if callable(previous):
+                previous(received, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(received, signal.SIG_DFL)
+                os.kill(os.getpid(), received)
+
+        try:
+            signal.signal(signum, handler)
+        except ValueError:
+            # Not the main thread; atexit and the sweeper still apply
+            logger.debug("Scratch signal handlers not installed outside the main thread")
+            return
+
+
+atexit.register(cleanup_active_workspaces)
+
+
+# =============================================================================
+# ORPHAN SWEEPER
+# =============================================================================
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_orphans() -> Dict[str, int]:
+    """
+    Remove scratch space left behind on this host: directories of worker
+    processes that no longer exist, and workspaces of live workers older
+    than any task may run. Counts feed scratch_metrics().
+    """
+    stats = {'leaked_files': 0, 'leaked_bytes': 0, 'usage_files': 0, 'usage_bytes': 0}
+    cutoff = time.time() - SCRATCH_ORPHAN_AGE
+    prefix = f'{HOSTNAME}-'
+
+    for root in _roots():
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_dir() or not entry.name.startswith(prefix):
+                continue
+            try:
+                pid = int(entry.name[len(prefix):])
+            except ValueError:
+                continue
+            if _process_alive(pid):
+                leftovers = [
+                    workspace.path for workspace in os.scandir(entry.path)
+                    if workspace.is_dir() and workspace.stat().st_mtime < cutoff
+                ]
+            else:
+                leftovers = [entry.path]
+            for path in leftovers:
+                files, size = _tree_usage(path)
+                shutil.rmtree(path, ignore_errors=True)
+                stats['leaked_files'] += files
+                stats['leaked_bytes'] += size
+            if os.path.isdir(entry.path):
+                files, size = _tree_usage(entry.path)
+                stats['usage_files'] += files
+                stats['usage_bytes'] += size
+
+    if stats['leaked_files']:
+        logger.warning(f"Swept {stats['leaked_files']} leaked scratch files ({stats['leaked_bytes']} bytes)")
+    _publish(stats)
+    return stats
+
+
+_sweeper = None
+
+
+def start_sweeper(interval: int = SCRATCH_SWEEP_INTERVAL) -> threading.Thread:
+    """
+    Sweep this host's scratch roots every `interval` seconds from a daemon
+    thread. Started in every worker's main process, so each host is swept
+    however tasks are routed; sweeps are idempotent, so hosts running
+    several workers are simply swept more often.
+    """
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return _sweeper
+
+    def run():
+        while True:
+            try:
+                sweep_orphans()
+            except Exception as e:
+                logger.error(f"Scratch sweep failed: {str(e)}")
+            time.sleep(interval)
+
+    _sweeper = threading.Thread(target=run, name='scratch-sweeper', daemon=True)
+    _sweeper.start()
+    return _sweeper
+
+
+def _publish(stats: Dict[str, int]):
+    try:
+        for key in ('leaked_files', 'leaked_bytes'):
+            if stats[key] and not cache.add(f'scratch:{key}', stats[key], None):
+                cache.incr(f'scratch:{key}', stats[key])
+        cache.set(f'scratch:usage:{HOSTNAME}', {
+            'files': stats['usage_files'], 'bytes': stats['usage_bytes'], 'at': int(time.time()),
+        }, METRICS_TTL)
+        hosts = set(cache.get('scratch:hosts') or ())
+        if HOSTNAME not in hosts:
+            cache.set('scratch:hosts', sorted(hosts | {HOSTNAME}), None)
+    except Exception as e:
+        logger.warning(f"Could not publish scratch metrics: {str(e)}")
+
+
+def scratch_metrics() -> Dict:
+    """Scratch usage per host (as of each host's last sweep) and leaked files swept so far."""
+    hosts = cache.get('scratch:hosts') or []
+    usage = cache.get_many([f'scratch:usage:{host}' for host in hosts])
+    return {
+        'budget_bytes_per_worker': SCRATCH_BUDGET_BYTES,
+        'leaked_files': cache.get('scratch:leaked_files') or 0,
+        'leaked_bytes': cache.get('scratch:leaked_bytes') or 0,
+        'hosts': {host: usage[f'scratch:usage:{host}'] for host in hosts if f'scratch:usage:{host}' in usage},
+    }
@@ -0,0 +1,138 @@
+"""
+Scriby - Full-text search over transcripts and analyses
+Postgres tsvector search with ranking, highlighted snippets and trigram fallback
+"""
+
+import logging
+from typing import Iterable, List, Optional
+
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, TrigramWordSimilarity
+)
+from django.core.cache import cache
+from django.db.models import F, TextField, Value
+from rest_framework import filters
+
+from .models import DEFAULT_SEARCH_CONFIG, Transcription, search_config_for_language
+
+logger = logging.getLogger(__name__)
+
+# Constants
+SEARCH_PARAM = 'search'
+LANGUAGE_PARAM = 'language'
+MIN_QUERY_LENGTH = 2
+CONFIGS_CACHE_KEY = 'search:configs_in_use'
+CONFIGS_CACHE_TTL = 600  # seconds; new configs also invalidate it (see note_search_config)
+TRIGRAM_THRESHOLD = 0.3  # word_similarity cut-off for the fuzzy fallback
+HEADLINE_OPTIONS = {
+    'start_sel': '<mark>',
+    'stop_sel': '</mark>',
+    'max_fragments': 3,
+    'max_words': 35,
+    'min_words': 15,
+    'fragment_delimiter': ' ... ',
+}
+
+
+def build_search_query(query: str, configs: Iterable[str]) -> SearchQuery:
+    """
+    OR together the query parsed with each text search config.
+    Every part is a constant, so Postgres can still use the GIN index; a
+    per-row config (F('search_config')) would force a sequential scan.
+    """
+    combined = None
+    for config in sorted(set(configs)):
+        part = SearchQuery(query, config=config, search_type='websearch')
+        combined = part if combined is None else combined | part
+    return combined
+
+
+def search_configs_in_use() -> List[str]:
+    """
+    Return the text search configs any transcription uses. Analyses and
+    segments inherit their transcription's config, so this covers them too.
+    Cached, so searches do not pay for a DISTINCT scan each time.
+    """
+    configs = cache.get(CONFIGS_CACHE_KEY)
+    if configs is None:
+        configs = sorted(
+            Transcription.objects.order_by().values_list('search_config', flat=True).distinct()
+        ) or [DEFAULT_SEARCH_CONFIG]
+        cache.set(CONFIGS_CACHE_KEY, configs, CONFIGS_CACHE_TTL)
+    return configs
+
+
+def note_search_config(config: str):
+    """Drop the cached config list when a transcription starts using a new config."""
+    configs = cache.get(CONFIGS_CACHE_KEY)
+    if configs is not None and config not in configs:
+        cache.delete(CONFIGS_CACHE_KEY)
+
+
+def search_configs_for(language: Optional[str] = None) -> List[str]:
+    """Return the search configs to parse a query with."""
+    if language:
+        return [search_config_for_language(language)]
+    return search_configs_in_use()
+
+
+def full_text_search(queryset, query: str, field: str = 'text',
+                     config_field: str = 'search_config', language: Optional[str] = None):
+    """
+    Rank rows of `queryset` against `query` using the GIN-indexed search_vector.
+    Falls back to trigram word similarity on `field` when nothing matches, so
+    typos and partial words still return results.
+    """
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return queryset.none()
+
+    search_query = build_search_query(query, search_configs_for(language))
+    headline = SearchHeadline(field, search_query, config=F(config_field), **HEADLINE_OPTIONS)
+
+    matches = queryset.filter(search_vector=search_query).annotate(
+        search_rank=SearchRank(F('search_vector'), search_query),
+        search_headline=headline,
+    ).order_by('-search_rank')
+
+    if matches.exists():
+        return matches
+
+    logger.debug(f"No full-text match for {query!r}, using trigram fallback")
+    return queryset.filter(**{f'{field}__trigram_word_similar': query}).annotate(
+        search_rank=TrigramWordSimilarity(query, field),
+        search_headline=Value(None, output_field=TextField()),
+    ).filter(search_rank__gte=TRIGRAM_THRESHOLD).order_by('-search_rank')
+
+
+def search_transcriptions(queryset, query: str, language: Optional[str] = None):
+    """Full-text search over Transcription.text."""
+    return full_text_search(queryset, query, field='text', language=language)
+
+
+def search_analyses(queryset, query: str, language: Optional[str] = None):
+    """Full-text search over Analysis.content."""
+    return full_text_search(queryset, query, field='content', language=language)
+
+
+def search_segments(queryset, query: str, language: Optional[str] = None):
+    """Full-text search over TranscriptSegment.text, best hits first."""
+    return full_text_search(
+        queryset, query, field='text',
+        config_field='transcription__search_config', language=language
+    )
+
+
+class FullTextSearchFilter(filters.BaseFilterBackend):
+    """
+    Drop-in replacement for SearchFilter backed by the tsvector index.
+    The view declares `search_document_field` (e.g. 'text' or 'content').
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(SEARCH_PARAM)
+        if not query:
+            return queryset
+        field = getattr(view, 'search_document_field', 'text')
+        language = request.query_params.get(LANGUAGE_PARAM)
+        return full_text_search(queryset, query, field=field, language=language)
@@ -0,0 +1,326 @@
+"""
+Scriby - Semantic search over transcript segments
+Local CPU embeddings stored in a per-tenant, file-backed float16 vector index
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Constants
+EMBEDDING_MODEL = getattr(settings, 'SEMANTIC_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_BATCH_SIZE = 64
+INDEX_ROOT = Path(getattr(settings, 'SEMANTIC_INDEX_ROOT', Path(settings.BASE_DIR) / 'vector_index'))
+TRAIN_THRESHOLD = 20_000  # below this many vectors an exact scan is fast enough
+RETRAIN_GROWTH = 4  # retrain centroids once the index grows 4x past the last training
+NPROBE = 16  # inverted lists scanned per query
+SCAN_CHUNK_ROWS = 65_536
+OWNER_KEY_MASK = (1 << 63) - 1
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Load the sentence embedding model once per process."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+    return _model
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """Return L2-normalized float32 embeddings, one row per text."""
+    model = get_embedding_model()
+    vectors = model.encode(
+        list(texts),
+        batch_size=EMBEDDING_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def owner_key(transcription_id) -> int:
+    """Map a transcription UUID to the non-negative int64 stored per index row."""
+    return uuid.UUID(str(transcription_id)).int & OWNER_KEY_MASK
+
+
+class VectorIndex:
+    """
+    Append-only vector index for one tenant.
+
+    Layout under INDEX_ROOT/<tenant>/:
+      vectors.f16   row-major float16 matrix (n x dim)
+      ids.i64       segment primary keys, parallel to vectors (-1 once tombstoned)
+      owners.i64    owner_key() of the transcription each row belongs to
+      lists.i32     inverted list assignment per row (-1 until trained)
+      centroids.npy float32 IVF centroids
+      meta.json     dim and training bookkeeping
+
+    Queries scan the NPROBE nearest inverted lists (or everything when the
+    index is still small), so cost stays bounded as the tenant grows.
+    Vectors are unit-length, so inner product equals cosine similarity.
+    Re-indexing a transcription tombstones its old rows in place rather than
+    rewriting the files, and ids already present are never appended twice.
+    """
+
+    def __init__(self, tenant_id, root: Path = None):
+        self.path = Path(root or INDEX_ROOT) / str(tenant_id)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.path / 'meta.json'
+        self.vectors_path = self.path / 'vectors.f16'
+        self.ids_path = self.path / 'ids.i64'
+        self.owners_path = self.path / 'owners.i64'
+        self.lists_path = self.path / 'lists.i32'
+        self.centroids_path = self.path / 'centroids.npy'
+
+    # ------------------------------------------------------------------
+    # Bookkeeping
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path / '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> dict:
+        if not self.meta_path.exists():
+            return {}
+        return json.loads(self.meta_path.read_text())
+
+    def _write_meta(self, meta: dict):
+        tmp_path = self.meta_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self.meta_path)
+
+    def __len__(self) -> int:
+        return self.ids_path.stat().st_size // 8 if self.ids_path.exists() else 0
+
+    def _load(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray]]:
+        count = len(self)
+        meta = self._read_meta()
+        if not count or not meta:
+            return None, None, None
+        vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(count, meta['dim']))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(count,))
+        lists = np.memmap(self.lists_path, dtype=np.int32, mode='r', shape=(count,))
+        return vectors, ids, lists
+
+    def _centroids(self) -> Optional[np.ndarray]:
+        if not self.centroids_path.exists():
+            return None
+        return np.load(self.centroids_path)
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray, owner: int = 0):
+        """
+        Append vectors for the given segment ids, owned by `owner` (see
+        owner_key). Ids that are already live in the index are skipped, so a
+        retried task does not add duplicates.
+        """
+        if not len(ids):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._locked():
+            meta = self._read_meta()
+            dim = meta.setdefault('dim', vectors.shape[1])
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Expected {dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            count = len(self)
+            existing = np.fromfile(self.ids_path, dtype=np.int64, count=count) if count else ids[:0]
+            _, first = np.unique(ids, return_index=True)
+            keep = np.sort(first)
+            keep = keep[~np.isin(ids[keep], existing[existing >= 0])]
+            if not len(keep):
+                return
+            ids, vectors = ids[keep], vectors[keep]
+
+            centroids = self._centroids()
+            if centroids is not None:
+                assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+            else:
+                assignments = np.full(len(ids), -1, dtype=np.int32)
+
+            # Drop rows a crashed writer left behind without a matching id, and
+            # give rows indexed before owners were tracked an owner of 0
+            for path, row_bytes in ((self.vectors_path, dim * 2), (self.lists_path, 4), (self.owners_path, 8)):
+                if path.exists() and path.stat().st_size > count * row_bytes:
+                    os.truncate(path, count * row_bytes)
+            missing_owners = count - (self.owners_path.stat().st_size // 8 if self.owners_path.exists() else 0)
+            owners = np.concatenate([
+                np.zeros(missing_owners, dtype=np.int64), np.full(len(ids), owner, dtype=np.int64)
+            ])
+
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(self.lists_path, 'ab') as f:
+                f.write(assignments.tobytes())
+            with open(self.owners_path, 'ab') as f:
+                f.write(owners.tobytes())
+            # ids last: its length defines how many rows are visible to readers
+            with open(self.ids_path, 'ab') as f:
+                f.write(ids.tobytes())
+            self._write_meta(meta)
+
+    def remove_owner(self, owner: int) -> int:
+        """Tombstone every live row belonging to `owner`; returns how many."""
+        with self._locked():
+            count = len(self)
+            if not count or not self.owners_path.exists():
+                return 0
+            owners = np.fromfile(self.owners_path, dtype=np.int64, count=count)
+            ids = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(count,))
+            rows = np.flatnonzero((owners[:len(ids)] == owner) & (ids[:len(owners)] >= 0))
+            if len(rows):
+                ids[rows] = -1
+                ids.flush()
+            del ids
+            return len(rows)
+
+    def needs_training(self) -> bool:
+        count = len(self)
+        trained_at = self._read_meta().get('trained_at', 0)
+        if count < TRAIN_THRESHOLD:
+            return False
+        return not trained_at or count >= trained_at * RETRAIN_GROWTH
+
+    def train(self, iterations: int = 10, sample_size: int = 100_000):
+        """(Re)train IVF centroids with spherical k-means and reassign all rows."""
+        with self._locked():
+            vectors, ids, _ = self._load()
+            if vectors is None:
+                return
+            count = len(vectors)
+            live = np.flatnonzero(np.asarray(ids) >= 0)
+            if not len(live):
+                return
+            nlist = max(1, min(4096, int(np.sqrt(len(live)))))
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False))]
+            sample = np.asarray(sample, dtype=np.float32)
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for list_no in range(nlist):
+                    members = sample[labels == list_no]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        centroids[list_no] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+            assignments = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SCAN_CHUNK_ROWS):
+                chunk = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+                assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+            np.save(self.centroids_path, centroids.astype(np.float32))
+            tmp_path = self.lists_path.with_suffix('.tmp')
+            assignments.tofile(tmp_path)
+            os.replace(tmp_path, self.lists_path)
+            meta = self._read_meta()
+            meta.update({'trained_at': count, 'nlist': nlist})
+            self._write_meta(meta)
+            logger.info(f"Trained vector index {self.path.name}: {count} vectors, {nlist} lists")
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int = NPROBE) -> List[Tuple[int, float]]:
+        """Return up to k (segment_id, score) pairs, best first."""
+        vectors, ids, lists = self._load()
+        if vectors is None:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        centroids = self._centroids()
+
+        if centroids is not None:
+            probes = np.argsort(centroids @ query)[-nprobe:]
+            # Untrained tail rows (-1) are always scanned so fresh inserts are searchable
+            candidates = np.flatnonzero((np.isin(lists, probes) | (lists < 0)) & (ids >= 0))
+        else:
+            candidates = None
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        total = len(candidates) if candidates is not None else len(vectors)
+        for start in range(0, total, SCAN_CHUNK_ROWS):
+            if candidates is not None:
+                rows = candidates[start:start + SCAN_CHUNK_ROWS]
+                chunk = vectors[rows]
+            else:
+                rows = np.arange(start, min(start + SCAN_CHUNK_ROWS, total))
+                chunk = vectors[start:start + SCAN_CHUNK_ROWS]
+            scores = np.asarray(chunk, dtype=np.float32) @ query
+            scores[ids[rows] < 0] = -np.inf  # tombstoned rows
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, rows])
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+
+        order = np.argsort(best_scores)[::-1][:k]
+        return [
+            (int(ids[best_rows[i]]), float(best_scores[i]))
+            for i in order if np.isfinite(best_scores[i])
+        ]
+
+
+def index_transcription_segments(transcription) -> int:
+    """
+    Embed a transcription's segments into the tenant index, replacing any
+    vectors indexed for it before (replace_segments issues new segment ids).
+    """
+    segments = list(transcription.segments.order_by('index').values_list('id', 'text'))
+    index = VectorIndex(transcription.recording.user_id)
+    owner = owner_key(transcription.pk)
+    index.remove_owner(owner)
+    for start in range(0, len(segments), EMBEDDING_BATCH_SIZE * 8):
+        batch = segments[start:start + EMBEDDING_BATCH_SIZE * 8]
+        index.add([pk for pk, _ in batch], embed_texts([text for _, text in batch]), owner=owner)
+    return len(segments)
+
+
+def semantic_search(user, query: str, k: int = 10):
+    """Return the user's top-k TranscriptSegments for `query` with scores."""
+    from .models import TranscriptSegment
+
+    hits = VectorIndex(user.pk).search(embed_texts([query])[0], k=k)
+    if not hits:
+        return []
+    segments = TranscriptSegment.objects.filter(
+        id__in=[pk for pk, _ in hits], recording__user=user
+    ).in_bulk()
+    results = []
+    for pk, score in hits:
+        # Segments replaced by a re-transcription leave stale ids behind
+        if pk in segments:
+            segment = segments[pk]
+            segment.semantic_score = score
+            results.append(segment)
+    return results
@@ -8,6 +8,7 @@ Tech Stack: Django REST Framework, JWT Authentication, File Upload
 """
 
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
@@ -20,7 +21,8 @@ import os
 
 from .models import (
     User, UserProfile, SubscriptionPlan, Recording, Transcription, 
-    Analysis, UsageMetrics, BillingTransaction, AuditLog
+    TranscriptSegment, Analysis, UsageMetrics, BillingTransaction, AuditLog,
+    BulkExportJob, UploadSession
 )
 
 
@@ -242,22 +244,21 @@ class RecordingUploadSerializer(serializers.ModelSerializer):
         ]
 
     def validate_audio_file(self, value):
-        """Validate audio file format, size, and duration."""
-        # Check file size (max from user profile or default 100MB)
+        """Validate audio file format and size."""
+        from .upload_handlers import AUDIO_CONTENT_TYPES, max_upload_bytes
+
+        # AudioUploadHandler has normally rejected oversized or non-audio uploads already
         user = self.context['request'].user
-        max_size_mb = user.profile.max_file_size_mb if hasattr(user, 'profile') else 100
-        max_size_bytes = max_size_mb * 1024 * 1024
+        max_size_bytes = max_upload_bytes(user)
         
         if value.size > max_size_bytes:
             raise serializers.ValidationError(
-                f'File size cannot exceed {max_size_mb}MB. Current size: {value.size / (1024*1024):.1f}MB'
+                f'File size cannot exceed {max_size_bytes // (1024*1024)}MB. Current size: {value.size / (1024*1024):.1f}MB'
             )
         
-        # Check file format
-        allowed_formats = ['audio/mpeg', 'audio/wav', 'audio/mp4', 'audio/flac', 'audio/ogg']
-        content_type = value.content_type
-        
-        if content_type not in allowed_formats:
+        # Prefer the format sniffed from the file's bytes over the client's claim
+        content_type = getattr(value, 'sniffed_content_type', None) or value.content_type
+        if content_type not in AUDIO_CONTENT_TYPES.values():
             raise serializers.ValidationError(
                 f'Unsupported file format: {content_type}. Allowed formats: MP3, WAV, M4A, FLAC, OGG'
             )
@@ -275,12 +276,15 @@ class RecordingUploadSerializer(serializers.ModelSerializer):
             'mp3': 'mp3', 'wav': 'wav', 'm4a': 'm4a', 
             'flac': 'flac', 'ogg': 'ogg'
         }
+        header = getattr(audio_file, 'audio_header', {})
         
         recording = Recording.objects.create(
             user=user,
             original_filename=audio_file.name,
-            file_format=format_mapping.get(file_extension, 'mp3'),
+            file_format=getattr(audio_file, 'audio_format', None) or format_mapping.get(file_extension, 'mp3'),
             file_size_bytes=audio_file.size,
+            sample_rate=header.get('sample_rate'),
+            channels=header.get('channels'),
             status='uploaded',
             **validated_data
         )
@@ -297,6 +301,7 @@ class RecordingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     duration_formatted = serializers.CharField(read_only=True)
     file_size_mb = serializers.FloatField(read_only=True)
     user_name = serializers.CharField(source='user.full_name', read_only=True)
+    waveform_version = serializers.SerializerMethodField()
     
     class Meta:
         model = Recording
@@ -305,13 +310,19 @@ class RecordingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
             'file_size_bytes', 'file_size_mb', 'audio_file', 'original_filename',
             'file_format', 'sample_rate', 'channels', 'bitrate', 'status',
             'language', 'tags', 'user_name', 'transcription', 'analyses',
-            'created_at', 'updated_at'
+            'waveform_version', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'file_size_bytes', 'sample_rate', 'channels', 'bitrate',
             'original_filename', 'file_format', 'created_at', 'updated_at'
         ]
 
+    def get_waveform_version(self, obj):
+        """Pass as `v` to the waveform endpoint to get a long-cached response."""
+        from .waveforms import waveform_version
+
+        return waveform_version(obj)
+
     def get_transcription(self, obj):
         """Get transcription data if available."""
         try:
@@ -355,6 +366,9 @@ class TranscriptionSerializer(serializers.ModelSerializer):
     confidence_percentage = serializers.FloatField(read_only=True)
     word_count = serializers.IntegerField(read_only=True)
     recording_title = serializers.CharField(source='recording.title', read_only=True)
+    search_rank = serializers.FloatField(read_only=True, required=False)
+    search_headline = serializers.CharField(read_only=True, required=False)
+    has_word_timings = serializers.SerializerMethodField()
     
     class Meta:
         model = Transcription
@@ -363,14 +377,18 @@ class TranscriptionSerializer(serializers.ModelSerializer):
             'confidence_percentage', 'word_count', 'srt_format', 'vtt_format',
             'json_format', 'processing_time_seconds', 'api_provider', 'model_version',
             'speakers_detected', 'speaker_labels', 'version', 'is_manually_edited',
-            'edit_history', 'status', 'created_at', 'updated_at'
+            'status', 'search_rank', 'search_headline',
+            'has_word_timings', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'confidence_score', 'processing_time_seconds', 'api_provider',
             'model_version', 'speakers_detected', 'speaker_labels', 'version',
-            'edit_history', 'created_at', 'updated_at'
+            'created_at', 'updated_at'
         ]
 
+    def get_has_word_timings(self, obj):
+        return bool(obj.word_timings_file)
+
     def update(self, instance, validated_data):
         """Handle manual text edits with version control."""
         if 'text' in validated_data and validated_data['text'] != instance.text:
@@ -382,6 +400,24 @@ class TranscriptionSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class TranscriptSegmentSerializer(serializers.ModelSerializer):
+    """
+    Timestamped segment search hit, enough for a client to seek the audio.
+    """
+    recording_id = serializers.UUIDField(read_only=True)
+    transcription_id = serializers.UUIDField(read_only=True)
+    search_rank = serializers.FloatField(read_only=True, required=False)
+    search_headline = serializers.CharField(read_only=True, required=False)
+    
+    class Meta:
+        model = TranscriptSegment
+        fields = [
+            'recording_id', 'transcription_id', 'index', 'start', 'end',
+            'speaker', 'text', 'confidence', 'search_rank', 'search_headline'
+        ]
+        read_only_fields = fields
+
+
 class AnalysisSerializer(serializers.ModelSerializer):
     """
     Analysis serializer with AI processing details and confidence metrics.
@@ -389,6 +425,8 @@ class AnalysisSerializer(serializers.ModelSerializer):
     confidence_percentage = serializers.FloatField(read_only=True)
     sentiment_label = serializers.CharField(read_only=True)
     transcription_title = serializers.CharField(source='transcription.recording.title', read_only=True)
+    search_rank = serializers.FloatField(read_only=True, required=False)
+    search_headline = serializers.CharField(read_only=True, required=False)
     
     class Meta:
         model = Analysis
@@ -397,7 +435,7 @@ class AnalysisSerializer(serializers.ModelSerializer):
             'structured_data', 'confidence_score', 'confidence_percentage',
             'ai_provider', 'model_version', 'processing_time_seconds', 'tokens_used',
             'sentiment_score', 'sentiment_label', 'emotions', 'template_used',
-            'custom_parameters', 'created_at', 'updated_at'
+            'custom_parameters', 'search_rank', 'search_headline', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'confidence_score', 'ai_provider', 'model_version',
@@ -500,6 +538,137 @@ class BulkRecordingDeleteSerializer(serializers.Serializer):
         return value
 
 
+class BulkExportJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for bulk export jobs; `filters` takes RecordingViewSet query parameters.
+    """
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BulkExportJob
+        fields = [
+            'id', 'filters', 'formats', 'include_analyses', 'status',
+            'recordings_count', 'archive_size_bytes', 'archive_sha256',
+            'error_message', 'download_url', 'completed_at', 'expires_at', 'created_at'
+        ]
+        read_only_fields = [
+            'id', 'status', 'recordings_count', 'archive_size_bytes', 'archive_sha256',
+            'error_message', 'completed_at', 'expires_at', 'created_at'
+        ]
+
+    def validate_formats(self, value):
+        """Require at least one known format whose renderer is installed."""
+        from .exports import EXPORT_FORMATS, ExportError, ensure_format_available
+
+        formats = list(dict.fromkeys(value or []))
+        if not formats:
+            raise serializers.ValidationError(_("Select at least one export format."))
+        unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+        if unknown:
+            raise serializers.ValidationError(f"Unsupported export formats: {unknown}")
+        for fmt in formats:
+            try:
+                ensure_format_available(fmt)
+            except ExportError as e:
+                raise serializers.ValidationError(str(e))
+        return formats
+
+    def validate_filters(self, value):
+        """Validate filters with the same filterset the recordings list uses."""
+        from .filters import RecordingFilter
+
+        if not isinstance(value, dict):
+            raise serializers.ValidationError(_("Filters must be an object."))
+        filterset = RecordingFilter(value, queryset=Recording.objects.none())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        unknown = set(value) - set(filterset.filters)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown filters: {sorted(unknown)}")
+        return value
+
+    def get_download_url(self, obj):
+        if not obj.is_downloadable:
+            return None
+        return reverse(
+            'bulk-export-download', kwargs={'pk': obj.pk}, request=self.context.get('request')
+        )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Resumable upload session. Creating one declares the file; chunks are then
+    sent to the append endpoint and the recording created on complete. With
+    `direct`, the response carries a presigned `upload` request that sends the
+    file straight to object storage instead.
+    """
+    direct = serializers.BooleanField(default=False, write_only=True)
+    upload = serializers.SerializerMethodField()
+    title = serializers.CharField(max_length=255, required=False, write_only=True)
+    description = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    language = serializers.CharField(max_length=10, required=False, write_only=True)
+    tags = serializers.ListField(child=serializers.CharField(), required=False, write_only=True)
+    recording_id = serializers.UUIDField(source='recording.id', read_only=True, default=None)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'content_type', 'total_size', 'sha256', 'offset',
+            'chunks_received', 'status', 'expires_at', 'recording_id', 'created_at',
+            'direct', 'upload', 'title', 'description', 'language', 'tags'
+        ]
+        read_only_fields = ['id', 'offset', 'chunks_received', 'status', 'expires_at', 'created_at']
+
+    def get_upload(self, obj):
+        # Only returned when the session is created; presigned URLs are not stored
+        return getattr(obj, 'upload', None)
+
+    def validate_content_type(self, value):
+        from .uploads import ALLOWED_CONTENT_TYPES
+
+        if value not in ALLOWED_CONTENT_TYPES:
+            raise serializers.ValidationError(
+                f'Unsupported file format: {value}. Allowed formats: MP3, WAV, M4A, FLAC, OGG'
+            )
+        return value
+
+    def validate_sha256(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdefABCDEF' for c in value)):
+            raise serializers.ValidationError(_("Expected a hex-encoded SHA-256 digest."))
+        return value
+
+    def validate_total_size(self, value):
+        """Apply the same size limit as single-request uploads."""
+        from .upload_handlers import max_upload_bytes
+
+        max_size_bytes = max_upload_bytes(self.context['request'].user)
+        if value <= 0 or value > max_size_bytes:
+            raise serializers.ValidationError(
+                f'File size must be between 1 byte and {max_size_bytes // (1024 * 1024)}MB'
+            )
+        return value
+
+    def create(self, validated_data):
+        from .uploads import UploadError, initiate_direct_upload, initiate_upload
+
+        metadata = {
+            key: validated_data.pop(key)
+            for key in ('title', 'description', 'language', 'tags') if key in validated_data
+        }
+        initiate = initiate_direct_upload if validated_data.pop('direct') else initiate_upload
+        try:
+            return initiate(
+                self.context['request'].user,
+                filename=validated_data['filename'],
+                content_type=validated_data['content_type'],
+                total_size=validated_data['total_size'],
+                sha256=validated_data.get('sha256', ''),
+                metadata=metadata,
+            )
+        except UploadError as e:
+            raise serializers.ValidationError({'direct': str(e)})
+
+
 # API Response serializers
 class APIResponseSerializer(serializers.Serializer):
     """
@@ -546,3 +715,8 @@ class SystemStatsSerializer(serializers.Serializer):
     total_revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
     avg_processing_time = serializers.FloatField()
     system_uptime = serializers.CharField()
+    cache_metrics = serializers.DictField(
+        child=serializers.DictField(child=serializers.IntegerField()), required=False
+    )
+    storage = serializers.DictField(child=serializers.IntegerField(), required=False)
+    scratch = serializers.DictField(required=False)
@@ -0,0 +1,279 @@
+"""
+Scriby - Object storage
+S3-compatible audio storage with presigned direct uploads and ranged streaming reads
+"""
+
+import base64
+import io
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+# Constants
+AUDIO_STORAGE_BACKEND = getattr(settings, 'AUDIO_STORAGE_BACKEND', 'local')  # 'local' or 's3'
+PRESIGNED_URL_EXPIRY = getattr(settings, 'AWS_PRESIGNED_URL_EXPIRY', 3600)  # seconds
+RANGE_READ_SIZE = 8 * 1024 * 1024  # bytes fetched per ranged GET
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# Cold tier for archived recordings: a bucket prefix in an infrequent-access
+# storage class on S3, or a separate (cheaper, slower) root on local disk
+COLD_STORAGE_PREFIX = getattr(settings, 'COLD_STORAGE_PREFIX', 'cold')
+COLD_STORAGE_CLASS = getattr(settings, 'COLD_STORAGE_CLASS', 'GLACIER_IR')  # instant retrieval
+COLD_STORAGE_ROOT = getattr(settings, 'COLD_STORAGE_ROOT', os.path.join(str(settings.BASE_DIR), 'cold_storage'))
+
+
+class StorageError(Exception):
+    """Object storage request failed"""
+
+
+# =============================================================================
+# RANGED READS
+# =============================================================================
+
+class RangedObjectReader(io.RawIOBase):
+    """
+    Seekable read-only view of an object that fetches bytes with ranged
+    GETs, so callers stream or seek into audio without downloading it all.
+    Wrap in io.BufferedReader (as S3Storage._open does) to batch small reads.
+    """
+
+    def __init__(self, client, bucket: str, key: str, size: int):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self.position = max(self.position, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or not len(buffer):
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{end}'
+        )
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+# =============================================================================
+# S3 STORAGE
+# =============================================================================
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Django storage on an S3-compatible bucket (AWS S3, MinIO). Objects are
+    opened as ranged readers rather than downloaded, and there is no local
+    path: code that needs one uses local_audio_copy().
+    """
+
+    def __init__(self, bucket: Optional[str] = None, endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, location: str = '', storage_class: Optional[str] = None):
+        self.bucket = bucket or getattr(settings, 'AWS_STORAGE_BUCKET_NAME', 'scriby-audio')
+        self.endpoint_url = endpoint_url or getattr(settings, 'AWS_S3_ENDPOINT_URL', None)
+        self.region = region or getattr(settings, 'AWS_S3_REGION_NAME', None)
+        self.location = location.strip('/')
+        self.storage_class = storage_class
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+                aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+                config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}),
+            )
+        return self._client
+
+    def _key(self, name: str) -> str:
+        name = name.replace('\\', '/').lstrip('/')
+        return f'{self.location}/{name}' if self.location else name
+
+    def _head(self, name: str) -> Optional[Dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise StorageError(f"Could not read {name}: {str(e)}") from e
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError("S3Storage files are read-only; use save()")
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        reader = RangedObjectReader(self.client, self.bucket, self._key(name), head['ContentLength'])
+        return File(io.BufferedReader(reader, buffer_size=RANGE_READ_SIZE), name=name)
+
+    def _save(self, name, content):
+        from boto3.s3.transfer import TransferConfig
+
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        extra = {'ContentType': content_type} if content_type else {}
+        if self.storage_class:
+            extra['StorageClass'] = self.storage_class
+        self.client.upload_fileobj(
+            content, self.bucket, self._key(name), ExtraArgs=extra,
+            Config=TransferConfig(multipart_threshold=MULTIPART_THRESHOLD),
+        )
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def get_modified_time(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['LastModified']
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(name)},
+            ExpiresIn=PRESIGNED_URL_EXPIRY,
+        )
+
+    def read_range(self, name: str, start: int, length: int) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(name), Range=f'bytes={start}-{start + length - 1}'
+        )
+        return response['Body'].read()
+
+    def presigned_post(self, name: str, content_type: str, size: int, sha256: str = '',
+                       expires: int = PRESIGNED_URL_EXPIRY) -> Dict:
+        """
+        URL and form fields a client uses to POST the object directly. The
+        policy binds the exact size (a presigned PUT cannot), so the store
+        refuses any other body; with a SHA-256 it also rejects one that does
+        not match it.
+        """
+        fields = {'Content-Type': content_type}
+        conditions = [{'Content-Type': content_type}, ['content-length-range', size, size]]
+        if sha256:
+            checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+            fields['x-amz-checksum-sha256'] = checksum
+            conditions.append({'x-amz-checksum-sha256': checksum})
+        post = self.client.generate_presigned_post(
+            self.bucket, self._key(name), Fields=fields, Conditions=conditions, ExpiresIn=expires
+        )
+        return {'url': post['url'], 'method': 'POST', 'fields': post['fields']}
+
+
+def audio_storage():
+    """Storage for recording audio, chosen by AUDIO_STORAGE_BACKEND."""
+    if AUDIO_STORAGE_BACKEND == 's3':
+        return S3Storage()
+    return default_storage
+
+
+def cold_storage():
+    """Storage for archived recordings moved off the hot tier (see lifecycle.py)."""
+    if AUDIO_STORAGE_BACKEND == 's3':
+        return S3Storage(location=COLD_STORAGE_PREFIX, storage_class=COLD_STORAGE_CLASS)
+    return FileSystemStorage(location=COLD_STORAGE_ROOT)
+
+
+def supports_direct_upload(storage) -> bool:
+    return hasattr(storage, 'presigned_post')
+
+
+# =============================================================================
+# WORKER ACCESS
+# =============================================================================
+
+def read_header(field_file, length: int = 64 * 1024) -> bytes:
+    """Leading bytes of a stored file, fetched with a single ranged read."""
+    storage = field_file.storage
+    if hasattr(storage, 'read_range'):
+        return storage.read_range(field_file.name, 0, length)
+    with storage.open(field_file.name, 'rb') as f:
+        return f.read(length)
+
+
+@contextmanager
+def local_audio_copy(field_file, workspace=None):
+    """
+    Yield a local filesystem path for a stored file. Local storage hands out
+    its own path; remote objects are streamed down in ranged reads to a
+    temporary file (in `workspace`, a scratch.Workspace, when given, counted
+    against its budget) that is removed afterwards.
+    """
+    storage = field_file.storage
+    try:
+        path = storage.path(field_file.name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    suffix = os.path.splitext(field_file.name)[1]
+    if workspace is not None:
+        temp_path = workspace.path_for(suffix, expected_bytes=storage.size(field_file.name))
+        handle = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    else:
+        handle, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(handle, 'wb') as target, storage.open(field_file.name, 'rb') as source:
+            shutil.copyfileobj(source, target, RANGE_READ_SIZE)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,164 @@
+"""
+Scriby - HTTP streaming helpers
+Byte-range and conditional file responses so large downloads can be resumed and seeked,
+optionally handed off to the front-end server or object store
+"""
+
+import logging
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+logger = logging.getLogger(__name__)
+
+# Constants
+STREAM_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Let the front-end server send local files: 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache, lighttpd). The nginx location must be `internal` and alias the storage root.
+STREAMING_OFFLOAD = getattr(settings, 'STREAMING_OFFLOAD', None)
+STREAMING_ACCEL_PREFIX = getattr(settings, 'STREAMING_ACCEL_PREFIX', '/protected-media/')
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range` header into an inclusive (start, end) pair.
+    Returns None when the header is absent or unusable (serve the full body)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multi-range or malformed: ignore per RFC 9110
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def conditional_response(request, etag: Optional[str] = None, last_modified=None):
+    """304 Not Modified / 412 Precondition Failed for a satisfied conditional request, else None."""
+    response = get_conditional_response(
+        request,
+        etag=f'"{etag}"' if etag else None,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None and etag:
+        response['ETag'] = f'"{etag}"'
+    return response
+
+
+def _validators(response, etag: Optional[str], last_modified, filename: Optional[str]):
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = f'"{etag}"'
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+
+def iter_file_range(fileobj, start: int, length: int, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield `length` bytes of `fileobj` starting at `start`, then close it."""
+    try:
+        fileobj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fileobj.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def ranged_file_response(request, fileobj, size: int, content_type: str,
+                         filename: Optional[str] = None, etag: Optional[str] = None,
+                         last_modified=None):
+    """
+    Stream an open file honouring Range/If-Range, so interrupted downloads
+    resume where they stopped instead of starting over.
+    """
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        fileobj.close()
+        return not_modified
+
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and etag and if_range.strip('"') != etag:
+        range_header = None  # the client's partial copy is stale
+
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+
+    length = max(end - start + 1, 0)
+    response = StreamingHttpResponse(
+        iter_file_range(fileobj, start, length), status=status_code, content_type=content_type
+    )
+    response['Content-Length'] = str(length)
+    if status_code == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    _validators(response, etag, last_modified, filename)
+    return response
+
+
+def offloaded_file_response(request, storage, name: str, content_type: str,
+                            filename: Optional[str] = None, etag: Optional[str] = None,
+                            last_modified=None):
+    """
+    Respond without copying the file through Python: an X-Accel-Redirect or
+    X-Sendfile header for local files when STREAMING_OFFLOAD is set, or a
+    redirect to a presigned URL for object storage (which serves ranges
+    itself). Returns None when the file has to be streamed by the worker.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+
+    if path is None:
+        if not hasattr(storage, 'presigned_post'):
+            return None
+        return HttpResponseRedirect(storage.url(name))
+    if STREAMING_OFFLOAD not in ('x-accel-redirect', 'x-sendfile'):
+        return None
+
+    not_modified = conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    # The front-end server fills in the body, Content-Length and Range handling
+    response = HttpResponse(content_type=content_type)
+    if STREAMING_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = STREAMING_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    _validators(response, etag, last_modified, filename)
+    return response
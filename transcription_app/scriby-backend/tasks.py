@@ -11,12 +11,14 @@ import tempfile
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 import openai
 from celery import shared_task, current_task
 from celery.exceptions import Retry, MaxRetriesExceededError
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready
 from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
@@ -41,6 +43,14 @@ from .models import (
     Recording, Transcription, Analysis, User, Subscription,
     UsageMetrics, BillingRecord, NotificationTemplate
 )
+from .quota import commit_quota, minutes_for, release_quota, reserve_quota
+from .diarization import assign_speakers, diarize_file, speaker_labels
+from .lifecycle import discard_processed_audio, ensure_hot
+from .scratch import cleanup_active_workspaces, install_signal_handlers, scratch_workspace, start_sweeper
+from .storage import local_audio_copy
+from .usage import UsageMeter, record_usage_event
+from .waveforms import store_waveform
+from .word_timings import store_word_timings
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -75,6 +85,11 @@ class AnalysisError(TaskError):
     pass
 
 
+class QuotaExceededError(TaskError):
+    """Raised when a user's plan has no room left for the work"""
+    pass
+
+
 def update_task_progress(progress: int, message: str = ""):
     """Update task progress with detailed status"""
     if current_task:
@@ -114,32 +129,44 @@ def process_audio_file(self, recording_id: int) -> Dict[str, Any]:
         
         logger.info(f"Processing audio file for recording {recording_id}")
         
-        # Step 1: File validation and format detection
-        update_task_progress(10, "Validating audio file...")
-        audio_info = validate_audio_file(recording.audio_file.path)
-        
-        # Step 2: Format conversion if needed
-        update_task_progress(25, "Converting audio format...")
-        processed_path = convert_audio_format(recording.audio_file.path, target_format='wav')
-        
-        # Step 3: Audio enhancement
-        update_task_progress(50, "Enhancing audio quality...")
-        enhanced_path = enhance_audio_quality(processed_path)
-        
-        # Step 4: Metadata extraction
-        update_task_progress(75, "Extracting metadata...")
-        metadata = extract_audio_metadata(enhanced_path)
-        
-        # Step 5: Update recording with processed data
-        update_task_progress(90, "Saving processed audio...")
-        
-        # Save enhanced audio file
-        with open(enhanced_path, 'rb') as f:
-            recording.processed_audio_file.save(
-                f"processed_{recording.id}.wav",
-                f,
-                save=True
-            )
+        # Audio may live in object storage (or the cold tier): work on a local copy streamed down in ranges.
+        # Every intermediate lives in one scratch workspace, removed however the task ends.
+        ensure_hot(recording)
+        with scratch_workspace('process', expected_bytes=recording.file_size_bytes or 0) as workspace:
+            with local_audio_copy(recording.audio_file, workspace) as source_path:
+                # Step 1: File validation and format detection
+                update_task_progress(10, "Validating audio file...")
+                audio_info = validate_audio_file(source_path)
+                
+                # Step 2: Format conversion if needed
+                update_task_progress(25, "Converting audio format...")
+                processed_path = convert_audio_format(source_path, target_format='wav', workspace=workspace)
+            
+            # Step 3: Audio enhancement
+            update_task_progress(50, "Enhancing audio quality...")
+            enhanced_path = enhance_audio_quality(processed_path, workspace=workspace)
+            
+            # Step 4: Metadata extraction
+            update_task_progress(75, "Extracting metadata...")
+            metadata = extract_audio_metadata(enhanced_path)
+            
+            # Waveform peaks for the player, from the decoded 16 kHz PCM
+            update_task_progress(80, "Computing waveform...")
+            try:
+                store_waveform(recording, enhanced_path)
+            except Exception as e:
+                logger.warning(f"Waveform failed for recording {recording_id}: {str(e)}")
+            
+            # Step 5: Update recording with processed data
+            update_task_progress(90, "Saving processed audio...")
+            
+            # Save enhanced audio file
+            with open(enhanced_path, 'rb') as f:
+                recording.processed_audio_file.save(
+                    f"processed_{recording.id}.wav",
+                    f,
+                    save=True
+                )
         
         # Update metadata
         recording.duration = metadata['duration']
@@ -151,9 +178,6 @@ def process_audio_file(self, recording_id: int) -> Dict[str, Any]:
         recording.processed_at = timezone.now()
         recording.save()
         
-        # Cleanup temporary files
-        cleanup_temp_files([processed_path, enhanced_path])
-        
         update_task_progress(100, "Audio processing completed!")
         
         # Trigger transcription task
@@ -193,6 +217,12 @@ def process_audio_file(self, recording_id: int) -> Dict[str, Any]:
         raise AudioProcessingError(f"Audio processing failed after {MAX_RETRIES} retries: {str(exc)}")
 
 
+def clear_quota_reservation(recording, reservation: str):
+    """Forget a settled hold, unless a newer one replaced it meanwhile"""
+    Recording.objects.filter(pk=recording.pk, quota_reservation=reservation).update(quota_reservation='')
+    recording.quota_reservation = ''
+
+
 @shared_task(bind=True, max_retries=MAX_RETRIES, default_retry_delay=RETRY_DELAY)
 def transcribe_audio(self, recording_id: int) -> Dict[str, Any]:
     """AI transcription using OpenAI Whisper with progress tracking"""
@@ -202,6 +232,16 @@ def transcribe_audio(self, recording_id: int) -> Dict[str, Any]:
         # Get recording
         recording = Recording.objects.get(id=recording_id)
         
+        # Uploads processed automatically have no hold yet; take one now
+        if not recording.quota_reservation:
+            reservation = reserve_quota(
+                recording.user_id, 'transcription_minutes', minutes_for(recording.duration_seconds)
+            )
+            if reservation is None:
+                raise QuotaExceededError(f"Transcription quota exceeded for user {recording.user_id}")
+            recording.quota_reservation = reservation
+            recording.save(update_fields=['quota_reservation', 'updated_at'])
+        
         # Create transcription record
         transcription = Transcription.objects.create(
             recording=recording,
@@ -213,32 +253,66 @@ def transcribe_audio(self, recording_id: int) -> Dict[str, Any]:
         
         # Step 1: Prepare audio file
         update_task_progress(10, "Preparing audio for transcription...")
-        audio_path = recording.processed_audio_file.path if recording.processed_audio_file else recording.audio_file.path
+        audio = recording.processed_audio_file if recording.processed_audio_file else ensure_hot(recording).audio_file
         
-        # Step 2: Transcribe with Whisper
+        # Step 2: Transcribe with Whisper, diarizing the same decoded file on a CPU thread meanwhile
         update_task_progress(30, "Transcribing audio...")
-        result = transcribe_with_whisper(audio_path)
+        with scratch_workspace('transcribe') as workspace, local_audio_copy(audio, workspace) as audio_path:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                diarization = pool.submit(diarize_file, audio_path)
+                result = transcribe_with_whisper(audio_path)
+                turns = speaker_turns(diarization, recording_id)
         
         # Step 3: Process transcription result
         update_task_progress(80, "Processing transcription result...")
+        segments = result.get('segments', [])
+        transcription.speakers_detected = assign_speakers(segments, turns)
+        transcription.speaker_labels = speaker_labels(segments)
         
         # Save transcription
-        transcription.content = result['text']
-        transcription.language = result.get('language', 'en')
-        transcription.confidence = result.get('confidence', 0.0)
-        transcription.segments = result.get('segments', [])
+        transcription.text = result['text']
+        transcription.confidence_score = result.get('confidence', 0.0)
+        transcription.json_format = {
+            'language': result.get('language', 'en'),
+            'segments': segments,
+        }
         transcription.status = 'completed'
-        transcription.completed_at = timezone.now()
         transcription.save()
         
-        # Update recording
-        recording.transcription_status = 'completed'
-        recording.save()
+        # Normalize segments into searchable, timestamped rows
+        transcription.replace_segments(segments)
+        
+        # Word timings go to a packed side file, not the JSON payload
+        if result.get('words'):
+            try:
+                store_word_timings(transcription, result['words'])
+            except Exception as e:
+                logger.warning(f"Word timings failed for recording {recording_id}: {str(e)}")
+        
+        # The 16 kHz WAV is only needed to transcribe; keep the original alone
+        discard_processed_audio(recording)
+        
+        # Update recording (counts the minutes against the user once)
+        reservation = recording.quota_reservation
+        if recording.mark_completed():
+            if reservation:
+                commit_quota(reservation, minutes_for(recording.duration_seconds))
+            record_usage_event(
+                recording.user_id, 'transcription',
+                minutes=(recording.duration_seconds or 0) / 60,
+                api_calls=1, recording_id=recording.id
+            )
+        elif reservation:
+            # Another run already completed (and charged) this recording
+            release_quota(reservation)
+        if reservation:
+            clear_quota_reservation(recording, reservation)
         
         update_task_progress(100, "Transcription completed!")
         
-        # Trigger analysis task
+        # Trigger analysis and segment embedding
         analyze_content.delay(transcription.id)
+        embed_transcript_segments.delay(transcription.id)
         
         logger.info(f"Transcription completed for recording {recording_id}")
         
@@ -254,12 +328,22 @@ def transcribe_audio(self, recording_id: int) -> Dict[str, Any]:
     except Exception as exc:
         logger.error(f"Transcription failed for recording {recording_id}: {str(exc)}")
         
+        if isinstance(exc, QuotaExceededError):
+            Recording.objects.filter(id=recording_id).update(status='failed')
+            raise
+        
         # Retry with exponential backoff
         if self.request.retries < MAX_RETRIES:
             delay = exponential_backoff(self.request.retries)
             logger.info(f"Retrying transcription in {delay} seconds...")
             raise self.retry(countdown=delay, exc=exc)
         
+        # Give the held minutes back once retries are exhausted
+        recording = Recording.objects.filter(id=recording_id).only('id', 'quota_reservation').first()
+        if recording and recording.quota_reservation:
+            release_quota(recording.quota_reservation)
+            clear_quota_reservation(recording, recording.quota_reservation)
+        
         raise TranscriptionError(f"Transcription failed after {MAX_RETRIES} retries: {str(exc)}")
 
 
@@ -270,7 +354,7 @@ def analyze_content(self, transcription_id: int) -> Dict[str, Any]:
         update_task_progress(0, "Starting content analysis...")
         
         # Get transcription
-        transcription = Transcription.objects.get(id=transcription_id)
+        transcription = Transcription.objects.select_related('recording').get(id=transcription_id)
         
         # Create analysis record
         analysis = Analysis.objects.create(
@@ -281,21 +365,24 @@ def analyze_content(self, transcription_id: int) -> Dict[str, Any]:
         
         logger.info(f"Starting analysis for transcription {transcription_id}")
         
+        # Tokens and calls of every model request below, recorded as one usage event
+        meter = UsageMeter()
+        
         # Step 1: Generate summary
         update_task_progress(20, "Generating summary...")
-        summary_result = generate_summary(transcription.content)
+        summary_result = generate_summary(transcription.content, meter=meter)
         
         # Step 2: Extract topics
         update_task_progress(40, "Extracting topics...")
-        topics_result = extract_topics(transcription.content)
+        topics_result = extract_topics(transcription.content, meter=meter)
         
         # Step 3: Identify action items
         update_task_progress(60, "Identifying action items...")
-        action_items_result = extract_action_items(transcription.content)
+        action_items_result = extract_action_items(transcription.content, meter=meter)
         
         # Step 4: Sentiment analysis
         update_task_progress(80, "Analyzing sentiment...")
-        sentiment_result = analyze_sentiment(transcription.content)
+        sentiment_result = analyze_sentiment(transcription.content, meter=meter)
         
         # Step 5: Save analysis results
         update_task_progress(90, "Saving analysis results...")
@@ -316,6 +403,11 @@ def analyze_content(self, transcription_id: int) -> Dict[str, Any]:
         transcription.analysis_status = 'completed'
         transcription.save()
         
+        record_usage_event(
+            transcription.recording.user_id, 'analysis',
+            tokens=meter.tokens, api_calls=meter.api_calls, recording_id=transcription.recording_id
+        )
+        
         update_task_progress(100, "Content analysis completed!")
         
         logger.info(f"Content analysis completed for transcription {transcription_id}")
@@ -343,42 +435,248 @@ def analyze_content(self, transcription_id: int) -> Dict[str, Any]:
         raise AnalysisError(f"Content analysis failed after {MAX_RETRIES} retries: {str(exc)}")
 
 
+@shared_task(bind=True, max_retries=MAX_RETRIES, default_retry_delay=RETRY_DELAY)
+def embed_transcript_segments(self, transcription_id) -> Dict[str, Any]:
+    """Embed transcript segments into the user's semantic vector index"""
+    from .semantic import VectorIndex, index_transcription_segments
+    
+    try:
+        transcription = Transcription.objects.select_related('recording').get(id=transcription_id)
+        indexed = index_transcription_segments(transcription)
+        record_usage_event(
+            transcription.recording.user_id, 'embedding',
+            api_calls=1, recording_id=transcription.recording_id
+        )
+        
+        index = VectorIndex(transcription.recording.user_id)
+        if index.needs_training():
+            train_vector_index.delay(str(transcription.recording.user_id))
+        
+        logger.info(f"Embedded {indexed} segments for transcription {transcription_id}")
+        
+        return {
+            'status': 'success',
+            'transcription_id': str(transcription_id),
+            'segments_indexed': indexed,
+            'message': 'Segment embedding completed successfully'
+        }
+        
+    except Transcription.DoesNotExist:
+        logger.error(f"Transcription {transcription_id} not found")
+        raise TaskError(f"Transcription {transcription_id} not found")
+        
+    except Exception as exc:
+        logger.error(f"Segment embedding failed for transcription {transcription_id}: {str(exc)}")
+        if self.request.retries < MAX_RETRIES:
+            raise self.retry(countdown=exponential_backoff(self.request.retries), exc=exc)
+        raise TaskError(f"Segment embedding failed: {str(exc)}")
+
+
+@shared_task
+def train_vector_index(user_id: str) -> Dict[str, Any]:
+    """Retrain IVF centroids for a user's vector index as it grows"""
+    from .semantic import VectorIndex
+    
+    index = VectorIndex(user_id)
+    if index.needs_training():
+        index.train()
+    return {'status': 'success', 'user_id': user_id, 'vectors': len(index)}
+
+
+# =============================================================================
+# BULK EXPORTS
+# =============================================================================
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, default_retry_delay=RETRY_DELAY)
+def build_bulk_export(self, job_id: str) -> Dict[str, Any]:
+    """Write a bulk export ZIP to a temporary file and attach it to the job"""
+    import hashlib
+    from django.core.files import File
+    from .exports import ExportError, write_bulk_archive
+    from .models import BulkExportJob
+
+    try:
+        job = BulkExportJob.objects.select_related('user').get(id=job_id)
+    except BulkExportJob.DoesNotExist:
+        logger.error(f"Bulk export {job_id} not found")
+        raise TaskError(f"Bulk export {job_id} not found")
+
+    if job.status == 'completed':
+        return {'status': 'success', 'job_id': job_id, 'message': 'Already completed'}
+
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        with tempfile.TemporaryFile() as archive_file:
+            recordings_count = write_bulk_archive(job, archive_file)
+
+            digest = hashlib.sha256()
+            archive_file.seek(0)
+            for chunk in iter(lambda: archive_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+            size = archive_file.tell()
+            archive_file.seek(0)
+
+            job.archive_file.save(f"scriby-export-{job.id}.zip", File(archive_file), save=False)
+
+        job.status = 'completed'
+        job.recordings_count = recordings_count
+        job.archive_size_bytes = size
+        job.archive_sha256 = digest.hexdigest()
+        job.completed_at = timezone.now()
+        job.expires_at = job.completed_at + timedelta(
+            days=getattr(settings, 'BULK_EXPORT_RETENTION_DAYS', 7)
+        )
+        job.error_message = ''
+        job.save()
+        record_usage_event(job.user_id, 'export', api_calls=1)
+
+        logger.info(f"Bulk export {job_id} completed: {recordings_count} recordings, {size} bytes")
+
+        return {
+            'status': 'success',
+            'job_id': job_id,
+            'recordings_count': recordings_count,
+            'archive_size_bytes': size,
+            'message': 'Bulk export completed successfully'
+        }
+
+    except ExportError as exc:
+        # Bad filters or a missing renderer will not fix themselves on retry
+        job.status = 'failed'
+        job.error_message = str(exc)
+        job.save(update_fields=['status', 'error_message', 'updated_at'])
+        raise TaskError(f"Bulk export failed: {str(exc)}")
+
+    except Exception as exc:
+        logger.error(f"Bulk export {job_id} failed: {str(exc)}")
+        if self.request.retries < MAX_RETRIES:
+            raise self.retry(countdown=exponential_backoff(self.request.retries), exc=exc)
+        job.status = 'failed'
+        job.error_message = str(exc)
+        job.save(update_fields=['status', 'error_message', 'updated_at'])
+        raise TaskError(f"Bulk export failed: {str(exc)}")
+
+
+@shared_task
+def expire_bulk_exports() -> Dict[str, Any]:
+    """Delete archives of bulk exports past their retention window"""
+    from .models import BulkExportJob
+
+    expired = 0
+    jobs = BulkExportJob.objects.filter(status='completed', expires_at__lte=timezone.now())
+    for job in jobs.iterator(chunk_size=100):
+        if job.archive_file:
+            job.archive_file.delete(save=False)
+        job.status = 'expired'
+        job.archive_size_bytes = 0
+        job.save(update_fields=['status', 'archive_file', 'archive_size_bytes', 'updated_at'])
+        expired += 1
+
+    return {'status': 'success', 'expired': expired}
+
+
+# =============================================================================
+# UPLOADS
+# =============================================================================
+
+@shared_task
+def expire_upload_sessions() -> Dict[str, Any]:
+    """Abort resumable uploads abandoned past their expiry and free their partial files"""
+    from .uploads import expire_upload_sessions as expire_sessions
+
+    return {'status': 'success', 'expired': expire_sessions()}
+
+
+# =============================================================================
+# SCRATCH SPACE
+# =============================================================================
+
+@worker_process_init.connect
+def _install_scratch_cleanup(**kwargs):
+    install_signal_handlers()
+
+
+@worker_process_shutdown.connect
+def _release_scratch_space(**kwargs):
+    cleanup_active_workspaces()
+
+
+@worker_ready.connect
+def _start_scratch_sweeper(**kwargs):
+    # A beat task would only sweep whichever host picked it up
+    start_sweeper()
+
+
+@shared_task
+def sweep_scratch_space() -> Dict[str, Any]:
+    """Sweep the executing host's scratch space now (each worker also sweeps its host on a timer)"""
+    from .scratch import sweep_orphans
+
+    stats = sweep_orphans()
+    return {'status': 'success', **stats}
+
+
+# =============================================================================
+# STORAGE LIFECYCLE
+# =============================================================================
+
+@shared_task
+def apply_storage_lifecycle() -> Dict[str, Any]:
+    """Clean up intermediates and move archived recordings to Opus on the cold tier"""
+    from .lifecycle import apply_storage_lifecycle as apply_lifecycle
+
+    stats = apply_lifecycle()
+    logger.info(f"Storage lifecycle: {stats}")
+    return {'status': 'success', **stats}
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, default_retry_delay=RETRY_DELAY)
+def build_playback_rendition(self, recording_id: str, quality: str) -> Dict[str, Any]:
+    """Encode a low-bitrate playback rendition for the streaming endpoint"""
+    from .lifecycle import build_rendition
+
+    try:
+        recording = Recording.objects.get(id=recording_id)
+        name = build_rendition(recording, quality)
+    except Recording.DoesNotExist:
+        return {'status': 'skipped', 'recording_id': recording_id}
+    except Exception as exc:
+        logger.error(f"Rendition {quality} failed for recording {recording_id}: {str(exc)}")
+        raise self.retry(countdown=exponential_backoff(self.request.retries), exc=exc)
+    return {'status': 'success', 'recording_id': recording_id, 'rendition': name}
+
+
 # =============================================================================
 # BUSINESS OPERATIONS
 # =============================================================================
 
 @shared_task(bind=True, max_retries=MAX_RETRIES)
 def calculate_usage_metrics(self, user_id: int, date: str = None) -> Dict[str, Any]:
-    """Calculate and update usage metrics for a user"""
+    """Report a user's daily usage from the pre-aggregated rollups"""
+    from .usage import usage_totals
+    
     try:
         user = User.objects.get(id=user_id)
-        target_date = datetime.fromisoformat(date) if date else timezone.now().date()
+        target_date = datetime.fromisoformat(date).date() if date else timezone.now().date()
         
-        # Calculate metrics for the day
-        recordings_count = Recording.objects.filter(
-            user=user,
-            created_at__date=target_date
-        ).count()
-        
-        transcriptions_count = Transcription.objects.filter(
-            recording__user=user,
-            created_at__date=target_date,
-            status='completed'
-        ).count()
+        day_start = timezone.make_aware(datetime.combine(target_date, datetime.min.time()))
+        totals = usage_totals(user, 'day', day_start, day_start + timedelta(days=1))
         
-        # Calculate costs (simplified)
-        transcription_cost = transcriptions_count * Decimal('0.006')  # $0.006 per minute
-        analysis_cost = transcriptions_count * Decimal('0.002')  # $0.002 per analysis
-        total_cost = transcription_cost + analysis_cost
+        uploads = totals.get('upload', {})
+        transcription = totals.get('transcription', {})
+        total_cost = sum((stage['cost'] for stage in totals.values()), Decimal('0'))
+        api_calls = sum(stage['api_calls'] for stage in totals.values())
         
         # Update or create usage metrics
-        metrics, created = UsageMetrics.objects.update_or_create(
+        UsageMetrics.objects.update_or_create(
             user=user,
             date=target_date,
             defaults={
-                'recordings_count': recordings_count,
-                'transcriptions_count': transcriptions_count,
-                'api_calls': transcriptions_count,
+                'recordings_count': uploads.get('events', 0),
+                'transcriptions_count': transcription.get('events', 0),
+                'api_calls': api_calls,
                 'cost': total_cost,
                 'updated_at': timezone.now()
             }
@@ -388,11 +686,15 @@ def calculate_usage_metrics(self, user_id: int, date: str = None) -> Dict[str, A
         
         return {
             'status': 'success',
-            'user_id': user_id,
+            'user_id': str(user_id),
             'date': str(target_date),
-            'recordings_count': recordings_count,
-            'transcriptions_count': transcriptions_count,
+            'recordings_count': uploads.get('events', 0),
+            'transcriptions_count': transcription.get('events', 0),
+            'transcription_minutes': round(transcription.get('minutes', 0), 2),
+            'tokens': sum(stage['tokens'] for stage in totals.values()),
+            'api_calls': api_calls,
             'total_cost': float(total_cost),
+            'stages': {name: {**stage, 'cost': float(stage['cost'])} for name, stage in totals.items()},
             'message': 'Usage metrics calculated successfully'
         }
         
@@ -401,6 +703,75 @@ def calculate_usage_metrics(self, user_id: int, date: str = None) -> Dict[str, A
         raise TaskError(f"Usage metrics calculation failed: {str(exc)}")
 
 
+@shared_task
+def reconcile_quotas() -> Dict[str, Any]:
+    """Release abandoned quota holds and re-sync Redis counters with Postgres"""
+    from .quota import get_quota_service
+    
+    service = get_quota_service()
+    released = service.release_expired()
+    synced = service.reconcile()
+    logger.info(f"Quota reconciliation: {released} holds released, {synced} counters synced")
+    return {'status': 'success', 'released': released, 'synced': synced}
+
+
+@shared_task
+def flush_audit_events() -> Dict[str, Any]:
+    """Write queued audit events to audit_logs in bulk batches"""
+    from .audit import flush_audit_stream
+    
+    written = flush_audit_stream(consumer=f"celery-{current_task.request.hostname or 'worker'}")
+    return {'status': 'success', 'written': written}
+
+
+@shared_task
+def maintain_audit_partitions() -> Dict[str, Any]:
+    """Create upcoming monthly audit partitions and drop expired ones"""
+    from .audit import audit_logs_partitioned, drop_expired_audit_partitions, ensure_audit_partitions
+    
+    if not audit_logs_partitioned():
+        logger.error("audit_logs is not partitioned; run migrations before partition maintenance")
+        return {'status': 'skipped', 'reason': 'audit_logs is not partitioned'}
+    created = ensure_audit_partitions()
+    dropped = drop_expired_audit_partitions()
+    return {'status': 'success', 'created': created, 'dropped': dropped}
+
+
+@shared_task
+def rollup_usage_events() -> Dict[str, Any]:
+    """Fold new usage ledger events into hourly, daily and monthly rollups"""
+    from .usage import rollup_usage_events as fold_events
+    
+    folded = fold_events()
+    if folded:
+        logger.info(f"Rolled up {folded} usage events")
+    return {'status': 'success', 'events': folded}
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, default_retry_delay=RETRY_DELAY)
+def rollover_monthly_usage(self, period_start: str = None) -> Dict[str, Any]:
+    """Archive and reset every user's monthly counters for a closed period"""
+    from .usage import rollover_usage_period
+    
+    try:
+        period = datetime.fromisoformat(period_start).date() if period_start else None
+        rollover = rollover_usage_period(period)
+        
+        return {
+            'status': 'success',
+            'period_start': str(rollover.period_start),
+            'users_processed': rollover.users_processed,
+            'message': 'Usage rollover completed successfully'
+        }
+        
+    except Exception as exc:
+        logger.error(f"Usage rollover failed for {period_start or 'previous period'}: {str(exc)}")
+        # Resumes from the last committed batch
+        if self.request.retries < MAX_RETRIES:
+            raise self.retry(countdown=exponential_backoff(self.request.retries), exc=exc)
+        raise TaskError(f"Usage rollover failed: {str(exc)}")
+
+
 @shared_task(bind=True, max_retries=MAX_RETRIES)
 def send_notification_email(self, user_id: int, template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
     """Send notification email to user"""
@@ -474,8 +845,8 @@ def validate_audio_file(file_path: str) -> Dict[str, Any]:
         raise AudioProcessingError(f"Audio validation failed: {str(e)}")
 
 
-def convert_audio_format(input_path: str, target_format: str = 'wav') -> str:
-    """Convert audio to target format with optimal settings"""
+def convert_audio_format(input_path: str, target_format: str = 'wav', workspace=None) -> str:
+    """Convert audio to target format with optimal settings, into `workspace` when given"""
     try:
         # Load audio with pydub
         audio = AudioSegment.from_file(input_path)
@@ -485,8 +856,7 @@ def convert_audio_format(input_path: str, target_format: str = 'wav') -> str:
         audio = audio.set_channels(1)  # Mono for transcription
         
         # Create temporary output file
-        with tempfile.NamedTemporaryFile(suffix=f'.{target_format}', delete=False) as tmp_file:
-            output_path = tmp_file.name
+        output_path = _scratch_output_path(workspace, f'.{target_format}', len(audio.raw_data))
         
         # Export with optimal settings
         audio.export(
@@ -501,8 +871,8 @@ def convert_audio_format(input_path: str, target_format: str = 'wav') -> str:
         raise AudioProcessingError(f"Audio conversion failed: {str(e)}")
 
 
-def enhance_audio_quality(input_path: str) -> str:
-    """Enhance audio quality for better transcription"""
+def enhance_audio_quality(input_path: str, workspace=None) -> str:
+    """Enhance audio quality for better transcription, into `workspace` when given"""
     try:
         # Load audio
         audio = AudioSegment.from_file(input_path)
@@ -518,8 +888,7 @@ def enhance_audio_quality(input_path: str) -> str:
         audio = audio.high_pass_filter(80)  # Remove low-frequency noise
         
         # Create temporary output file
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            output_path = tmp_file.name
+        output_path = _scratch_output_path(workspace, '.wav', len(audio.raw_data))
         
         # Export enhanced audio
         audio.export(output_path, format='wav')
@@ -530,6 +899,13 @@ def enhance_audio_quality(input_path: str) -> str:
         raise AudioProcessingError(f"Audio enhancement failed: {str(e)}")
 
 
+def _scratch_output_path(workspace, suffix: str, expected_bytes: int) -> str:
+    if workspace is not None:
+        return workspace.path_for(suffix, expected_bytes=expected_bytes)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp_file:
+        return tmp_file.name
+
+
 def extract_audio_metadata(file_path: str) -> Dict[str, Any]:
     """Extract comprehensive audio metadata"""
     try:
@@ -572,7 +948,7 @@ def transcribe_with_whisper(audio_path: str) -> Dict[str, Any]:
                 model="whisper-1",
                 file=audio_file,
                 response_format="verbose_json",
-                timestamp_granularities=["segment"]
+                timestamp_granularities=["word", "segment"]
             )
         
         # Process response
@@ -593,6 +969,17 @@ def transcribe_with_whisper(audio_path: str) -> Dict[str, Any]:
                     'confidence': getattr(segment, 'avg_logprob', 0.0)
                 })
         
+        # Words carry no score of their own; use their segment's mean token probability
+        words = getattr(response, 'words', None) or []
+        result['words'] = [
+            {'word': word.word, 'start': word.start, 'end': word.end} for word in words
+        ]
+        segments, current = result['segments'], 0
+        for word in result['words'] if segments else []:
+            while current < len(segments) - 1 and segments[current]['end'] <= word['start']:
+                current += 1
+            word['probability'] = float(np.exp(segments[current]['confidence']))
+        
         # Calculate overall confidence
         if result['segments']:
             confidences = [seg.get('confidence', 0.0) for seg in result['segments']]
@@ -606,7 +993,16 @@ def transcribe_with_whisper(audio_path: str) -> Dict[str, Any]:
         raise TranscriptionError(f"Whisper transcription failed: {str(e)}")
 
 
-def generate_summary(content: str) -> Dict[str, Any]:
+def speaker_turns(diarization, recording_id) -> List[Tuple[float, float, str]]:
+    """Diarization result, or no turns (one unlabelled speaker) if it failed"""
+    try:
+        return diarization.result()
+    except Exception as e:
+        logger.warning(f"Diarization failed for recording {recording_id}: {str(e)}")
+        return []
+
+
+def generate_summary(content: str, meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
     """Generate summary using GPT-4"""
     try:
         client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -633,8 +1029,9 @@ def generate_summary(content: str) -> Dict[str, Any]:
             max_tokens=1000
         )
         
-        result = json.loads(response.choices[0].message.content)
-        return result
+        if meter is not None:
+            meter.add(tokens=response.usage.total_tokens if response.usage else 0)
+        return json.loads(response.choices[0].message.content)
         
     except Exception as e:
         logger.error(f"Summary generation failed: {str(e)}")
@@ -644,7 +1041,7 @@ def generate_summary(content: str) -> Dict[str, Any]:
         }
 
 
-def extract_topics(content: str) -> Dict[str, Any]:
+def extract_topics(content: str, meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
     """Extract topics and themes"""
     try:
         client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -672,15 +1069,16 @@ def extract_topics(content: str) -> Dict[str, Any]:
             max_tokens=800
         )
         
-        result = json.loads(response.choices[0].message.content)
-        return result
+        if meter is not None:
+            meter.add(tokens=response.usage.total_tokens if response.usage else 0)
+        return json.loads(response.choices[0].message.content)
         
     except Exception as e:
         logger.error(f"Topic extraction failed: {str(e)}")
         return {"topics": []}
 
 
-def extract_action_items(content: str) -> Dict[str, Any]:
+def extract_action_items(content: str, meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
     """Extract action items and tasks"""
     try:
         client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -714,20 +1112,23 @@ def extract_action_items(content: str) -> Dict[str, Any]:
             max_tokens=800
         )
         
-        result = json.loads(response.choices[0].message.content)
-        return result
+        if meter is not None:
+            meter.add(tokens=response.usage.total_tokens if response.usage else 0)
+        return json.loads(response.choices[0].message.content)
         
     except Exception as e:
         logger.error(f"Action items extraction failed: {str(e)}")
         return {"action_items": []}
 
 
-def analyze_sentiment(content: str) -> Dict[str, Any]:
+def analyze_sentiment(content: str, meter: Optional[UsageMeter] = None) -> Dict[str, Any]:
     """Analyze sentiment and extract entities"""
     try:
         # Use transformers for sentiment analysis
         sentiment_pipeline = pipeline("sentiment-analysis")
         sentiment_result = sentiment_pipeline(content[:512])  # Limit text length
+        if meter is not None:
+            meter.add()  # local model: a call, but no billed tokens
         
         # Convert to our format
         sentiment_score = sentiment_result[0]['score']
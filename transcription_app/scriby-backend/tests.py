@@ -3,28 +3,73 @@ Scriby - Production-Ready Test Suite
 Comprehensive tests for Django backend
 """
 
+import base64
+import hashlib
+import io
 import json
+import os
 import tempfile
+import time
+import uuid
+import zipfile
+from datetime import timedelta
 from decimal import Decimal
+from unittest import skipUnless
 from unittest.mock import patch, Mock
 
-from django.test import TestCase, TransactionTestCase
+try:
+    import fakeredis
+except ImportError:  # optional test dependency
+    fakeredis = None
+
+try:
+    from moto import mock_aws
+except ImportError:  # optional test dependency
+    mock_aws = None
+
+import numpy as np
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.utils import timezone
 
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase, force_authenticate
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import (
-    Recording, Transcription, Analysis, Subscription, 
-    UsageMetrics, Organization
+    Recording, Transcription, Analysis, BulkExportJob, Subscription, SubscriptionPlan, UserProfile,
+    UsageEvent, UsageMetrics, Organization, TranscriptSegment, UserAnalytics, search_config_for_language
+)
+from .exports import format_timestamp, render_srt, render_vtt
+from .search import build_search_query, search_transcriptions
+from .semantic import VectorIndex
+from .storage import S3Storage, local_audio_copy
+from .audit import AUDIT_STREAM, build_audit_event, flush_audit_stream
+from . import audit, caching, diarization, lifecycle, revisions, scratch, storage, throttling, uploads
+from .upload_handlers import (
+    AudioUploadHandler, UnsupportedAudioFormat, UploadTooLarge, probe_audio_header, sniff_audio_format
+)
+from .caching import _entry_key, bump_cache_version, cache_metrics, swr_cached
+from .dashboard import build_dashboard
+from .quota import QuotaService, counters_key, minutes_for
+from . import streaming as streaming_module
+from .streaming import offloaded_file_response, parse_range_header, ranged_file_response
+from .throttling import SlidingWindowLimiter
+from .waveforms import PeakBuilder, decode_waveform, encode_waveform
+from .serializers import BulkExportJobSerializer
+from .views import BulkExportViewSet, RecordingViewSet, TranscriptionViewSet
+from .word_timings import WordTimings
+from .usage import (
+    previous_period_start, record_usage_event, rollover_usage_period, rollup_usage_events
 )
 from .tasks import (
     process_audio_file, transcribe_audio, analyze_content,
-    calculate_usage_metrics
+    build_bulk_export, calculate_usage_metrics
 )
 
 User = get_user_model()
@@ -177,6 +222,1129 @@ class TranscriptionModelTest(TestCase):
         self.assertEqual(transcription.segments[0]['text'], 'Hello world')
 
 
+class SearchConfigTest(TestCase):
+    """Test language to text search config mapping"""
+    
+    def test_known_languages(self):
+        """Test region suffixes are ignored when picking a config"""
+        self.assertEqual(search_config_for_language('en-US'), 'english')
+        self.assertEqual(search_config_for_language('pt-BR'), 'portuguese')
+        self.assertEqual(search_config_for_language('es_MX'), 'spanish')
+    
+    def test_unknown_language_falls_back_to_simple(self):
+        """Test unsupported or empty languages use the simple config"""
+        self.assertEqual(search_config_for_language('ja-JP'), 'simple')
+        self.assertEqual(search_config_for_language(''), 'simple')
+        self.assertEqual(search_config_for_language(None), 'simple')
+
+
+class FullTextSearchTest(TestCase):
+    """Test tsvector search over transcripts"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='search@scriby.com', username='search', password='testpass123',
+            first_name='Search', last_name='User'
+        )
+        self.recording = Recording.objects.create(
+            user=self.user, title='Quarterly budget review', original_filename='q3.mp3',
+            file_format='mp3', status='completed',
+            audio_file=SimpleUploadedFile('q3.mp3', b'fake', content_type='audio/mpeg')
+        )
+        self.transcription = Transcription.objects.create(
+            recording=self.recording, text='We agreed to hire two engineers.'
+        )
+    
+    def test_query_configs_are_constants(self):
+        """Test the query never parses with a per-row config, which would bypass the GIN index"""
+        query = build_search_query('engineers', ['english', 'simple'])
+        sql = str(Transcription.objects.filter(search_vector=query).query)
+        self.assertNotIn('"search_config"', sql)
+    
+    def test_title_and_text_are_searchable(self):
+        """Test recording titles stay searchable, including after a rename"""
+        queryset = Transcription.objects.all()
+        self.assertEqual(list(search_transcriptions(queryset, 'engineers')), [self.transcription])
+        self.assertEqual(list(search_transcriptions(queryset, 'budget')), [self.transcription])
+        
+        self.recording.title = 'Roadmap sync'
+        self.recording.save()
+        self.assertEqual(list(search_transcriptions(queryset, 'roadmap')), [self.transcription])
+        self.assertEqual(list(search_transcriptions(queryset, 'quarterly')), [])
+    
+    def test_unchanged_text_skips_vector_update(self):
+        """Test saves that leave the text alone do not rebuild the vector"""
+        transcription = Transcription.objects.get(pk=self.transcription.pk)
+        transcription.status = 'completed'
+        with self.assertNumQueries(1):
+            transcription.save()
+
+
+class TranscriptSegmentTest(TestCase):
+    """Test normalization of Whisper segments into segment rows"""
+    
+    def test_build_from_payload(self):
+        """Test empty segments are dropped and indexes stay contiguous"""
+        transcription = Transcription(recording_id=uuid.uuid4(), text='Hello world')
+        segments = [
+            {'start': 0.0, 'end': 2.5, 'text': ' Hello ', 'confidence': -0.2},
+            {'start': 2.5, 'end': 3.0, 'text': '   '},
+            {'start': 3.0, 'end': None, 'text': 'world', 'speaker': 'SPEAKER_1'},
+        ]
+        
+        rows = TranscriptSegment.build_from_payload(transcription, segments)
+        
+        self.assertEqual([row.index for row in rows], [0, 1])
+        self.assertEqual(rows[0].text, 'Hello')
+        self.assertEqual(rows[1].end, 3.0)
+        self.assertEqual(rows[1].speaker, 'SPEAKER_1')
+        self.assertEqual(rows[1].recording_id, transcription.recording_id)
+
+
+class RecordingCompletionTest(TestCase):
+    """Test usage counters on recording completion"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='stats@scriby.com', username='stats', password='testpass123',
+            first_name='Stats', last_name='User'
+        )
+        self.recording = Recording.objects.create(
+            user=self.user, title='Standup', original_filename='standup.mp3',
+            file_format='mp3', duration_seconds=630, status='processing',
+            audio_file=SimpleUploadedFile('standup.mp3', b'fake', content_type='audio/mpeg')
+        )
+    
+    def test_completion_counted_once(self):
+        """Test a second completion does not increment the counters again"""
+        first = Recording.objects.get(pk=self.recording.pk)
+        second = Recording.objects.get(pk=self.recording.pk)  # loaded before either completes
+        self.assertTrue(first.mark_completed())
+        self.assertFalse(second.mark_completed())
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_recordings, 1)
+        self.assertEqual(self.user.monthly_transcription_minutes, 11)  # 10.5 minutes, charged as 11
+    
+    def test_save_without_transition_is_one_query(self):
+        """Test ordinary saves no longer re-read the recording"""
+        recording = Recording.objects.get(pk=self.recording.pk)
+        recording.description = 'Weekly sync'
+        with self.assertNumQueries(1):
+            recording.save(update_fields=['description', 'updated_at'])
+
+
+class AnalyticsRollupTest(TestCase):
+    """Test incremental analytics rollups behind the dashboard"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='dash@scriby.com', username='dash', password='testpass123',
+            first_name='Dash', last_name='User'
+        )
+    
+    def _record(self, duration):
+        return Recording.objects.create(
+            user=self.user, title='Call', original_filename='call.mp3', file_format='mp3',
+            duration_seconds=duration, status='processing',
+            audio_file=SimpleUploadedFile('call.mp3', b'fake', content_type='audio/mpeg')
+        )
+    
+    def test_rollups_follow_recordings_and_transcriptions(self):
+        """Test creates, edits and deletes are folded into the totals"""
+        first = self._record(1800)
+        self._record(None)
+        Transcription.objects.create(recording=first, text='hello', confidence_score=0.8)
+        first.duration_seconds = 3600
+        first.save()
+        
+        dashboard = build_dashboard(self.user)
+        self.assertEqual(dashboard['overview']['total_recordings'], 2)
+        self.assertEqual(dashboard['overview']['total_transcriptions'], 1)
+        self.assertEqual(dashboard['overview']['total_duration_hours'], 1)
+        self.assertAlmostEqual(dashboard['overview']['avg_confidence_score'], 0.8)
+        self.assertEqual(dashboard['monthly_stats']['recordings_this_month'], 2)
+        
+        first.delete()
+        dashboard = build_dashboard(self.user)
+        self.assertEqual(dashboard['overview']['total_recordings'], 1)
+        self.assertEqual(dashboard['overview']['total_transcriptions'], 0)
+        self.assertEqual(dashboard['overview']['total_duration_hours'], 0)
+    
+    def test_confidence_scored_after_creation_is_folded(self):
+        """Test the transcribe path, which creates the row unscored and scores it later"""
+        recording = self._record(600)
+        transcription = Transcription.objects.create(recording=recording, text='')
+        
+        transcription = Transcription.objects.get(pk=transcription.pk)
+        transcription.text = 'hello'
+        transcription.confidence_score = 0.6
+        transcription.save()
+        transcription.confidence_score = 0.9
+        transcription.save()
+        
+        dashboard = build_dashboard(self.user)
+        self.assertEqual(dashboard['overview']['total_transcriptions'], 1)
+        self.assertAlmostEqual(dashboard['overview']['avg_confidence_score'], 0.9)
+        
+        transcription.delete()
+        totals = UserAnalytics.objects.get(user=self.user)
+        self.assertEqual(totals.confidence_count, 0)
+        self.assertAlmostEqual(totals.confidence_sum, 0.0)
+    
+    def test_missing_rollups_are_rebuilt_without_recordings(self):
+        """Test a user with no recordings gets zeros instead of a Sum() of None"""
+        UserAnalytics.objects.filter(user=self.user).delete()
+        dashboard = build_dashboard(self.user)
+        self.assertEqual(dashboard['overview']['total_duration_hours'], 0)
+        self.assertEqual(dashboard['recent_activity'], [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StaleWhileRevalidateTest(TestCase):
+    """Test the versioned stale-while-revalidate cache"""
+    
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+        
+        @swr_cached('test_stats', fresh=60, stale=600, scope=lambda key: key)
+        def compute(key):
+            self.calls.append(key)
+            return len(self.calls)
+        self.compute = compute
+    
+    def test_fresh_entries_are_served_from_cache(self):
+        self.assertEqual(self.compute('a'), 1)
+        self.assertEqual(self.compute('a'), 1)
+        self.assertEqual(len(self.calls), 1)
+    
+    def test_stale_entry_is_served_while_refreshing(self):
+        self.compute('a')
+        later = time.time() + 120
+        lock_key = f"{_entry_key('test_stats', 'a', 0)}:lock"
+        cache.add(lock_key, 1)  # another worker is already refreshing
+        with patch.object(caching.time, 'time', return_value=later):
+            self.assertEqual(self.compute('a'), 1)
+        cache.delete(lock_key)
+        with patch.object(caching.time, 'time', return_value=later), \
+                patch.object(caching, 'BACKGROUND_REFRESH', False):
+            self.assertEqual(self.compute('a'), 2)
+    
+    def test_version_bump_forces_recompute(self):
+        misses = cache_metrics('test_stats')['miss']
+        self.compute('a')
+        bump_cache_version('test_stats', 'a', on_commit=False)
+        self.assertEqual(self.compute('a'), 2)
+        self.assertEqual(cache_metrics('test_stats')['miss'] - misses, 2)
+
+
+class StorageLifecycleTest(TestCase):
+    """Test intermediate cleanup, cold tiering and lazy rehydration"""
+    
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=os.path.join(self.media, 'hot'))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = patch.object(storage, 'COLD_STORAGE_ROOT', os.path.join(self.media, 'cold'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            email='archive@scriby.com', username='archive', password='testpass123',
+            first_name='Arch', last_name='Ive'
+        )
+        self.recording = Recording.objects.create(
+            user=self.user, title='Old standup', original_filename='old.mp3', file_format='mp3',
+            file_size_bytes=4, status='archived',
+            audio_file=SimpleUploadedFile('old.mp3', b'ID3x', content_type='audio/mpeg'),
+            processed_audio_file=SimpleUploadedFile('old.wav', b'RIFF' + bytes(96)),
+        )
+    
+    def test_discard_processed_audio(self):
+        wav_path = self.recording.processed_audio_file.path
+        self.assertEqual(lifecycle.discard_processed_audio(self.recording), 100)
+        self.assertFalse(os.path.exists(wav_path))
+        self.recording.refresh_from_db()
+        self.assertFalse(self.recording.processed_audio_file)
+        self.assertEqual(lifecycle.storage_report()['reclaimed_bytes'], 100)
+    
+    def test_cold_round_trip(self):
+        hot_path = self.recording.audio_file.path
+        self.assertTrue(lifecycle.move_to_cold(self.recording))
+        self.assertFalse(os.path.exists(hot_path))
+        self.assertEqual(lifecycle.storage_report()['cold_recordings'], 1)
+        
+        recording = Recording.objects.get(pk=self.recording.pk)
+        audio, size, content_type = lifecycle.open_audio(recording)
+        with audio:
+            self.assertEqual(audio.read(), b'ID3x')
+        self.assertEqual((size, content_type), (4, 'audio/mpeg'))
+        recording.refresh_from_db()
+        self.assertEqual(recording.storage_tier, 'hot')
+        
+        # Freshly rehydrated archives are left hot for a while
+        self.assertEqual(lifecycle.apply_storage_lifecycle()['moved_to_cold'], 0)
+
+
+class ScratchWorkspaceTest(TestCase):
+    """Test per-task scratch workspaces, the worker budget and the orphan sweeper"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name, value in (('SCRATCH_TMPFS_ROOT', ''), ('SCRATCH_DISK_ROOT', self.root),
+                            ('SCRATCH_BUDGET_BYTES', 1024), ('SCRATCH_MIN_FREE_BYTES', 0)):
+            patcher = patch.object(scratch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def test_workspace_removed_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with scratch.scratch_workspace('test') as workspace:
+                with open(workspace.path_for('.wav'), 'wb') as f:
+                    f.write(b'x' * 100)
+                raise RuntimeError('task crashed')
+        self.assertFalse(os.path.exists(workspace.path))
+        self.assertEqual(scratch.worker_usage(), 0)
+
+    def test_budget(self):
+        with scratch.scratch_workspace('test') as workspace:
+            with open(workspace.path_for('.wav', expected_bytes=1000), 'wb') as f:
+                f.write(b'x' * 1000)
+            with self.assertRaises(scratch.ScratchBudgetExceeded):
+                workspace.path_for('.wav', expected_bytes=100)
+        with self.assertRaises(scratch.ScratchBudgetExceeded):
+            with scratch.scratch_workspace('test', expected_bytes=2048):
+                pass
+
+    def test_ignored_signals_stay_ignored(self):
+        import signal
+        previous = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+        self.addCleanup(lambda: [signal.signal(signum, handler) for signum, handler in previous.items()])
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        scratch.install_signal_handlers(signals=(signal.SIGINT, signal.SIGTERM))
+        self.assertEqual(signal.getsignal(signal.SIGINT), signal.SIG_IGN)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_IGN)
+
+    def test_sweep_orphans(self):
+        # pid_max is at most 2**22, so this worker cannot be alive
+        orphan = os.path.join(self.root, f'{scratch.HOSTNAME}-{2 ** 22 + 1}', 'process-abc')
+        os.makedirs(orphan)
+        with open(os.path.join(orphan, 'converted.wav'), 'wb') as f:
+            f.write(b'x' * 10)
+
+        with scratch.scratch_workspace('live') as workspace:
+            stats = scratch.sweep_orphans()
+            self.assertTrue(os.path.isdir(workspace.path))
+        self.assertFalse(os.path.exists(os.path.dirname(orphan)))
+        self.assertEqual((stats['leaked_files'], stats['leaked_bytes']), (1, 10))
+        metrics = scratch.scratch_metrics()
+        self.assertEqual((metrics['leaked_files'], metrics['leaked_bytes']), (1, 10))
+        self.assertIn(scratch.HOSTNAME, metrics['hosts'])
+
+
+class ResumableUploadTest(TestCase):
+    """Test chunked uploads with checksums and resume"""
+    
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = patch.object(uploads, 'UPLOAD_PARTIAL_DIR', os.path.join(self.media, 'partial'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            email='upload@scriby.com', username='upload', password='testpass123',
+            first_name='Up', last_name='Loader'
+        )
+        self.payload = b'ID3' + os.urandom(4096)
+        self.session = uploads.initiate_upload(
+            self.user, 'standup.mp3', 'audio/mpeg', len(self.payload),
+            sha256=hashlib.sha256(self.payload).hexdigest(), metadata={'title': 'Standup'}
+        )
+    
+    def test_resume_after_partial_chunk(self):
+        """Test bytes that arrived before a dropped connection are kept"""
+        dropped = io.BytesIO(self.payload[:1000])  # client promised 3000 bytes
+        self.assertEqual(uploads.append_chunk(self.session, 0, dropped, 3000), 1000)
+        with self.assertRaises(uploads.UploadConflict) as ctx:
+            uploads.append_chunk(self.session, 0, io.BytesIO(self.payload), len(self.payload))
+        self.assertEqual(ctx.exception.offset, 1000)
+        
+        rest = self.payload[1000:]
+        uploads.append_chunk(self.session, 1000, io.BytesIO(rest), len(rest),
+                             checksum=hashlib.sha256(rest).hexdigest())
+        recording = uploads.complete_upload(self.session)
+        
+        self.assertEqual(recording.title, 'Standup')
+        self.assertEqual(recording.file_size_bytes, len(self.payload))
+        with recording.audio_file.open('rb') as f:
+            self.assertEqual(f.read(), self.payload)
+        self.assertFalse(os.path.exists(self.session.partial_path))
+    
+    def test_concurrent_append_is_refused_before_writing(self):
+        """Test a second writer cannot overwrite a chunk that is still being written"""
+        import fcntl
+        with open(self.session.partial_path, 'r+b') as writer:
+            fcntl.flock(writer.fileno(), fcntl.LOCK_EX)
+            with self.assertRaises(uploads.UploadConflict):
+                uploads.append_chunk(self.session, 0, io.BytesIO(b'ID3' + b'x' * 97), 100)
+        self.assertEqual(os.path.getsize(self.session.partial_path), 0)
+        self.assertEqual(uploads.append_chunk(self.session, 0, io.BytesIO(self.payload[:100]), 100), 100)
+    
+    def test_concurrent_completion_is_refused(self):
+        """Test a completion that is still storing the file blocks a second one"""
+        import fcntl
+        uploads.append_chunk(self.session, 0, io.BytesIO(self.payload), len(self.payload))
+        with open(self.session.partial_path, 'rb') as completing:
+            fcntl.flock(completing.fileno(), fcntl.LOCK_EX)
+            with self.assertRaises(uploads.UploadConflict):
+                uploads.complete_upload(self.session)
+        self.assertEqual(Recording.objects.count(), 0)
+        self.assertEqual(uploads.complete_upload(self.session).file_size_bytes, len(self.payload))
+    
+    def test_bad_chunk_checksum_is_not_counted(self):
+        with self.assertRaises(uploads.ChecksumMismatch):
+            uploads.append_chunk(self.session, 0, io.BytesIO(self.payload[:100]), 100, checksum='0' * 64)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.offset, 0)
+        with self.assertRaises(uploads.UploadConflict):
+            uploads.complete_upload(self.session)
+
+
+class StreamingUploadValidationTest(TestCase):
+    """Test uploads are sniffed and size-checked while they stream in"""
+    
+    def setUp(self):
+        self.wav = (b'RIFF' + (36).to_bytes(4, 'little') + b'WAVEfmt ' + (16).to_bytes(4, 'little')
+                    + bytes([1, 0, 2, 0]) + (44100).to_bytes(4, 'little') + bytes(8) + b'data' + bytes(4))
+    
+    def _handler(self, max_bytes):
+        handler = AudioUploadHandler(Mock(), max_bytes=max_bytes)
+        handler.new_file('audio_file', 'clip.wav', 'audio/wav', None)
+        return handler
+    
+    def test_sniff_and_probe(self):
+        self.assertEqual(sniff_audio_format(self.wav), 'wav')
+        self.assertEqual(sniff_audio_format(b'ID3\x04' + bytes(8)), 'mp3')
+        self.assertEqual(sniff_audio_format(b'\x00\x00\x00\x20ftypM4A '), 'm4a')
+        self.assertIsNone(sniff_audio_format(b'%PDF-1.7 ' + bytes(8)))
+        self.assertEqual(probe_audio_header('wav', self.wav), {'sample_rate': 44100, 'channels': 2})
+    
+    def test_valid_upload_carries_hash_and_header(self):
+        handler = self._handler(1024)
+        handler.receive_data_chunk(self.wav, 0)
+        uploaded = handler.file_complete(len(self.wav))
+        self.assertEqual(uploaded.sha256, hashlib.sha256(self.wav).hexdigest())
+        self.assertEqual(uploaded.sniffed_content_type, 'audio/wav')
+        self.assertEqual(uploaded.audio_header['sample_rate'], 44100)
+    
+    def test_rejects_on_first_chunk(self):
+        with self.assertRaises(UnsupportedAudioFormat):
+            self._handler(1024).receive_data_chunk(b'MZ\x90\x00' + bytes(60), 0)
+        with self.assertRaises(UploadTooLarge):
+            self._handler(1024).handle_raw_input(None, {}, 10 * 1024 * 1024, b'x')
+    
+    def test_rejects_once_limit_is_crossed(self):
+        handler = self._handler(len(self.wav) + 10)
+        handler.receive_data_chunk(self.wav, 0)
+        with self.assertRaises(UploadTooLarge):
+            handler.receive_data_chunk(bytes(64), len(self.wav))
+        self.assertTrue(handler.file.closed)
+
+
+@skipUnless(mock_aws, 'moto is not installed')
+class UploadHandlerViewTest(TestCase):
+    """Test the streaming upload checks apply when authentication parses the body first"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='session@scriby.com', username='session', password='testpass123',
+            first_name='Session', last_name='User'
+        )
+        UserProfile.objects.filter(user=self.user).update(max_file_size_mb=1)
+        self.view = RecordingViewSet.as_view(
+            {'post': 'create'}, authentication_classes=[SessionAuthentication]
+        )
+    
+    def _upload(self, content):
+        # Enforce CSRF so SessionAuthentication reads request.POST during authentication
+        request = APIRequestFactory(enforce_csrf_checks=True).post('/recordings/', {
+            'title': 'Session upload',
+            'audio_file': SimpleUploadedFile('clip.wav', content, content_type='audio/wav'),
+        }, format='multipart', HTTP_X_CSRFTOKEN='a' * 32)
+        request.COOKIES['csrftoken'] = 'a' * 32
+        request.user = self.user  # as set by AuthenticationMiddleware from the session
+        return self.view(request)
+    
+    def test_non_audio_is_refused_while_streaming(self):
+        response = self._upload(b'MZ\x90\x00' + bytes(60))
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    def test_users_own_limit_applies(self):
+        response = self._upload(b'RIFF' + bytes(4) + b'WAVE' + bytes(3 * 1024 * 1024))
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(Recording.objects.count(), 0)
+
+
+class DirectStorageUploadTest(TestCase):
+    """Test presigned direct uploads and ranged reads against a moto S3"""
+    
+    def setUp(self):
+        env = patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test'})
+        env.start()
+        self.addCleanup(env.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.storage = S3Storage(bucket='scriby-test', region='us-east-1')
+        self.storage.client.create_bucket(Bucket='scriby-test')
+        field = patch.object(Recording._meta.get_field('audio_file'), 'storage', self.storage)
+        field.start()
+        self.addCleanup(field.stop)
+        self.user = User.objects.create_user(
+            email='direct@scriby.com', username='direct', password='testpass123',
+            first_name='Direct', last_name='Upload'
+        )
+        self.payload = b'ID3' + os.urandom(4096)
+        self.session = uploads.initiate_direct_upload(
+            self.user, 'standup.mp3', 'audio/mpeg', len(self.payload), metadata={'title': 'Standup'}
+        )
+    
+    def test_complete_adopts_stored_object(self):
+        self.assertEqual(self.session.upload['method'], 'POST')
+        with self.assertRaises(uploads.UploadConflict):
+            uploads.complete_upload(self.session)
+        
+        # Stand-in for the client's POST to the presigned form
+        self.storage.client.put_object(Bucket='scriby-test', Key=self.session.storage_key, Body=self.payload)
+        recording = uploads.complete_upload(self.session)
+        
+        self.assertEqual(recording.audio_file.name, self.session.storage_key)
+        self.assertEqual(self.session.status, 'completed')
+        with local_audio_copy(recording.audio_file) as path:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.payload)
+        self.assertFalse(os.path.exists(path))
+    
+    def test_presigned_form_binds_the_size(self):
+        policy = json.loads(base64.b64decode(self.session.upload['fields']['policy']))
+        self.assertIn(['content-length-range', len(self.payload), len(self.payload)], policy['conditions'])
+    
+    def test_wrong_size_object_is_deleted(self):
+        self.storage.client.put_object(Bucket='scriby-test', Key=self.session.storage_key, Body=self.payload[:100])
+        with self.assertRaises(uploads.UploadConflict):
+            uploads.complete_upload(self.session)
+        self.assertFalse(self.storage.exists(self.session.storage_key))
+    
+    def test_ranged_reads(self):
+        name = self.storage.save('clips/a.mp3', SimpleUploadedFile('a.mp3', self.payload))
+        with self.storage.open(name) as f:
+            f.seek(-10, io.SEEK_END)
+            self.assertEqual(f.read(), self.payload[-10:])
+    
+    def test_abort_deletes_object(self):
+        self.storage.client.put_object(Bucket='scriby-test', Key=self.session.storage_key, Body=self.payload)
+        uploads.abort_upload(self.session)
+        self.assertFalse(self.storage.exists(self.session.storage_key))
+
+
+class WaveformPeaksTest(TestCase):
+    """Test multi-resolution peaks and their binary encoding"""
+    
+    def test_blocks_of_any_size_give_same_peaks(self):
+        signal = np.sin(np.linspace(0, 400 * np.pi, 16000 * 5)).astype(np.float32) * 0.5
+        whole, chunked = PeakBuilder(), PeakBuilder()
+        whole.add(signal)
+        for start in range(0, len(signal), 7000):
+            chunked.add(signal[start:start + 7000])
+        
+        levels = chunked.finish()
+        self.assertTrue(np.array_equal(whole.finish()[0][1], levels[0][1]))
+        self.assertEqual(len(levels[0][1]), int(np.ceil(len(signal) / 512)))
+        self.assertLessEqual(len(levels[-1][1]), 1024)
+    
+    def test_encode_round_trip(self):
+        builder = PeakBuilder(samples_per_peak=4)
+        builder.add(np.array([0.0, 0.5, -0.5, 0.25] * 1500, dtype=np.float32))
+        data = encode_waveform(builder.finish(), 16000, bits=8)
+        decoded = decode_waveform(data)
+        
+        # Coarsest level first; int8 pairs are two bytes per peak
+        self.assertEqual(decoded['levels'][0]['samples_per_peak'], 8)
+        finest = decoded['levels'][-1]['peaks']
+        self.assertEqual(finest.shape, (1500, 2))
+        self.assertAlmostEqual(float(finest[0][0]), -0.5, places=2)
+        self.assertAlmostEqual(float(finest[0][1]), 0.5, places=2)
+
+
+class DiarizationTest(TestCase):
+    """Test incremental speaker clustering and merging turns onto segments"""
+
+    @staticmethod
+    def voice(pitch, formants, seconds, sample_rate=16000):
+        # Harmonic source shaped by a few formant peaks: distinct, stable timbres
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        source = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 30))
+        spectrum, freqs = np.fft.rfft(source), np.fft.rfftfreq(len(t), 1 / sample_rate)
+        envelope = sum(np.exp(-((freqs - f) / 120) ** 2) for f in formants) + 0.05
+        shaped = np.fft.irfft(spectrum * envelope, len(t))
+        return (0.3 * shaped / np.abs(shaped).max()).astype(np.float32)
+
+    def test_speakers_found_and_merged(self):
+        a, b = (120, [700, 1200, 2600]), (220, [400, 2000, 3000])
+        audio = np.concatenate([
+            self.voice(*a, 20), self.voice(*b, 15), np.zeros(16000 * 3, dtype=np.float32),
+            self.voice(*a, 10), self.voice(*b, 8),
+        ])
+        block = int(diarization.WINDOW_SECONDS * 16000) * diarization.WINDOWS_PER_BLOCK
+        turns = diarization.diarize_blocks((audio[i:i + block] for i in range(0, len(audio), block)), 16000)
+        self.assertEqual([speaker for _, _, speaker in turns], ['Speaker 1', 'Speaker 2', 'Speaker 1', 'Speaker 2'])
+
+        segments = [{'start': 1.0, 'end': 18.0, 'text': 'a'}, {'start': 22.0, 'end': 33.0, 'text': 'b'},
+                    {'start': 38.0, 'end': 47.0, 'text': 'c'}]
+        self.assertEqual(diarization.assign_speakers(segments, turns), 2)
+        self.assertEqual([s['speaker'] for s in segments], ['Speaker 1', 'Speaker 2', 'Speaker 1'])
+        labels = diarization.speaker_labels(segments)
+        self.assertEqual(labels[0], {'speaker': 'Speaker 1', 'segments': [0, 2], 'speaking_time': 26.0})
+
+    def test_labels_index_like_stored_segments(self):
+        segments = [
+            {'start': 0.0, 'end': 1.0, 'text': 'hi', 'speaker': 'Speaker 1'},
+            {'start': 1.0, 'end': 2.0, 'text': '  ', 'speaker': 'Speaker 2'},
+            {'start': 2.0, 'end': 3.0, 'text': 'there', 'speaker': 'Speaker 2'},
+        ]
+        labels = diarization.speaker_labels(segments)
+        self.assertEqual([label['segments'] for label in labels], [[0], [1]])
+        self.assertEqual(labels[1]['speaking_time'], 1.0)
+
+    def test_no_turns_leaves_segments_unlabelled(self):
+        segments = [{'start': 0.0, 'end': 2.0, 'text': 'hi'}]
+        self.assertEqual(diarization.assign_speakers(segments, []), 1)
+        self.assertNotIn('speaker', segments[0])
+
+
+class WordTimingsTest(TestCase):
+    """Test packed word timings and their time range queries"""
+
+    def setUp(self):
+        self.text = 'So the budget is approved.'
+        self.words = [
+            {'word': ' So', 'start': 0.0, 'end': 0.2, 'probability': 0.9},
+            {'word': ' the', 'start': 0.25, 'end': 0.4},
+            {'word': ' budget', 'start': 0.4, 'end': 0.9},
+            {'word': ' is', 'start': 1.5, 'end': 1.6},
+            {'word': ' approved.', 'start': 1.6, 'end': 2.3, 'probability': 0.5},
+        ]
+
+    def test_round_trip_and_range_query(self):
+        timings = WordTimings.decode(WordTimings.from_words(self.words, self.text).encode())
+        self.assertEqual(len(timings), 5)
+
+        words = timings.words(self.text, 0.3, 1.55)
+        self.assertEqual([w['word'] for w in words], ['the', 'budget', 'is'])
+        self.assertEqual((words[1]['start'], words[1]['end'], words[1]['char_offset']), (0.4, 0.9, 7))
+        self.assertEqual(timings.words(self.text, 2.0)[0]['confidence'], 0.502)
+        self.assertEqual(timings.word_at(0.5), 2)
+        self.assertIsNone(timings.word_at(1.2))
+
+        # Offsets no longer apply once the transcript is edited
+        self.assertIsNone(timings.words('So the budget was approved.', 0, 0.1)[0]['word'])
+
+    def test_much_smaller_than_json(self):
+        words = [
+            {'word': f' word{i % 50}', 'start': i * 0.4, 'end': i * 0.4 + 0.3, 'probability': 0.8}
+            for i in range(5000)
+        ]
+        text = ' '.join(w['word'].strip() for w in words)
+        packed = WordTimings.from_words(words, text).encode()
+        self.assertLess(len(packed), len(json.dumps(words)) / 10)
+
+    def test_non_finite_bounds_are_rejected(self):
+        user = User.objects.create_user(
+            email='words@scriby.com', username='words', password='testpass123',
+            first_name='Word', last_name='User'
+        )
+        recording = Recording.objects.create(
+            user=user, title='Call', original_filename='call.mp3', file_format='mp3',
+            audio_file=SimpleUploadedFile('call.mp3', b'fake', content_type='audio/mpeg')
+        )
+        transcription = Transcription.objects.create(recording=recording, text=self.text)
+        view = TranscriptionViewSet.as_view({'get': 'words'})
+        for query in ({'start': 'nan'}, {'start': '0', 'end': 'inf'}, {'end': '-Infinity'}):
+            request = APIRequestFactory().get('/transcriptions/words/', query)
+            force_authenticate(request, user=user)
+            response = view(request, pk=transcription.pk)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+
+class TranscriptionRevisionTest(TestCase):
+    """Test edit history as diffs against periodic snapshots"""
+
+    def test_diff_round_trip(self):
+        old = '  Hello there, this is\nthe first draft. '
+        new = 'Hello there,  this was\nthe second draft!'
+        self.assertEqual(revisions.apply_diff(old, revisions.make_diff(old, new)), new)
+        self.assertEqual(revisions.make_diff(old, old), [])
+
+    def test_any_version_replays(self):
+        user = User.objects.create_user(
+            email='editor@scriby.com', username='editor', password='testpass123',
+            first_name='Ed', last_name='Itor'
+        )
+        recording = Recording.objects.create(
+            user=user, title='Review', original_filename='review.mp3', file_format='mp3',
+            audio_file=SimpleUploadedFile('review.mp3', b'ID3x', content_type='audio/mpeg')
+        )
+        words = [f'word{i}' for i in range(200)]
+        transcription = Transcription.objects.create(recording=recording, text=' '.join(words))
+        texts = {1: transcription.text}
+        for version in range(2, 15):
+            words[version * 7] = f'edit{version}'
+            transcription.create_new_version(' '.join(words), user)
+            texts[version] = transcription.text
+
+        transcription.refresh_from_db()
+        self.assertEqual(transcription.version, 14)
+        for version, text in texts.items():
+            self.assertEqual(revisions.text_at_version(transcription, version), text)
+        # Original plus one periodic snapshot; the rest are small diffs
+        snapshots = transcription.revisions.filter(is_snapshot=True).values_list('version', flat=True)
+        self.assertEqual(list(snapshots), [1, 11])
+        self.assertEqual(transcription.revisions.get(version=5).diff, [[35, 36, 'edit5 ']])
+        with self.assertRaises(revisions.RevisionError):
+            revisions.text_at_version(transcription, 15)
+
+    def test_stale_instance_diffs_against_stored_text(self):
+        user = User.objects.create_user(
+            email='stale@scriby.com', username='stale', password='testpass123',
+            first_name='Stale', last_name='Editor'
+        )
+        recording = Recording.objects.create(
+            user=user, title='Review', original_filename='review.mp3', file_format='mp3',
+            audio_file=SimpleUploadedFile('review.mp3', b'ID3x', content_type='audio/mpeg')
+        )
+        words = [f'word{i}' for i in range(40)]
+        created = Transcription.objects.create(recording=recording, text=' '.join(words))
+        first, second = (Transcription.objects.get(pk=created.pk) for _ in range(2))
+
+        words[1] = 'edit1'
+        first.create_new_version(' '.join(words), user)
+        words[30] = 'edit2'
+        second.create_new_version(' '.join(words), user)  # loaded before the first edit
+
+        self.assertEqual(second.version, 3)
+        self.assertEqual(second.revisions.get(version=3).diff, [[30, 31, 'edit2 ']])
+        self.assertEqual(revisions.text_at_version(second, 2).split()[1], 'edit1')
+
+
+class UsageRolloverTest(TestCase):
+    """Test the bulk monthly usage rollover"""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{i}@scriby.com', username=f'user{i}', password='testpass123',
+                first_name='Usage', last_name=str(i)
+            )
+            for i in range(5)
+        ]
+        User.objects.update(monthly_transcription_minutes=42, monthly_api_calls=7)
+    
+    def test_previous_period_start(self):
+        """Test the closed period wraps across years"""
+        from datetime import date
+        self.assertEqual(previous_period_start(date(2025, 1, 15)), date(2024, 12, 1))
+        self.assertEqual(previous_period_start(date(2025, 8, 1)), date(2025, 7, 1))
+    
+    def test_rollover_archives_and_resets_once(self):
+        """Test counters are archived per user and a re-run is a no-op"""
+        from datetime import date
+        from .models import UserUsageHistory
+        
+        rollover = rollover_usage_period(date(2025, 7, 1), batch_size=2)
+        self.assertEqual(rollover.users_processed, 5)
+        self.assertFalse(User.objects.exclude(monthly_transcription_minutes=0).exists())
+        
+        User.objects.update(monthly_transcription_minutes=3)
+        rollover_usage_period(date(2025, 7, 1), batch_size=2)
+        
+        history = UserUsageHistory.objects.filter(period_start=date(2025, 7, 1))
+        self.assertEqual(history.count(), 5)
+        self.assertTrue(all(row.transcription_minutes == 42 for row in history))
+        self.assertEqual(User.objects.filter(monthly_transcription_minutes=3).count(), 5)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class QuotaServiceTest(TestCase):
+    """Test atomic quota reservations"""
+    
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.quota = QuotaService(self.client)
+        self.quota.sync('user-1', 'transcription_minutes', used=5, limit=10)
+    
+    def test_reservations_cannot_overshoot(self):
+        """Test holds count against the limit until released"""
+        first = self.quota.reserve('user-1', 'transcription_minutes', 3)
+        self.assertIsNotNone(first)
+        self.assertIsNone(self.quota.reserve('user-1', 'transcription_minutes', 3))
+        
+        self.assertTrue(self.quota.release(first))
+        self.assertIsNotNone(self.quota.reserve('user-1', 'transcription_minutes', 3))
+    
+    def test_commit_charges_actual_amount(self):
+        """Test committing moves the hold into used usage"""
+        token = self.quota.reserve('user-1', 'transcription_minutes', 4)
+        self.assertTrue(self.quota.commit(token, 2))
+        
+        counters = self.client.hgetall(counters_key('user-1', 'transcription_minutes'))
+        self.assertEqual(float(counters[b'used']), 7)
+        self.assertEqual(float(counters[b'reserved']), 0)
+    
+    def test_expired_holds_are_released(self):
+        """Test abandoned reservations are returned by reconciliation"""
+        import time
+        self.quota.reserve('user-1', 'transcription_minutes', 5)
+        self.assertFalse(self.quota.check('user-1', 'transcription_minutes', 1))
+        
+        self.assertEqual(self.quota.release_expired(now=time.time() + 365 * 86400), 1)
+        self.assertTrue(self.quota.check('user-1', 'transcription_minutes', 5))
+    
+    def test_minutes_round_up(self):
+        """Test partial minutes are charged as whole minutes, as they are reserved"""
+        self.assertEqual(minutes_for(630), 11)
+        self.assertEqual(minutes_for(600), 10)
+        self.assertEqual(minutes_for(None), 0)
+    
+    def test_reconcile_uses_this_periods_minutes(self):
+        """Test last month's minutes do not count and reconcile lowers a drifted counter"""
+        user = User.objects.create_user(
+            email='quota@scriby.com', username='quota', password='testpass123',
+            first_name='Quo', last_name='Ta'
+        )
+        record_usage_event(user.pk, 'transcription', minutes=600 / 60)
+        UsageEvent.objects.update(occurred_at=timezone.now().replace(day=1) - timedelta(days=3))
+        record_usage_event(user.pk, 'transcription', minutes=150 / 60)
+        
+        self.quota.check(user, 'transcription_minutes')  # primes the counter from Postgres
+        key = counters_key(user.pk, 'transcription_minutes')
+        self.assertEqual(float(self.client.hget(key, 'used')), 3)
+        
+        self.client.hset(key, 'used', 40)
+        self.quota.reconcile()
+        self.assertEqual(float(self.client.hget(key, 'used')), 3)
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class SlidingWindowLimiterTest(TestCase):
+    """Test the Redis sliding-window rate limiter"""
+    
+    def setUp(self):
+        self.limiter = SlidingWindowLimiter(fakeredis.FakeRedis(), window=60)
+        self.start = 1_700_000_040  # window boundary
+    
+    def test_limit_and_remaining(self):
+        """Test requests beyond the limit are rejected with a retry hint"""
+        results = [self.limiter.hit('user:1', 3, now=self.start + i) for i in range(4)]
+        self.assertEqual([r[0] for r in results], [True, True, True, False])
+        self.assertEqual([r[1] for r in results[:3]], [2, 1, 0])
+        self.assertGreater(results[3][2], 0)
+    
+    def test_previous_window_is_weighted(self):
+        """Test the previous window's count decays as the window slides"""
+        for i in range(4):
+            self.limiter.hit('user:1', 4, now=self.start + i)
+        # 5s into the next window, 55/60 of the previous 4 requests still count
+        self.assertFalse(self.limiter.hit('user:1', 4, now=self.start + 65)[0])
+        self.assertTrue(self.limiter.hit('user:1', 4, now=self.start + 105)[0])
+    
+    def test_user_invalidation_leaves_other_users_cached(self):
+        """Test a profile change reloads only that user's cached limit"""
+        client = self.limiter.client
+        self.addCleanup(throttling._plan_limits.clear)
+        throttling._plan_limits.update({1: (10, time.monotonic(), 0), 2: (20, time.monotonic(), 0)})
+        throttling._plan_generation = 0
+        
+        throttling.invalidate_plan_cache(1, client=client)
+        throttling._plan_limits[1] = (10, time.monotonic(), 0)  # another process's stale copy
+        _, _, _, generations = self.limiter.hit('user:1', 5, now=self.start)
+        throttling._observe_generations(1, *generations)
+        
+        self.assertEqual(generations, (0, 1))
+        self.assertNotIn(1, throttling._plan_limits)
+        self.assertIn(2, throttling._plan_limits)
+
+
+class PlanRateTest(TestCase):
+    """Test which hourly API limit applies to a user"""
+    
+    def setUp(self):
+        self.plan = SubscriptionPlan.objects.create(
+            name='Pro', slug='pro', description='Pro plan', price_monthly=Decimal('29.00'),
+            monthly_transcription_minutes=1000, api_rate_limit_per_hour=5000
+        )
+        self.user = User.objects.create_user(
+            email='rate@scriby.com', username='rate', password='testpass123',
+            first_name='Rate', last_name='User', subscription_plan=self.plan
+        )
+    
+    def test_plan_limit_applies_without_override(self):
+        """Test the plan's limit is used when the profile sets none"""
+        self.assertEqual(throttling._load_rate(self.user.pk), 5000)
+    
+    def test_profile_override_wins(self):
+        """Test an explicit per-user limit overrides the plan"""
+        UserProfile.objects.filter(user=self.user).update(api_rate_limit_per_hour=50)
+        self.assertEqual(throttling._load_rate(self.user.pk), 50)
+    
+    @skipUnless(fakeredis, 'fakeredis is not installed')
+    def test_playback_has_its_own_bucket(self):
+        """Test audio Range requests do not count against the API limit"""
+        UserProfile.objects.filter(user=self.user).update(api_rate_limit_per_hour=2)
+        throttling.invalidate_plan_cache(self.user.pk, client=fakeredis.FakeRedis())
+        request = RequestFactory().get('/')
+        request.user = self.user
+        drf_request = Mock(user=self.user, _request=request)
+        limiter = SlidingWindowLimiter(client=fakeredis.FakeRedis())
+        with patch.object(throttling, 'get_limiter', return_value=limiter):
+            for _ in range(5):
+                self.assertTrue(throttling.PlaybackRateThrottle().allow_request(drf_request, None))
+            self.assertTrue(throttling.PlanRateThrottle().allow_request(drf_request, None))
+            self.assertTrue(throttling.PlanRateThrottle().allow_request(drf_request, None))
+            self.assertFalse(throttling.PlanRateThrottle().allow_request(drf_request, None))
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class AuditStreamTest(TestCase):
+    """Test batched audit log delivery from the Redis stream"""
+    
+    def test_flush_writes_each_event_once(self):
+        """Test redelivered events do not create duplicate rows"""
+        from .models import AuditLog
+        client = fakeredis.FakeRedis()
+        events = [
+            build_audit_event(action='login', resource_type='authentication', request_data={'n': i})
+            for i in range(3)
+        ]
+        for event in events:
+            client.xadd(AUDIT_STREAM, event)
+        client.xadd(AUDIT_STREAM, events[0])  # at-least-once redelivery
+        
+        self.assertEqual(flush_audit_stream(consumer='test', client=client), 3)
+        self.assertEqual(AuditLog.objects.filter(action='login').count(), 3)
+        self.assertEqual(client.xlen(AUDIT_STREAM), 0)
+        
+        client.xadd(AUDIT_STREAM, events[1])  # redelivered after its batch committed
+        self.assertEqual(flush_audit_stream(consumer='test', client=client), 0)
+    
+    def test_synchronous_fallback_failure_is_logged(self):
+        """Test a failed fallback write after commit does not raise"""
+        event = build_audit_event(action='login', resource_type='authentication')
+        with patch.object(audit, '_redis', side_effect=ConnectionError('down')), \
+                patch.object(audit, 'write_audit_events', side_effect=Exception('db down')), \
+                self.assertLogs(audit.logger, level='ERROR'):
+            audit._enqueue(event)
+
+
+class VectorIndexTest(TestCase):
+    """Test the file-backed semantic vector index"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        rng = np.random.default_rng(42)
+        vectors = rng.normal(size=(500, 32)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    def test_exact_search_returns_nearest(self):
+        """Test an untrained index finds the query vector itself first"""
+        index = VectorIndex('tenant-a', root=self.root)
+        index.add(list(range(1000, 1500)), self.vectors)
+        
+        hits = index.search(self.vectors[123], k=5)
+        
+        self.assertEqual(len(index), 500)
+        self.assertEqual(hits[0][0], 1123)
+        self.assertAlmostEqual(hits[0][1], 1.0, places=2)
+    
+    def test_incremental_inserts_after_training(self):
+        """Test rows appended after training are still searchable"""
+        index = VectorIndex('tenant-b', root=self.root)
+        index.add(list(range(400)), self.vectors[:400])
+        index.train(iterations=3)
+        index.add(list(range(400, 500)), self.vectors[400:])
+        
+        hits = index.search(self.vectors[450], k=1, nprobe=2)
+        
+        self.assertEqual(hits[0][0], 450)
+    
+    def test_retried_adds_are_deduplicated(self):
+        """Test adding the same ids twice keeps one row per id"""
+        index = VectorIndex('tenant-c', root=self.root)
+        index.add(list(range(100)), self.vectors[:100], owner=7)
+        index.add(list(range(50, 150)), self.vectors[50:150], owner=7)
+        
+        self.assertEqual(len(index), 150)
+        self.assertEqual(len({pk for pk, _ in index.search(self.vectors[60], k=10)}), 10)
+    
+    def test_reindexing_tombstones_old_vectors(self):
+        """Test vectors of replaced segments no longer fill the top-k"""
+        index = VectorIndex('tenant-d', root=self.root)
+        index.add(list(range(100)), self.vectors[:100], owner=1)
+        index.add(list(range(100, 200)), self.vectors[100:200], owner=2)
+        
+        self.assertEqual(index.remove_owner(1), 100)
+        index.add(list(range(1000, 1100)), self.vectors[:100], owner=1)
+        
+        hits = index.search(self.vectors[5], k=5)
+        self.assertEqual(hits[0][0], 1005)
+        self.assertTrue(all(pk >= 100 for pk, _ in hits))
+
+
+class ExportRendererTest(TestCase):
+    """Test subtitle renderers built from segments"""
+    
+    def setUp(self):
+        self.segments = [
+            {'start': 0.0, 'end': 2.5, 'speaker': '', 'text': 'Hello'},
+            {'start': 3661.25, 'end': 3662.0, 'speaker': 'Ana', 'text': 'World'},
+        ]
+    
+    def test_format_timestamp(self):
+        """Test SRT and VTT timestamp separators"""
+        self.assertEqual(format_timestamp(3661.25), '01:01:01,250')
+        self.assertEqual(format_timestamp(0.5, '.'), '00:00:00.500')
+    
+    def test_render_srt(self):
+        """Test SRT cues are numbered and include speakers"""
+        output = ''.join(render_srt(None, self.segments))
+        self.assertTrue(output.startswith('1\n00:00:00,000 --> 00:00:02,500\nHello\n\n'))
+        self.assertIn('2\n01:01:01,250 --> 01:01:02,000\nAna: World', output)
+    
+    def test_render_vtt(self):
+        """Test VTT header and voice tags"""
+        output = ''.join(render_vtt(None, self.segments))
+        self.assertTrue(output.startswith('WEBVTT\n\n'))
+        self.assertIn('<v Ana>World', output)
+    
+    def test_render_vtt_escapes_cue_text(self):
+        """Test markup characters and cue arrows in text cannot break the file"""
+        segments = [{'start': 0.0, 'end': 1.0, 'speaker': 'R&D', 'text': 'a < b --> c & d\n\nnext'}]
+        output = ''.join(render_vtt(None, segments))
+        self.assertIn('<v R&amp;D>a &lt; b --&gt; c &amp; d\nnext\n\n', output)
+        self.assertEqual(output.count('-->'), 1)
+
+
+class BulkExportTest(TestCase):
+    """Test bulk archives are built from the filtered recordings and served for download"""
+    
+    def setUp(self):
+        self.settings_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(
+            email='exports@scriby.com', username='exports', password='testpass123',
+            first_name='Ex', last_name='Port'
+        )
+        self.english = self._recording('Weekly sync', 'en-US')
+        self.spanish = self._recording('Reunión semanal', 'es-ES')
+    
+    def _recording(self, title, language):
+        recording = Recording.objects.create(
+            user=self.user, title=title, original_filename='clip.mp3', file_format='mp3',
+            file_size_bytes=4, status='completed', language=language,
+            audio_file=SimpleUploadedFile('clip.mp3', b'ID3x', content_type='audio/mpeg'),
+        )
+        Transcription.objects.create(recording=recording, text=f'{title} notes')
+        return recording
+    
+    def test_archive_contains_only_filtered_recordings(self):
+        job = BulkExportJob.objects.create(
+            user=self.user, filters={'language': 'en-US'}, formats=['txt', 'srt'], include_analyses=False
+        )
+        build_bulk_export(str(job.id))
+        
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.recordings_count), ('completed', 1))
+        with job.archive_file.open('rb') as archive_file, zipfile.ZipFile(archive_file) as archive:
+            folder = f"weekly-sync-{str(self.english.id)[:8]}"
+            self.assertEqual(
+                sorted(archive.namelist()),
+                ['manifest.json', f'{folder}/transcript.srt', f'{folder}/transcript.txt']
+            )
+            self.assertIn(b'Weekly sync notes', archive.read(f'{folder}/transcript.txt'))
+            manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual([entry['recording_id'] for entry in manifest['recordings']], [str(self.english.id)])
+    
+    def test_unknown_filters_are_rejected(self):
+        serializer = BulkExportJobSerializer(data={'filters': {'speaker': 'Ana'}, 'formats': ['txt']})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('filters', serializer.errors)
+    
+    def test_download_waits_for_the_archive(self):
+        view = BulkExportViewSet.as_view({'get': 'download'})
+        job = BulkExportJob.objects.create(user=self.user, formats=['txt'])
+        
+        request = APIRequestFactory().get('/bulk-exports/download/')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(view(request, pk=job.pk).status_code, status.HTTP_409_CONFLICT)
+        
+        build_bulk_export(str(job.id))
+        request = APIRequestFactory().get('/bulk-exports/download/', HTTP_RANGE='bytes=0-3')
+        force_authenticate(request, user=self.user)
+        response = view(request, pk=job.pk)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'PK\x03\x04')
+
+
+class RangeHeaderTest(TestCase):
+    """Test byte-range parsing for resumable downloads"""
+    
+    def test_open_and_suffix_ranges(self):
+        """Test open-ended, bounded and suffix ranges"""
+        self.assertEqual(parse_range_header('bytes=100-', 1000), (100, 999))
+        self.assertEqual(parse_range_header('bytes=0-1999', 1000), (0, 999))
+        self.assertEqual(parse_range_header('bytes=-200', 1000), (800, 999))
+    
+    def test_ignored_and_unsatisfiable_ranges(self):
+        """Test malformed ranges are ignored and out-of-bounds ones rejected"""
+        self.assertIsNone(parse_range_header(None, 1000))
+        self.assertIsNone(parse_range_header('bytes=0-1,5-9', 1000))
+        with self.assertRaises(ValueError):
+            parse_range_header('bytes=1000-', 1000)
+
+
+class AudioStreamingResponseTest(TestCase):
+    """Test conditional, ranged and offloaded playback responses"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.root = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.root)
+        self.name = self.storage.save('clip.ogg', SimpleUploadedFile('clip.ogg', b'OggS' + bytes(96)))
+    
+    def test_conditional_and_ranged(self):
+        request = self.factory.get('/', HTTP_IF_NONE_MATCH='"abc"')
+        response = ranged_file_response(request, self.storage.open(self.name), 100, 'audio/ogg', etag='abc')
+        self.assertEqual(response.status_code, 304)
+        
+        request = self.factory.get('/', HTTP_RANGE='bytes=0-3', HTTP_IF_NONE_MATCH='"stale"')
+        response = ranged_file_response(request, self.storage.open(self.name), 100, 'audio/ogg', etag='abc')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'OggS')
+    
+    def test_offload(self):
+        request = self.factory.get('/')
+        self.assertIsNone(offloaded_file_response(request, self.storage, self.name, 'audio/ogg'))
+        with patch.object(streaming_module, 'STREAMING_OFFLOAD', 'x-accel-redirect'):
+            response = offloaded_file_response(request, self.storage, self.name, 'audio/ogg', etag='abc')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/clip.ogg')
+        self.assertEqual(response.content, b'')
+
+
 # =============================================================================
 # API TESTS
 # =============================================================================
@@ -534,6 +1702,14 @@ class UsageMetricsTest(TestCase):
             password='testpass123'
         )
     
+    def _settle_usage_events(self):
+        """Age ledger events past the rollup safety lag and fold them"""
+        from datetime import timedelta
+        from .models import UsageEvent
+        
+        UsageEvent.objects.update(recorded_at=timezone.now() - timedelta(seconds=90))
+        return rollup_usage_events()
+    
     def test_calculate_usage_metrics(self):
         """Test usage metrics calculation task"""
         # Create test data
@@ -560,6 +1736,9 @@ class UsageMetricsTest(TestCase):
             content='Test transcription',
             status='completed'
         )
+        # The pipeline meters the completed transcription in the ledger
+        record_usage_event(self.user.id, 'transcription', minutes=1, api_calls=1, recording_id=recording.id)
+        self._settle_usage_events()
         
         # Execute task
         result = calculate_usage_metrics(self.user.id)
@@ -573,6 +1752,30 @@ class UsageMetricsTest(TestCase):
         metrics = UsageMetrics.objects.get(user=self.user)
         self.assertEqual(metrics.recordings_count, 1)
         self.assertEqual(metrics.transcriptions_count, 1)
+    
+    def test_usage_metrics_from_ledger_rollups(self):
+        """Test minutes, tokens, calls and cost are read from ledger rollups"""
+        record_usage_event(self.user.id, 'transcription', minutes=10, api_calls=1)
+        record_usage_event(self.user.id, 'analysis', tokens=2000, api_calls=4)
+        record_usage_event(self.user.id, 'export', api_calls=1)
+        
+        self.assertEqual(self._settle_usage_events(), 3)
+        self.assertEqual(rollup_usage_events(), 0)
+        
+        result = calculate_usage_metrics(self.user.id)
+        
+        self.assertEqual(result['transcriptions_count'], 1)
+        self.assertEqual(result['transcription_minutes'], 10)
+        self.assertEqual(result['tokens'], 2000)
+        self.assertEqual(result['api_calls'], 6)
+        self.assertAlmostEqual(result['total_cost'], 0.0612)
+        self.assertEqual(result['stages']['export']['events'], 1)
+    
+    def test_unsettled_events_wait_for_database_time(self):
+        """Test fresh events are held back by the server-side safety lag"""
+        record_usage_event(self.user.id, 'embedding', api_calls=1)
+        self.assertEqual(rollup_usage_events(), 0)
+        self.assertEqual(self._settle_usage_events(), 1)
 
 
 class PerformanceTest(TestCase):
@@ -0,0 +1,249 @@
+"""
+Scriby - Plan-aware rate limiting
+Sliding-window-counter throttle evaluated in one Redis Lua call, with plan limits cached in-process
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# Constants
+THROTTLE_KEY_PREFIX = 'throttle'
+PLAN_GENERATION_KEY = f'{THROTTLE_KEY_PREFIX}:plan_generation'
+DEFAULT_RATE_PER_HOUR = getattr(settings, 'DEFAULT_API_RATE_LIMIT_PER_HOUR', 100)
+# Audio playback issues a Range request per seek and buffer refill
+PLAYBACK_RATE_PER_HOUR = getattr(settings, 'PLAYBACK_RATE_LIMIT_PER_HOUR', 3600)
+WINDOW_SECONDS = 3600
+PLAN_CACHE_TTL = 300  # seconds a cached plan limit is trusted without invalidation
+GENERATION_KEY_TTL = 24 * 3600
+
+# Sliding window counter: the previous fixed window's count, weighted by how
+# much of it still overlaps the sliding window, plus the current count.
+# O(1) memory and time per check regardless of the rate.
+# KEYS: current window, previous window, plan generation, identity generation
+# ARGV: limit, window (ms), elapsed in current window (ms)
+# Returns: {allowed, remaining, retry_after_ms, plan_generation, identity_generation}
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local generation = tonumber(redis.call('GET', KEYS[3]) or '0')
+local identity_generation = tonumber(redis.call('GET', KEYS[4]) or '0')
+local weighted = previous * (window - elapsed) / window
+if weighted + current + 1 > limit then
+  local retry = window - elapsed
+  if current + 1 <= limit and previous > 0 then
+    -- wait until enough of the previous window has slid out
+    local needed = window * (1 - (limit - current - 1) / previous)
+    retry = math.max(needed - elapsed, 1)
+  end
+  return {0, 0, math.ceil(retry), generation, identity_generation}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then redis.call('PEXPIRE', KEYS[1], window * 2) end
+return {1, math.max(math.floor(limit - weighted - current), 0), 0, generation, identity_generation}
+"""
+
+
+def generation_key(identity: str) -> str:
+    """Counter bumped when one identity's cached limit must be reloaded everywhere."""
+    return f'{THROTTLE_KEY_PREFIX}:{identity}:generation'
+
+
+class SlidingWindowLimiter:
+    """Redis-backed sliding-window counter shared by every app server."""
+
+    def __init__(self, client=None, window: int = WINDOW_SECONDS):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        self.client = client
+        self.window = window
+        self._script = client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def hit(self, identity: str, limit: int,
+            now: Optional[float] = None) -> Tuple[bool, int, float, Tuple[int, int]]:
+        """
+        Count one request for `identity`.
+        Returns (allowed, remaining, retry_after_seconds, generations), where
+        generations is (plan generation, identity generation).
+        """
+        now = time.time() if now is None else now
+        window_index, offset = divmod(now, self.window)
+        prefix = f'{THROTTLE_KEY_PREFIX}:{identity}'
+        allowed, remaining, retry_ms, generation, identity_generation = self._script(
+            keys=[
+                f'{prefix}:{int(window_index)}', f'{prefix}:{int(window_index) - 1}',
+                PLAN_GENERATION_KEY, generation_key(identity),
+            ],
+            args=[limit, self.window * 1000, int(offset * 1000)],
+        )
+        return bool(allowed), int(remaining), retry_ms / 1000.0, (int(generation), int(identity_generation))
+
+
+# =============================================================================
+# PLAN LIMIT CACHE
+# =============================================================================
+
+_plan_limits = {}  # user id -> (requests per hour, cached at, user generation or None until seen)
+_plan_generation = 0
+_plan_lock = threading.Lock()
+
+
+def _load_rate(user_id) -> int:
+    from .models import User
+
+    row = User.objects.filter(pk=user_id).values_list(
+        'profile__api_rate_limit_per_hour', 'subscription_plan__api_rate_limit_per_hour'
+    ).first()
+    if not row:
+        return DEFAULT_RATE_PER_HOUR
+    profile_rate, plan_rate = row
+    # A per-user override wins; null means "use the plan's limit"
+    if profile_rate is not None:
+        return profile_rate
+    return plan_rate or DEFAULT_RATE_PER_HOUR
+
+
+def plan_rate_for(user_id) -> int:
+    """Requests per hour allowed for a user, cached in-process."""
+    cached = _plan_limits.get(user_id)
+    if cached and time.monotonic() - cached[1] < PLAN_CACHE_TTL:
+        return cached[0]
+    rate = _load_rate(user_id)
+    with _plan_lock:
+        _plan_limits[user_id] = (rate, time.monotonic(), None)
+    return rate
+
+
+def _observe_generations(user_id, generation: int, user_generation: int):
+    """
+    Drop every cached limit once another process announced a plan edit, or
+    just this user's limit once their own generation moved.
+    """
+    global _plan_generation
+    with _plan_lock:
+        if generation != _plan_generation:
+            _plan_limits.clear()
+            _plan_generation = generation
+            return
+        cached = _plan_limits.get(user_id)
+        if cached is None or cached[2] == user_generation:
+            return
+        if cached[2] is None:
+            _plan_limits[user_id] = (cached[0], cached[1], user_generation)
+        else:
+            del _plan_limits[user_id]
+
+
+def invalidate_plan_cache(user_id=None, client=None):
+    """
+    Forget cached plan limits: one user's after a profile or plan change,
+    everyone's (user_id=None) after a SubscriptionPlan edit. This process
+    drops them immediately; others see the bumped generation on their next
+    throttle check.
+    """
+    with _plan_lock:
+        if user_id is None:
+            _plan_limits.clear()
+        else:
+            _plan_limits.pop(user_id, None)
+    try:
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        if user_id is None:
+            client.incr(PLAN_GENERATION_KEY)
+        else:
+            key = generation_key(f'{PlanRateThrottle.scope}:{user_id}')
+            client.pipeline().incr(key).expire(key, GENERATION_KEY_TTL).execute()
+    except Exception as e:
+        logger.warning(f"Could not publish plan cache invalidation: {str(e)}")
+
+
+# =============================================================================
+# DRF INTEGRATION
+# =============================================================================
+
+_limiter = None
+
+
+def get_limiter() -> SlidingWindowLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = SlidingWindowLimiter()
+    return _limiter
+
+
+class PlanRateThrottle(BaseThrottle):
+    """
+    Per-user hourly throttle using the subscription plan's limit.
+    Anonymous requests are limited per client IP at the default rate.
+    Fails open if Redis is unavailable.
+    """
+    scope = 'user'
+    plan_limited = True  # limit comes from the plan cache, which follows its generations
+
+    def rate_for(self, user_id) -> int:
+        return plan_rate_for(user_id)
+
+    def allow_request(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            identity = f'{self.scope}:{user.pk}'
+            limit = self.rate_for(user.pk)
+        else:
+            identity = f'anon:{self.get_ident(request)}'
+            limit = DEFAULT_RATE_PER_HOUR
+
+        try:
+            allowed, remaining, retry_after, generations = get_limiter().hit(identity, limit)
+        except Exception as e:
+            logger.error(f"Rate limiter unavailable, allowing request: {str(e)}")
+            return True
+
+        if self.plan_limited and user is not None and user.is_authenticated:
+            _observe_generations(user.pk, *generations)
+        self.retry_after = retry_after
+        reset = math.ceil(retry_after) if not allowed else WINDOW_SECONDS - int(time.time() % WINDOW_SECONDS)
+        # Picked up by RateLimitHeadersMixin.finalize_response
+        request._request.rate_limit = (limit, remaining, reset)
+        return allowed
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+class PlaybackRateThrottle(PlanRateThrottle):
+    """
+    Separate hourly bucket for audio streaming, so a player's Range requests
+    do not use up the user's API limit.
+    """
+    scope = 'playback'
+    plan_limited = False
+
+    def rate_for(self, user_id) -> int:
+        return PLAYBACK_RATE_PER_HOUR
+
+
+class RateLimitHeadersMixin:
+    """Adds X-RateLimit-* headers reported by PlanRateThrottle to API responses."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        rate_limit = getattr(getattr(request, '_request', request), 'rate_limit', None)
+        if rate_limit:
+            limit, remaining, reset = rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Reset'] = str(reset)
+        return response
@@ -0,0 +1,193 @@
+"""
+Scriby - Streaming upload validation
+Upload handler that enforces size limits and sniffs audio formats while the request body is still arriving
+"""
+
+import hashlib
+import logging
+import struct
+from typing import Dict, Optional
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_MAX_FILE_SIZE_MB = 100
+HEADER_PROBE_BYTES = 64 * 1024  # leading bytes kept for format sniffing and header parsing
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024  # form fields and boundaries around the file
+
+# Content types by sniffed container, matching RecordingUploadSerializer's allowed list
+AUDIO_CONTENT_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'm4a': 'audio/mp4',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+}
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'upload_too_large'
+
+
+class UnsupportedAudioFormat(APIException):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'Uploaded file is not a supported audio format. Allowed formats: MP3, WAV, M4A, FLAC, OGG'
+    default_code = 'unsupported_audio_format'
+
+
+def max_upload_bytes(user) -> int:
+    """Largest upload allowed for a user: the higher of their profile override and plan limit."""
+    limits = []
+    profile = getattr(user, 'profile', None)
+    if profile is not None:
+        limits.append(profile.max_file_size_mb)
+    if getattr(user, 'subscription_plan_id', None):
+        limits.append(user.subscription_plan.max_file_size_mb)
+    return (max(limits) if limits else DEFAULT_MAX_FILE_SIZE_MB) * 1024 * 1024
+
+
+def upload_ceiling_bytes() -> int:
+    """
+    Largest upload allowed for anyone. Used while the body is parsed before
+    the user is known (OAuth2 reads the form during authentication); the
+    serializer enforces the user's own limit afterwards.
+    """
+    from django.db.models import Max
+    from .models import SubscriptionPlan, UserProfile
+
+    limits = [
+        DEFAULT_MAX_FILE_SIZE_MB,
+        SubscriptionPlan.objects.filter(is_active=True).aggregate(limit=Max('max_file_size_mb'))['limit'],
+        UserProfile.objects.aggregate(limit=Max('max_file_size_mb'))['limit'],
+    ]
+    return max(limit for limit in limits if limit) * 1024 * 1024
+
+
+# =============================================================================
+# FORMAT SNIFFING
+# =============================================================================
+
+def sniff_audio_format(header: bytes) -> Optional[str]:
+    """Audio container from the file's leading bytes, or None if unrecognised."""
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[4:8] == b'ftyp':
+        return 'm4a'
+    if header[:3] == b'ID3':
+        return 'mp3'
+    # Bare MPEG audio frame: 11 sync bits, then a valid version and layer III
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06 == 0x02:
+        return 'mp3'
+    return None
+
+
+def probe_audio_header(fmt: str, header: bytes) -> Dict[str, int]:
+    """Sample rate and channel count from WAV and FLAC headers when present."""
+    try:
+        if fmt == 'wav':
+            # Walk RIFF chunks to "fmt "
+            position = 12
+            while position + 8 <= len(header):
+                chunk_id, chunk_size = header[position:position + 4], struct.unpack('<I', header[position + 4:position + 8])[0]
+                if chunk_id == b'fmt ' and position + 16 <= len(header):
+                    channels, sample_rate = struct.unpack('<HI', header[position + 10:position + 16])
+                    return {'sample_rate': sample_rate, 'channels': channels}
+                position += 8 + chunk_size + (chunk_size & 1)
+        elif fmt == 'flac' and len(header) >= 26:
+            # STREAMINFO is the first metadata block: 20-bit rate, 3-bit channels - 1
+            packed = int.from_bytes(header[18:21], 'big')
+            return {'sample_rate': packed >> 4, 'channels': ((packed >> 1) & 0x07) + 1}
+    except struct.error:
+        pass
+    return {}
+
+
+# =============================================================================
+# UPLOAD HANDLER
+# =============================================================================
+
+class AudioUploadHandler(TemporaryFileUploadHandler):
+    """
+    Temporary-file upload handler that validates audio while it streams in.
+
+    The request is refused from Content-Length before any body is read when
+    it is already over the limit. Otherwise the format is sniffed from the
+    first chunk and the size checked on every chunk, raising an API error
+    that stops parsing at once. The SHA-256 and a header probe are computed
+    on the way through and attached to the uploaded file.
+
+    The handler is installed before authentication, which may itself parse
+    the body, so the limit is resolved when the first byte arrives.
+    """
+
+    def __init__(self, request=None, max_bytes: Optional[int] = None):
+        super().__init__(request)
+        self._max_bytes = max_bytes
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is None:
+            user = getattr(self.request, 'user', None)
+            if user is not None and user.is_authenticated:
+                self._max_bytes = max_upload_bytes(user)
+            else:
+                self._max_bytes = upload_ceiling_bytes()
+        return self._max_bytes
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_bytes + MULTIPART_OVERHEAD_BYTES:
+            raise UploadTooLarge(self._too_large_message())
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.header = b''
+        self.audio_format = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject(UploadTooLarge(self._too_large_message()))
+
+        if len(self.header) < HEADER_PROBE_BYTES:
+            self.header += raw_data[:HEADER_PROBE_BYTES - len(self.header)]
+            if self.audio_format is None and len(self.header) >= 12:
+                self.audio_format = sniff_audio_format(self.header)
+                if self.audio_format is None:
+                    self._reject(UnsupportedAudioFormat())
+
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.audio_format is None:
+            # Smaller than the sniffing window
+            self.audio_format = sniff_audio_format(self.header)
+            if self.audio_format is None:
+                self._reject(UnsupportedAudioFormat())
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        uploaded.audio_format = self.audio_format
+        uploaded.sniffed_content_type = AUDIO_CONTENT_TYPES[self.audio_format]
+        uploaded.audio_header = probe_audio_header(self.audio_format, self.header)
+        return uploaded
+
+    def _reject(self, exc: APIException):
+        # Drop the partial temp file; the exception stops the parser reading the body
+        self.upload_interrupted()
+        raise exc
+
+    def _too_large_message(self) -> str:
+        return f'File size cannot exceed {self.max_bytes // (1024 * 1024)}MB'
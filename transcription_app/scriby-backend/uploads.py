@@ -0,0 +1,371 @@
+"""
+Scriby - Resumable uploads
+Chunked recording uploads with per-chunk checksums, offset-based resume and in-place assembly,
+plus direct-to-object-storage uploads through presigned URLs
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .storage import read_header, supports_direct_upload
+from .upload_handlers import sniff_audio_format
+
+logger = logging.getLogger(__name__)
+
+# Constants
+# Partial files live next to MEDIA_ROOT so completion is a rename, not a copy
+UPLOAD_PARTIAL_DIR = getattr(
+    settings, 'UPLOAD_PARTIAL_DIR', os.path.join(str(settings.MEDIA_ROOT), 'uploads', 'partial')
+)
+UPLOAD_SESSION_TTL_HOURS = getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24)
+MAX_CHUNK_SIZE = 64 * 1024 * 1024  # bytes accepted per append request
+STREAM_BUFFER_SIZE = 1024 * 1024
+FORMAT_MAPPING = {'mp3': 'mp3', 'wav': 'wav', 'm4a': 'm4a', 'flac': 'flac', 'ogg': 'ogg'}
+ALLOWED_CONTENT_TYPES = ['audio/mpeg', 'audio/wav', 'audio/mp4', 'audio/flac', 'audio/ogg']
+
+
+class UploadError(Exception):
+    """Upload request that cannot be applied to the session in its current state"""
+    status = 400
+
+
+class UploadConflict(UploadError):
+    """Append at an offset other than the session's current one"""
+    status = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UnsupportedAudio(UploadError):
+    """First chunk does not start like any accepted audio format"""
+    status = 415
+
+
+class ChecksumMismatch(UploadError):
+    """Chunk or file content does not match the checksum the client sent"""
+    status = 460  # tus "Checksum Mismatch"
+
+
+# =============================================================================
+# SESSION LIFECYCLE
+# =============================================================================
+
+def initiate_upload(user, filename: str, content_type: str, total_size: int,
+                    sha256: str = '', metadata: Optional[dict] = None):
+    """Open a session and its empty partial file."""
+    from .models import UploadSession
+
+    os.makedirs(UPLOAD_PARTIAL_DIR, exist_ok=True)
+    session = UploadSession(
+        user=user,
+        filename=os.path.basename(filename),
+        content_type=content_type,
+        total_size=total_size,
+        sha256=sha256.lower(),
+        metadata=metadata or {},
+        expires_at=timezone.now() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    )
+    session.partial_path = os.path.join(UPLOAD_PARTIAL_DIR, f'{session.id}.part')
+    open(session.partial_path, 'wb').close()
+    session.save()
+    return session
+
+
+def _recording_storage():
+    from .models import Recording
+
+    return Recording._meta.get_field('audio_file').storage
+
+
+def initiate_direct_upload(user, filename: str, content_type: str, total_size: int,
+                           sha256: str = '', metadata: Optional[dict] = None):
+    """
+    Open a session whose client POSTs the file straight to object storage.
+    Returns the session with `upload` set to the presigned request to make.
+    """
+    from .models import Recording, UploadSession
+
+    storage = _recording_storage()
+    if not supports_direct_upload(storage):
+        raise UploadError("Direct uploads need object storage; use chunked uploads instead")
+
+    session = UploadSession(
+        user=user,
+        filename=os.path.basename(filename),
+        content_type=content_type,
+        total_size=total_size,
+        sha256=sha256.lower(),
+        metadata=metadata or {},
+        expires_at=timezone.now() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    )
+    field = Recording._meta.get_field('audio_file')
+    session.storage_key = field.generate_filename(None, f'{session.id}-{session.filename}')
+    session.save()
+    session.upload = storage.presigned_post(
+        session.storage_key, content_type, total_size, sha256=session.sha256
+    )
+    return session
+
+
+def append_chunk(session, offset: int, stream, length: int, checksum: Optional[str] = None) -> int:
+    """
+    Write `length` bytes from `stream` at `offset` and return the new offset.
+
+    The body is streamed straight into the partial file, never buffered in
+    memory or spooled elsewhere. Without a checksum, a connection that drops
+    mid-chunk still keeps the bytes that arrived (tus semantics); with one,
+    the chunk only counts if it arrived whole and matches.
+    """
+    from .models import UploadSession
+
+    if session.status != 'uploading':
+        raise UploadError(f"Upload is {session.status}")
+    if session.storage_key:
+        raise UploadError("Direct uploads are sent to their storage URL, not appended")
+    if offset != session.offset:
+        raise UploadConflict(f"Upload is at offset {session.offset}, not {offset}", session.offset)
+    if length <= 0 or length > MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunk size must be between 1 and {MAX_CHUNK_SIZE} bytes")
+    if offset + length > session.total_size:
+        raise UploadError("Chunk extends past the declared upload size")
+
+    digest = hashlib.sha256()
+    received = 0
+    with open(session.partial_path, 'r+b') as partial:
+        # One writer per session: a second append at the same offset would
+        # otherwise write over bytes the first one is about to commit. The
+        # lock is released when the file closes, after the offset update.
+        try:
+            fcntl.flock(partial.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another chunk is being written to this upload", session.offset)
+        session.refresh_from_db(fields=['offset', 'status'])
+        if session.status != 'uploading':
+            raise UploadError(f"Upload is {session.status}")
+        if offset != session.offset:
+            raise UploadConflict(f"Upload is at offset {session.offset}, not {offset}", session.offset)
+
+        # Writes go at an explicit position: bytes past the committed offset
+        # are scratch space until the offset update below succeeds
+        partial.seek(offset)
+        while received < length:
+            data = stream.read(min(STREAM_BUFFER_SIZE, length - received))
+            if not data:
+                break
+            if not received and offset == 0 and sniff_audio_format(data) is None:
+                # Refuse before a single byte lands on disk
+                raise UnsupportedAudio("Upload does not look like a supported audio file")
+            partial.write(data)
+            digest.update(data)
+            received += len(data)
+        partial.flush()
+        os.fsync(partial.fileno())
+
+        if checksum and (received != length or digest.hexdigest() != checksum.lower()):
+            raise ChecksumMismatch("Chunk checksum does not match")
+        if not received:
+            return offset
+
+        advanced = UploadSession.objects.filter(pk=session.pk, offset=offset, status='uploading').update(
+            offset=offset + received,
+            chunks_received=F('chunks_received') + 1,
+            updated_at=timezone.now(),
+        )
+    if not advanced:
+        session.refresh_from_db(fields=['offset', 'status'])
+        raise UploadConflict("Upload was advanced by another request", session.offset)
+    session.offset = offset + received
+    return session.offset
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _store_partial(session, recording, partial) -> str:
+    """
+    Move the assembled file into the recording's storage location. On local
+    storage this is a rename; remote storages stream the open `partial` in
+    one pass.
+    """
+    field = recording.audio_file.field
+    name = field.generate_filename(recording, session.filename)
+    storage = field.storage
+    if isinstance(storage, FileSystemStorage):
+        name = storage.get_available_name(name)
+        target = storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(session.partial_path, target)
+        return name
+    return storage.save(name, File(partial))
+
+
+def _unstore_partial(session, recording, name: str):
+    """Undo _store_partial after the database work failed."""
+    storage = recording.audio_file.field.storage
+    if isinstance(storage, FileSystemStorage):
+        os.replace(storage.path(name), session.partial_path)
+    else:
+        storage.delete(name)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def complete_upload(session):
+    """
+    Turn a fully received session into a Recording, ready for processing.
+    Returns the recording; the caller queues processing after commit.
+    """
+    from .models import UploadSession
+
+    if session.status != 'uploading':
+        raise UploadError(f"Upload is {session.status}")
+    if session.storage_key:
+        return _complete_direct_upload(session)
+    if not session.is_complete:
+        raise UploadConflict(
+            f"Upload has {session.offset} of {session.total_size} bytes", session.offset
+        )
+    if session.sha256 and _file_sha256(session.partial_path) != session.sha256:
+        raise ChecksumMismatch("Uploaded file does not match its checksum")
+
+    try:
+        partial = open(session.partial_path, 'rb')
+    except FileNotFoundError:
+        raise UploadError("Upload is already being completed")
+    with partial:
+        # The append lock keeps a concurrent completion from storing the file
+        # twice. Storing can take minutes on remote storage, so it happens
+        # before the transaction, which then only locks the session briefly.
+        try:
+            fcntl.flock(partial.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Upload is already being completed", session.offset)
+        session.refresh_from_db(fields=['status'])
+        if session.status != 'uploading':
+            raise UploadError(f"Upload is {session.status}")
+        recording = _new_recording(session)
+        name = _store_partial(session, recording, partial)
+        try:
+            with transaction.atomic():
+                locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+                if locked.status != 'uploading':
+                    raise UploadError(f"Upload is {locked.status}")
+                recording.audio_file.name = name
+                recording.save()
+                locked.status = 'completed'
+                locked.recording = recording
+                locked.save(update_fields=['status', 'recording', 'updated_at'])
+        except Exception:
+            _unstore_partial(session, recording, name)
+            raise
+    # Remote storages got a copy; a local partial was already renamed away
+    _remove(session.partial_path)
+    session.status, session.recording = locked.status, recording
+    return recording
+
+
+def _new_recording(session):
+    from .models import Recording
+
+    metadata = session.metadata
+    extension = os.path.splitext(session.filename)[1].lower().lstrip('.')
+    return Recording(
+        user_id=session.user_id,
+        title=metadata.get('title') or os.path.splitext(session.filename)[0],
+        description=metadata.get('description', ''),
+        language=metadata.get('language') or 'en-US',
+        tags=metadata.get('tags') or [],
+        original_filename=session.filename,
+        file_format=FORMAT_MAPPING.get(extension, 'mp3'),
+        file_size_bytes=session.total_size,
+        status='uploaded',
+    )
+
+
+def _complete_direct_upload(session):
+    """
+    Adopt the object the client POSTed as the recording's audio, without
+    copying it: check its size and first bytes with a HEAD and one ranged GET.
+    An object that fails either check is deleted, so the client can retry.
+    """
+    from .models import UploadSession
+
+    storage = _recording_storage()
+    if not storage.exists(session.storage_key):
+        raise UploadConflict("Nothing has been uploaded to the storage URL yet", 0)
+    size = storage.size(session.storage_key)
+    if size != session.total_size:
+        _discard_direct_upload(storage, session)
+        raise UploadConflict(f"Stored object had {size} of {session.total_size} bytes", 0)
+
+    recording = _new_recording(session)
+    recording.audio_file.name = session.storage_key
+    if sniff_audio_format(read_header(recording.audio_file)) is None:
+        _discard_direct_upload(storage, session)
+        raise UnsupportedAudio("Upload does not look like a supported audio file")
+
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if locked.status != 'uploading':
+            raise UploadError(f"Upload is {locked.status}")
+        recording.save()
+        locked.status, locked.offset, locked.recording = 'completed', size, recording
+        locked.save(update_fields=['status', 'offset', 'recording', 'updated_at'])
+    session.status, session.offset, session.recording = locked.status, locked.offset, recording
+    return recording
+
+
+def _discard_direct_upload(storage, session):
+    try:
+        storage.delete(session.storage_key)
+    except Exception as e:
+        logger.warning(f"Could not delete direct upload {session.storage_key}: {str(e)}")
+
+
+def abort_upload(session, status: str = 'aborted'):
+    """Close a session and delete whatever was received."""
+    from .models import UploadSession
+
+    UploadSession.objects.filter(pk=session.pk, status='uploading').update(
+        status=status, updated_at=timezone.now()
+    )
+    session.status = status
+    if session.storage_key:
+        _discard_direct_upload(_recording_storage(), session)
+    else:
+        _remove(session.partial_path)
+
+
+def expire_upload_sessions() -> int:
+    """Abort sessions whose client never came back."""
+    from .models import UploadSession
+
+    expired = 0
+    stale = UploadSession.objects.filter(status='uploading', expires_at__lt=timezone.now())
+    for session in stale.iterator(chunk_size=500):
+        abort_upload(session, status='expired')
+        expired += 1
+    return expired
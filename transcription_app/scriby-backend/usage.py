@@ -0,0 +1,253 @@
+"""
+Scriby - Usage accounting
+Usage event ledger with incremental rollups, and the monthly usage period rollover
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, DateTimeField, ExpressionWrapper, Func, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import (
+    User, UsageEvent, UsageRollover, UsageRollup, UsageRollupState, UserUsageHistory
+)
+
+logger = logging.getLogger(__name__)
+
+# Constants
+ROLLOVER_BATCH_SIZE = 5000
+ROLLUP_BATCH_SIZE = 10_000
+ROLLUP_GRANULARITIES = ('hour', 'day', 'month')
+ROLLUP_STATE_NAME = 'usage_rollup'
+# Events recorded (by database wall-clock time) less than this ago are left
+# for the next run, so rows whose sequence ids were allocated before a
+# still-open transaction commits are not skipped. This holds only while the
+# transactions writing events commit within the lag, so keep slow work such
+# as storage uploads out of them.
+ROLLUP_SAFETY_LAG = timedelta(seconds=60)
+COST_PER_TRANSCRIPTION_MINUTE = Decimal('0.006')
+COST_PER_1K_TOKENS = Decimal('0.0006')
+ROLLUP_FIELDS = ('minutes', 'tokens', 'api_calls', 'events', 'cost')
+
+
+# =============================================================================
+# USAGE LEDGER
+# =============================================================================
+
+class ClockTimestamp(Func):
+    """
+    Postgres wall-clock time. Unlike Now(), which is the start of the current
+    transaction, it keeps advancing while a transaction stays open.
+    """
+    template = 'clock_timestamp()'
+    output_field = DateTimeField()
+
+
+def usage_cost(stage: str, minutes: float = 0.0, tokens: int = 0) -> Decimal:
+    """Provider cost of one usage event."""
+    cost = COST_PER_1K_TOKENS * Decimal(tokens) / 1000
+    if stage == 'transcription':
+        cost += COST_PER_TRANSCRIPTION_MINUTE * Decimal(str(minutes))
+    return cost.quantize(Decimal('0.000001'))
+
+
+class UsageMeter:
+    """
+    Accumulates tokens and calls across several provider requests, so one
+    ledger event can be recorded for a stage without threading counts
+    through every helper's return value.
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.api_calls = 0
+
+    def add(self, tokens: int = 0, api_calls: int = 1):
+        self.tokens += tokens or 0
+        self.api_calls += api_calls
+
+
+def record_usage_event(user_id, stage: str, minutes: float = 0.0, tokens: int = 0,
+                       api_calls: int = 0, recording_id=None) -> UsageEvent:
+    """Append one usage event to the ledger."""
+    return UsageEvent.objects.create(
+        user_id=user_id,
+        recording_id=recording_id,
+        stage=stage,
+        minutes=minutes,
+        tokens=tokens,
+        api_calls=api_calls,
+        cost=usage_cost(stage, minutes, tokens),
+        recorded_at=ClockTimestamp(),
+    )
+
+
+def _rollup_batch(batch_size: int) -> int:
+    """Fold the next batch of ledger events into the rollups; returns events folded."""
+    UsageRollupState.objects.get_or_create(name=ROLLUP_STATE_NAME)
+    with transaction.atomic():
+        # The row lock makes concurrent rollup workers take turns
+        state = UsageRollupState.objects.select_for_update().get(name=ROLLUP_STATE_NAME)
+        # Compared against the database clock, like recorded_at itself
+        pending = list(
+            UsageEvent.objects.filter(id__gt=state.last_event_id).annotate(
+                settled=ExpressionWrapper(
+                    Q(recorded_at__lt=ClockTimestamp() - ROLLUP_SAFETY_LAG), output_field=BooleanField()
+                )
+            ).order_by('id').values_list('id', 'settled')[:batch_size]
+        )
+        settled = 0
+        for _, is_settled in pending:
+            if not is_settled:
+                break
+            settled += 1
+        if not settled:
+            return 0
+        high_id = pending[settled - 1][0]
+        events = UsageEvent.objects.filter(id__gt=state.last_event_id, id__lte=high_id)
+
+        for granularity in ROLLUP_GRANULARITIES:
+            groups = events.annotate(bucket=Trunc('occurred_at', granularity)).values(
+                'user_id', 'stage', 'bucket'
+            ).annotate(
+                minutes=Sum('minutes'), tokens=Sum('tokens'), api_calls=Sum('api_calls'),
+                events=Count('id'), cost=Sum('cost'),
+            ).order_by()
+            _merge_rollups(granularity, list(groups))
+
+        state.last_event_id = high_id
+        state.save(update_fields=['last_event_id', 'updated_at'])
+    return settled
+
+
+def _merge_rollups(granularity: str, groups):
+    """Add aggregated groups onto existing rollup rows, creating missing ones."""
+    if not groups:
+        return
+    existing = {
+        (row.user_id, row.stage, row.bucket_start): row
+        for row in UsageRollup.objects.filter(
+            granularity=granularity,
+            user_id__in={group['user_id'] for group in groups},
+            bucket_start__in={group['bucket'] for group in groups},
+        )
+    }
+    to_update, to_create = [], []
+    for group in groups:
+        key = (group['user_id'], group['stage'], group['bucket'])
+        row = existing.get(key)
+        if row is None:
+            to_create.append(UsageRollup(
+                user_id=group['user_id'], granularity=granularity,
+                bucket_start=group['bucket'], stage=group['stage'],
+                **{field: group[field] or 0 for field in ROLLUP_FIELDS}
+            ))
+        else:
+            for field in ROLLUP_FIELDS:
+                setattr(row, field, getattr(row, field) + (group[field] or 0))
+            to_update.append(row)
+    UsageRollup.objects.bulk_create(to_create, batch_size=1000)
+    UsageRollup.objects.bulk_update(to_update, ROLLUP_FIELDS, batch_size=1000)
+
+
+def rollup_usage_events(batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Fold every settled ledger event past the watermark into the rollups."""
+    folded = 0
+    while True:
+        count = _rollup_batch(batch_size)
+        if not count:
+            break
+        folded += count
+    return folded
+
+
+def usage_totals(user, granularity: str, start: datetime, end: datetime) -> Dict[str, Dict]:
+    """Per-stage usage totals for [start, end) read from pre-aggregated rollups."""
+    rows = UsageRollup.objects.filter(
+        user=user, granularity=granularity, bucket_start__gte=start, bucket_start__lt=end
+    ).values('stage').annotate(
+        minutes=Sum('minutes'), tokens=Sum('tokens'), api_calls=Sum('api_calls'),
+        events=Sum('events'), cost=Sum('cost'),
+    ).order_by()
+    return {row['stage']: {field: row[field] or 0 for field in ROLLUP_FIELDS} for row in rows}
+
+
+# =============================================================================
+# PERIOD ROLLOVER
+# =============================================================================
+
+
+def previous_period_start(today: Optional[date] = None) -> date:
+    """First day of the month before `today`, i.e. the period being closed."""
+    today = today or timezone.now().date()
+    if today.month == 1:
+        return date(today.year - 1, 12, 1)
+    return date(today.year, today.month - 1, 1)
+
+
+def _rollover_batch(rollover: UsageRollover, batch_size: int) -> int:
+    """
+    Archive and reset the next batch of users after the watermark.
+    Rows are locked, copied to history and zeroed in one transaction together
+    with the watermark, so a crash either applies a whole batch or none of it
+    and increments landing mid-batch are never lost.
+    """
+    with transaction.atomic():
+        users = User.objects.order_by('pk').select_for_update()
+        if rollover.last_user_id:
+            users = users.filter(pk__gt=rollover.last_user_id)
+        rows = list(users.values_list(
+            'pk', 'monthly_transcription_minutes', 'monthly_api_calls',
+            'total_recordings', 'subscription_plan_id'
+        )[:batch_size])
+        if not rows:
+            return 0
+
+        UserUsageHistory.objects.bulk_create([
+            UserUsageHistory(
+                user_id=pk,
+                period_start=rollover.period_start,
+                transcription_minutes=minutes,
+                api_calls=api_calls,
+                total_recordings=recordings,
+                subscription_plan_id=plan_id,
+            )
+            for pk, minutes, api_calls, recordings, plan_id in rows
+        ], ignore_conflicts=True)
+
+        # Reset exactly the locked rows; users created inside the key range
+        # since the SELECT have nothing to archive for this period
+        User.objects.filter(pk__in=[row[0] for row in rows]).update(
+            monthly_transcription_minutes=0, monthly_api_calls=0
+        )
+
+        rollover.last_user_id = rows[-1][0]
+        rollover.users_processed += len(rows)
+        rollover.save(update_fields=['last_user_id', 'users_processed', 'updated_at'])
+    return len(rows)
+
+
+def rollover_usage_period(period_start: Optional[date] = None,
+                          batch_size: int = ROLLOVER_BATCH_SIZE) -> UsageRollover:
+    """
+    Close a usage period for every user. Safe to re-run: a completed period is
+    a no-op, and an interrupted one continues from its watermark.
+    """
+    period_start = (period_start or previous_period_start()).replace(day=1)
+    rollover, _ = UsageRollover.objects.get_or_create(period_start=period_start)
+    if rollover.completed_at:
+        logger.info(f"Usage rollover for {period_start:%Y-%m} already completed")
+        return rollover
+
+    while _rollover_batch(rollover, batch_size):
+        pass
+
+    rollover.completed_at = timezone.now()
+    rollover.save(update_fields=['completed_at', 'updated_at'])
+    logger.info(f"Usage rollover for {period_start:%Y-%m} completed: {rollover.users_processed} users")
+    return rollover
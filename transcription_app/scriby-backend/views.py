@@ -7,7 +7,7 @@ Date: 2025-08-06
 Tech Stack: Django REST Framework, JWT Authentication, Celery, WebSockets
 """
 
-from rest_framework import viewsets, status, permissions, filters
+from rest_framework import viewsets, mixins, status, permissions, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -15,10 +15,10 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from rest_framework.throttling import AnonRateThrottle
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Q, Count, Sum, Avg
+from django.db.models import Q
 from django.utils import timezone
 from django.core.cache import cache
 from django.conf import settings
@@ -26,13 +26,18 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.db import transaction
+import base64
+import binascii
+import hashlib
 import json
 import logging
+import math
 from datetime import timedelta
 
 from .models import (
     User, UserProfile, SubscriptionPlan, Recording, Transcription, 
-    Analysis, UsageMetrics, BillingTransaction, AuditLog
+    TranscriptSegment, Analysis, UsageMetrics, BillingTransaction, AuditLog,
+    BulkExportJob, UploadSession
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, LoginSerializer,
@@ -40,11 +45,30 @@ from .serializers import (
     RecordingUploadSerializer, TranscriptionSerializer, AnalysisSerializer,
     UsageMetricsSerializer, BillingTransactionSerializer, AuditLogSerializer,
     BulkRecordingDeleteSerializer, APIResponseSerializer, HealthCheckSerializer,
-    SystemStatsSerializer
+    SystemStatsSerializer, TranscriptSegmentSerializer, BulkExportJobSerializer,
+    UploadSessionSerializer
 )
 from .permissions import IsOwnerOrReadOnly, IsSubscriptionActive, HasAPIQuota
-from .tasks import process_audio_transcription, generate_ai_analysis
-from .utils import log_audit_event, check_user_quota, get_system_stats
+from .exports import EXPORT_FORMATS, ExportContentNegotiation, ExportError, export_response
+from .audit import log_audit_event
+from .caching import cache_metrics, swr_cached
+from .dashboard import STATS_CACHE_NAMESPACES, build_dashboard
+from .filters import RecordingFilter
+from .lifecycle import RENDITIONS, playback_source, storage_report
+from .quota import commit_quota, minutes_for, release_quota, reserve_quota
+from .revisions import RevisionError, revision_history, text_at_version
+from .scratch import scratch_metrics
+from .search import FullTextSearchFilter, search_segments
+from .semantic import semantic_search
+from .streaming import offloaded_file_response, ranged_file_response
+from .throttling import PlanRateThrottle, PlaybackRateThrottle, RateLimitHeadersMixin
+from .upload_handlers import AudioUploadHandler
+from .uploads import UploadConflict, UploadError, abort_upload, append_chunk, complete_upload
+from .usage import record_usage_event
+from .waveforms import WAVEFORM_CONTENT_TYPE, waveform_version
+from .word_timings import load_word_timings
+from .tasks import process_audio_transcription, generate_ai_analysis, build_bulk_export
+from .utils import get_system_stats
 
 logger = logging.getLogger(__name__)
 
@@ -63,17 +87,9 @@ class RecordingCursorPagination(CursorPagination):
     cursor_query_param = 'cursor'
 
 
-class CustomUserRateThrottle(UserRateThrottle):
+class CustomUserRateThrottle(PlanRateThrottle):
     """Custom rate throttling based on user subscription plan."""
-    
-    def get_rate(self):
-        """Get rate limit based on user's subscription plan."""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            user = self.request.user
-            if hasattr(user, 'profile'):
-                rate_limit = user.profile.api_rate_limit_per_hour
-                return f"{rate_limit}/hour"
-        return "100/hour"  # Default rate
+    scope = 'user'
 
 
 # Authentication Views
@@ -191,8 +207,26 @@ class LogoutView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Cached per-user stats (see caching.py)
+@swr_cached('usage_stats', fresh=300, stale=3600)
+def recording_stats(user):
+    """Recording counts and plan allowance behind the usage stats endpoint."""
+    return {
+        'total_recordings': user.recordings.count(),
+        'recent_activity': user.recordings.filter(
+            created_at__gte=timezone.now() - timedelta(days=7)
+        ).count(),
+        'plan_minutes': (
+            user.subscription_plan.monthly_transcription_minutes if user.subscription_plan_id else None
+        ),
+    }
+
+
+cached_dashboard = swr_cached('analytics', fresh=600, stale=6 * 3600)(build_dashboard)
+
+
 # Main ViewSets
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(RateLimitHeadersMixin, viewsets.ModelViewSet):
     """User management ViewSet with profile integration."""
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -229,28 +263,20 @@ class UserViewSet(viewsets.ModelViewSet):
     def usage_stats(self, request):
         """Get user usage statistics."""
         user = request.user
-        cache_key = f"user_stats_{user.id}"
-        
-        # Try to get from cache first
-        stats = cache.get(cache_key)
-        if not stats:
-            stats = {
-                'total_recordings': user.recordings.count(),
-                'total_transcription_minutes': user.monthly_transcription_minutes,
-                'total_api_calls': user.monthly_api_calls,
-                'subscription_usage_percentage': 0,
-                'recent_activity': user.recordings.filter(
-                    created_at__gte=timezone.now() - timedelta(days=7)
-                ).count()
-            }
-            
-            if user.subscription_plan:
-                usage_pct = (user.monthly_transcription_minutes / 
-                           user.subscription_plan.monthly_transcription_minutes) * 100
-                stats['subscription_usage_percentage'] = min(usage_pct, 100)
-            
-            # Cache for 5 minutes
-            cache.set(cache_key, stats, 300)
+        cached = recording_stats(user)
+        
+        # Usage counters come from the user row loaded for this request, so
+        # they are current even while the cached counts are being refreshed
+        stats = {
+            'total_recordings': cached['total_recordings'],
+            'total_transcription_minutes': user.monthly_transcription_minutes,
+            'total_api_calls': user.monthly_api_calls,
+            'subscription_usage_percentage': 0,
+            'recent_activity': cached['recent_activity'],
+        }
+        if cached['plan_minutes']:
+            usage_pct = (user.monthly_transcription_minutes / cached['plan_minutes']) * 100
+            stats['subscription_usage_percentage'] = min(usage_pct, 100)
         
         return Response(stats)
 
@@ -263,14 +289,14 @@ class SubscriptionPlanViewSet(viewsets.ReadOnlyModelViewSet):
     throttle_classes = [AnonRateThrottle]
 
 
-class RecordingViewSet(viewsets.ModelViewSet):
+class RecordingViewSet(RateLimitHeadersMixin, viewsets.ModelViewSet):
     """Recording management ViewSet with file upload and processing."""
     serializer_class = RecordingSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly, IsSubscriptionActive]
     throttle_classes = [CustomUserRateThrottle]
     pagination_class = RecordingCursorPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'language', 'file_format']
+    filterset_class = RecordingFilter
     search_fields = ['title', 'description', 'tags']
     ordering_fields = ['created_at', 'duration_seconds', 'file_size_bytes']
     ordering = ['-created_at']
@@ -288,16 +314,33 @@ class RecordingViewSet(viewsets.ModelViewSet):
             return RecordingUploadSerializer
         return RecordingSerializer
     
+    def initialize_request(self, request, *args, **kwargs):
+        """
+        Validate uploads while they stream in. Installed before authentication,
+        since session (CSRF) and OAuth2 authentication already parse the body;
+        the handler looks up the user's limit when the upload starts.
+        """
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'create':
+            request.upload_handlers = [AudioUploadHandler(request)]
+        return drf_request
+    
     def perform_create(self, serializer):
         """Create recording with quota checking and processing trigger."""
         user = self.request.user
         
-        # Check user quota
-        if not check_user_quota(user, 'recordings'):
+        # Hold a recording slot atomically so parallel uploads cannot overshoot
+        reservation = reserve_quota(user, 'recordings')
+        if reservation is None:
             raise permissions.PermissionDenied("Recording quota exceeded")
         
         # Save recording
-        recording = serializer.save(user=user)
+        try:
+            recording = serializer.save(user=user)
+        except Exception:
+            release_quota(reservation)
+            raise
+        commit_quota(reservation)
         
         # Log creation
         log_audit_event(
@@ -311,6 +354,64 @@ class RecordingViewSet(viewsets.ModelViewSet):
         # Trigger async transcription processing
         process_audio_transcription.delay(recording.id)
     
+    @action(detail=True, methods=['get'], throttle_classes=[PlaybackRateThrottle])
+    def audio(self, request, pk=None):
+        """
+        Stream the recording for playback with Range and conditional GET
+        support. `?quality=low` serves a cached low-bitrate Opus rendition
+        once it exists. Local files can be handed to the front-end server
+        (STREAMING_OFFLOAD) and object storage redirects to a presigned URL.
+        """
+        recording = self.get_object()
+        quality = request.query_params.get('quality', 'original')
+        if quality != 'original' and quality not in RENDITIONS:
+            return Response({
+                'success': False,
+                'message': f"Unknown quality '{quality}'. Use: original, {', '.join(RENDITIONS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        storage, name, content_type, served = playback_source(recording, quality)
+        size = storage.size(name)
+        etag = hashlib.sha1(f'{name}:{size}'.encode()).hexdigest()[:20]
+        
+        response = offloaded_file_response(
+            request, storage, name, content_type, etag=etag, last_modified=recording.updated_at
+        ) or ranged_file_response(
+            request, storage.open(name, 'rb'), size, content_type,
+            etag=etag, last_modified=recording.updated_at,
+        )
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Audio-Rendition'] = served
+        response['Vary'] = 'Authorization'
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def waveform(self, request, pk=None):
+        """
+        Precomputed waveform peaks (see waveforms.encode_waveform for the
+        layout). Requested with `?v=<waveform_version>` from the recording,
+        the response is immutable and cached for a year.
+        """
+        recording = self.get_object()
+        if not recording.waveform_file:
+            return Response({
+                'success': False,
+                'message': 'Waveform is not available yet'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        waveform = recording.waveform_file
+        etag = waveform_version(recording)
+        response = offloaded_file_response(
+            request, waveform.storage, waveform.name, WAVEFORM_CONTENT_TYPE, etag=etag
+        ) or ranged_file_response(
+            request, waveform.open('rb'), waveform.size, WAVEFORM_CONTENT_TYPE, etag=etag
+        )
+        if request.query_params.get('v') == etag:
+            response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+    
     @action(detail=True, methods=['post'])
     def start_transcription(self, request, pk=None):
         """Manually trigger transcription processing."""
@@ -322,13 +423,19 @@ class RecordingViewSet(viewsets.ModelViewSet):
                 'message': 'Recording is not ready for transcription'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check transcription quota
-        if not check_user_quota(request.user, 'transcription_minutes', recording.duration_seconds / 60):
+        # Hold the minutes until the transcription completes or fails
+        if recording.quota_reservation:
+            release_quota(recording.quota_reservation)
+        reservation = reserve_quota(request.user, 'transcription_minutes', minutes_for(recording.duration_seconds))
+        if reservation is None:
             return Response({
                 'success': False,
                 'message': 'Transcription quota exceeded'
             }, status=status.HTTP_403_FORBIDDEN)
         
+        recording.quota_reservation = reservation
+        recording.save(update_fields=['quota_reservation', 'updated_at'])
+        
         # Trigger processing
         task = process_audio_transcription.delay(recording.id)
         
@@ -390,15 +497,15 @@ class RecordingViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TranscriptionViewSet(viewsets.ModelViewSet):
+class TranscriptionViewSet(RateLimitHeadersMixin, viewsets.ModelViewSet):
     """Transcription management ViewSet with version control."""
     serializer_class = TranscriptionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     throttle_classes = [CustomUserRateThrottle]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filterset_fields = ['status', 'api_provider', 'is_manually_edited']
-    search_fields = ['text', 'recording__title']
+    search_document_field = 'text'
     
     def get_queryset(self):
         """Return transcriptions for user's recordings."""
@@ -412,14 +519,20 @@ class TranscriptionViewSet(viewsets.ModelViewSet):
         transcription = self.get_object()
         analysis_type = request.data.get('analysis_type', 'summary')
         
-        if not check_user_quota(request.user, 'ai_analysis'):
+        reservation = reserve_quota(request.user, 'ai_analysis')
+        if reservation is None:
             return Response({
                 'success': False,
                 'message': 'AI analysis quota exceeded'
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Trigger async analysis
-        task = generate_ai_analysis.delay(transcription.id, analysis_type)
+        try:
+            task = generate_ai_analysis.delay(transcription.id, analysis_type)
+        except Exception:
+            release_quota(reservation)
+            raise
+        commit_quota(reservation)
         
         return Response({
             'success': True,
@@ -427,39 +540,145 @@ class TranscriptionViewSet(viewsets.ModelViewSet):
             'data': {'task_id': task.id, 'analysis_type': analysis_type}
         })
     
+    @action(detail=False, methods=['get'])
+    def segments(self, request):
+        """Search transcript segments and return hits with audio timestamps."""
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({
+                'success': False,
+                'message': 'Query parameter "q" is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        segments = TranscriptSegment.objects.filter(recording__user=request.user)
+        recording_id = request.query_params.get('recording')
+        if recording_id:
+            segments = segments.filter(recording_id=recording_id)
+        
+        hits = search_segments(segments, query, language=request.query_params.get('language'))
+        page = self.paginate_queryset(hits)
+        serializer = TranscriptSegmentSerializer(page if page is not None else hits, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def semantic_search(self, request):
+        """Return the top-k segments closest in meaning to the query."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({
+                'success': False,
+                'message': 'Query parameter "q" is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 100)
+        except ValueError:
+            k = 10
+        
+        segments = semantic_search(request.user, query, k=k)
+        serializer = TranscriptSegmentSerializer(segments, many=True)
+        results = [
+            {**data, 'score': round(segment.semantic_score, 4)}
+            for data, segment in zip(serializer.data, segments)
+        ]
+        return Response({'count': len(results), 'results': results})
+    
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """
+        Edit history, newest first. With `?version=N`, the full text of that
+        version, rebuilt from the nearest snapshot and the diffs after it.
+        """
+        transcription = self.get_object()
+        requested = request.query_params.get('version')
+        if requested is None:
+            return Response({'current': transcription.version, 'versions': revision_history(transcription)})
+        
+        try:
+            version = int(requested)
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'version must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            text = text_at_version(transcription, version)
+        except RevisionError as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({'version': version, 'current': version == transcription.version, 'text': text})
+    
     @action(detail=True, methods=['get'])
+    def words(self, request, pk=None):
+        """
+        Word-level timestamps overlapping `?start=&end=` (seconds; the whole
+        transcript when omitted), decoded from the packed word timings.
+        """
+        transcription = self.get_object()
+        try:
+            start = float(request.query_params.get('start', 0))
+            end = request.query_params.get('end')
+            end = float(end) if end is not None else None
+            # float() accepts 'nan' and 'inf', which cannot be turned into milliseconds
+            if not math.isfinite(start) or (end is not None and not math.isfinite(end)):
+                raise ValueError('non-finite bound')
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'start and end must be finite numbers of seconds'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        timings = load_word_timings(transcription)
+        if timings is None:
+            return Response({
+                'success': False,
+                'message': 'Word timings are not available for this transcription'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        words = timings.words(transcription.text, max(start, 0.0), end)
+        return Response({'count': len(words), 'total': len(timings), 'words': words})
+    
+    @action(detail=True, methods=['get'], content_negotiation_class=ExportContentNegotiation)
     def export(self, request, pk=None):
-        """Export transcription in different formats."""
+        """Stream the transcription rendered from its segments (srt, vtt, txt, json, docx, pdf)."""
         transcription = self.get_object()
         format_type = request.query_params.get('format', 'json')
         
-        if format_type == 'srt':
-            content = transcription.srt_format
-            content_type = 'text/plain'
-        elif format_type == 'vtt':
-            content = transcription.vtt_format
-            content_type = 'text/vtt'
-        elif format_type == 'txt':
-            content = transcription.text
-            content_type = 'text/plain'
-        else:
-            content = transcription.json_format
-            content_type = 'application/json'
+        if format_type not in EXPORT_FORMATS:
+            return Response({
+                'success': False,
+                'message': f'Unsupported export format: {format_type}',
+                'errors': {'format': sorted(EXPORT_FORMATS)}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            response = export_response(request, transcription, format_type)
+        except ExportError as e:
+            logger.error(f"Export failed for transcription {transcription.id}: {str(e)}")
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
         
-        response = Response(content, content_type=content_type)
-        response['Content-Disposition'] = f'attachment; filename="transcription.{format_type}"'
+        if response.status_code == status.HTTP_200_OK:
+            record_usage_event(request.user.id, 'export', api_calls=1, recording_id=transcription.recording_id)
         return response
 
 
-class AnalysisViewSet(viewsets.ReadOnlyModelViewSet):
+class AnalysisViewSet(RateLimitHeadersMixin, viewsets.ReadOnlyModelViewSet):
     """Analysis results ViewSet for viewing AI-generated content."""
     serializer_class = AnalysisSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     throttle_classes = [CustomUserRateThrottle]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filterset_fields = ['analysis_type', 'ai_provider']
-    search_fields = ['content', 'transcription__recording__title']
+    search_document_field = 'content'
     
     def get_queryset(self):
         """Return analyses for user's transcriptions."""
@@ -468,8 +687,169 @@ class AnalysisViewSet(viewsets.ReadOnlyModelViewSet):
         ).select_related('transcription__recording')
 
 
+class BulkExportViewSet(RateLimitHeadersMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Bulk export jobs: ZIP archives of filtered recordings, downloadable with Range support."""
+    serializer_class = BulkExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsSubscriptionActive]
+    throttle_classes = [CustomUserRateThrottle]
+    pagination_class = StandardResultsSetPagination
+    
+    def get_queryset(self):
+        """Return the user's export jobs."""
+        return BulkExportJob.objects.filter(user=self.request.user)
+    
+    def perform_create(self, serializer):
+        """Queue the archive build once the job row is committed."""
+        job = serializer.save(user=self.request.user)
+        
+        log_audit_event(
+            user=self.request.user,
+            action='bulk_export_create',
+            resource_type='bulk_export',
+            resource_id=str(job.id),
+            request_data={'filters': job.filters, 'formats': job.formats}
+        )
+        
+        transaction.on_commit(lambda: build_bulk_export.delay(str(job.id)))
+    
+    @action(detail=True, methods=['get'], url_name='download')
+    def download(self, request, pk=None):
+        """Stream the finished archive; Range requests resume interrupted downloads."""
+        job = self.get_object()
+        
+        if not job.is_downloadable:
+            return Response({
+                'success': False,
+                'message': f'Export is not available for download (status: {job.status})'
+            }, status=status.HTTP_409_CONFLICT if job.status in ('pending', 'running') else status.HTTP_410_GONE)
+        
+        return ranged_file_response(
+            request,
+            job.archive_file.open('rb'),
+            size=job.archive_size_bytes or job.archive_file.size,
+            content_type='application/zip',
+            filename=f'scriby-export-{job.id}.zip',
+            etag=job.archive_sha256 or None,
+            last_modified=job.completed_at,
+        )
+
+
+class UploadSessionViewSet(RateLimitHeadersMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads: create a session, PATCH raw chunks to
+    `append` with an Upload-Offset header, then POST `complete`. GET or
+    HEAD on the session reports the offset to resume from. Sessions created
+    with `direct` are POSTed to object storage via the returned `upload`
+    request instead, and `complete` is the callback that starts processing.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsSubscriptionActive]
+    throttle_classes = [CustomUserRateThrottle]
+    
+    def get_queryset(self):
+        """Return the user's upload sessions."""
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Report progress in tus-style headers so HEAD is enough to resume."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        session = getattr(self, '_session', None)
+        if session is not None:
+            response['Upload-Offset'] = str(session.offset)
+            response['Upload-Length'] = str(session.total_size)
+            response['Cache-Control'] = 'no-store'
+        return response
+    
+    def get_object(self):
+        self._session = super().get_object()
+        return self._session
+    
+    def perform_create(self, serializer):
+        self._session = serializer.save()
+    
+    def perform_destroy(self, instance):
+        """Abort the upload and discard the received bytes."""
+        abort_upload(instance)
+    
+    def _upload_error(self, error):
+        data = {'success': False, 'message': str(error)}
+        if isinstance(error, UploadConflict):
+            data['offset'] = error.offset
+        return Response(data, status=error.status)
+    
+    @action(detail=True, methods=['patch'], parser_classes=[])
+    def append(self, request, pk=None):
+        """Stream one chunk into the upload at the offset the client claims."""
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({
+                'success': False,
+                'message': 'Upload-Offset and Content-Length headers are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Optional per-chunk checksum, tus-style: "sha256 <base64 digest>"
+        checksum = None
+        checksum_header = request.headers.get('Upload-Checksum')
+        if checksum_header:
+            algorithm, _, encoded = checksum_header.partition(' ')
+            try:
+                if algorithm.lower() != 'sha256':
+                    raise ValueError(algorithm)
+                checksum = base64.b64decode(encoded, validate=True).hex()
+            except (ValueError, binascii.Error):
+                return Response({
+                    'success': False,
+                    'message': 'Upload-Checksum must be "sha256 <base64 digest>"'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            append_chunk(session, offset, request.stream, length, checksum)
+        except UploadError as e:
+            return self._upload_error(e)
+        return Response(self.get_serializer(session).data)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Assemble the upload into a recording and queue its processing."""
+        session = self.get_object()
+        
+        reservation = reserve_quota(request.user, 'recordings')
+        if reservation is None:
+            return Response({
+                'success': False,
+                'message': 'Recording quota exceeded'
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            recording = complete_upload(session)
+        except UploadError as e:
+            release_quota(reservation)
+            return self._upload_error(e)
+        except Exception:
+            release_quota(reservation)
+            raise
+        commit_quota(reservation)
+        
+        log_audit_event(
+            user=request.user,
+            action='recording_create',
+            resource_type='recording',
+            resource_id=str(recording.id),
+            request_data={'title': recording.title, 'file_size': recording.file_size_bytes,
+                          'upload_session': str(session.id)}
+        )
+        
+        transaction.on_commit(lambda: process_audio_transcription.delay(recording.id))
+        return Response(RecordingSerializer(recording, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
+
+
 # Analytics and Reporting Views
-class AnalyticsView(APIView):
+class AnalyticsView(RateLimitHeadersMixin, APIView):
     """Analytics dashboard data for admin users."""
     permission_classes = [permissions.IsAuthenticated]
     throttle_classes = [CustomUserRateThrottle]
@@ -477,41 +857,13 @@ class AnalyticsView(APIView):
     def get(self, request):
         """Get comprehensive analytics data."""
         user = request.user
-        cache_key = f"analytics_{user.id}"
-        
-        # Check cache first
-        analytics_data = cache.get(cache_key)
-        if not analytics_data:
-            # Calculate analytics
-            recordings = Recording.objects.filter(user=user)
-            transcriptions = Transcription.objects.filter(recording__user=user)
-            
-            analytics_data = {
-                'overview': {
-                    'total_recordings': recordings.count(),
-                    'total_transcriptions': transcriptions.count(),
-                    'total_duration_hours': recordings.aggregate(
-                        total=Sum('duration_seconds')
-                    )['total'] / 3600 if recordings.exists() else 0,
-                    'avg_confidence_score': transcriptions.aggregate(
-                        avg=Avg('confidence_score')
-                    )['avg'] or 0,
-                },
-                'monthly_stats': {
-                    'recordings_this_month': recordings.filter(
-                        created_at__gte=timezone.now().replace(day=1)
-                    ).count(),
-                    'transcription_minutes_used': user.monthly_transcription_minutes,
-                    'api_calls_made': user.monthly_api_calls,
-                },
-                'recent_activity': recordings.filter(
-                    created_at__gte=timezone.now() - timedelta(days=7)
-                ).values('created_at__date').annotate(count=Count('id')),
-            }
-            
-            # Cache for 10 minutes
-            cache.set(cache_key, analytics_data, 600)
+        analytics_data = cached_dashboard(user)
         
+        # Usage counters live on the user row, already loaded for this request
+        analytics_data['monthly_stats'].update({
+            'transcription_minutes_used': user.monthly_transcription_minutes,
+            'api_calls_made': user.monthly_api_calls,
+        })
         return Response(analytics_data)
 
 
@@ -552,6 +904,9 @@ def health_check(request):
 def system_stats(request):
     """System statistics for admin dashboard."""
     stats = get_system_stats()
+    stats['cache_metrics'] = {namespace: cache_metrics(namespace) for namespace in STATS_CACHE_NAMESPACES}
+    stats['storage'] = storage_report()
+    stats['scratch'] = scratch_metrics()
     serializer = SystemStatsSerializer(stats)
     return Response(serializer.data)
 
@@ -0,0 +1,162 @@
+"""
+Scriby - Waveform peaks
+Multi-resolution min/max peak arrays computed from decoded PCM and stored as a compact binary artifact
+"""
+
+import hashlib
+import io
+import logging
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+# Constants
+WAVEFORM_MAGIC = b'SCWF'
+WAVEFORM_VERSION = 1
+WAVEFORM_CONTENT_TYPE = 'application/vnd.scriby.waveform'
+BASE_SAMPLES_PER_PEAK = 512  # 32 ms per peak at 16 kHz
+MIN_LEVEL_PEAKS = 1024  # stop halving once a level is about one screen wide
+DECODE_BLOCK_FRAMES = 16000 * 30  # 30 s of 16 kHz audio per read
+
+# magic, version, bits, level count, sample rate
+_HEADER = struct.Struct('<4sBBHI')
+# samples per peak, peak count
+_LEVEL = struct.Struct('<II')
+
+Level = Tuple[int, np.ndarray, np.ndarray]  # samples per peak, mins, maxs
+
+
+class PeakBuilder:
+    """
+    Accumulates min/max peaks from PCM blocks of any size, so the audio is
+    never held in memory whole; memory grows with the number of peaks only.
+    """
+
+    def __init__(self, samples_per_peak: int = BASE_SAMPLES_PER_PEAK):
+        self.samples_per_peak = samples_per_peak
+        self._carry = np.empty(0, dtype=np.float32)
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+
+    def add(self, block: np.ndarray):
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        data = np.concatenate([self._carry, block.astype(np.float32, copy=False)])
+        whole = len(data) - len(data) % self.samples_per_peak
+        if whole:
+            frames = data[:whole].reshape(-1, self.samples_per_peak)
+            self._mins.append(frames.min(axis=1))
+            self._maxs.append(frames.max(axis=1))
+        self._carry = data[whole:]
+
+    def finish(self) -> List[Level]:
+        """Base level followed by successively halved levels, finest first."""
+        if len(self._carry):
+            self._mins.append(self._carry.min(keepdims=True))
+            self._maxs.append(self._carry.max(keepdims=True))
+            self._carry = np.empty(0, dtype=np.float32)
+        mins = np.concatenate(self._mins) if self._mins else np.zeros(0, dtype=np.float32)
+        maxs = np.concatenate(self._maxs) if self._maxs else np.zeros(0, dtype=np.float32)
+
+        spp = self.samples_per_peak
+        levels = [(spp, mins, maxs)]
+        while len(mins) > MIN_LEVEL_PEAKS:
+            if len(mins) % 2:
+                mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+            mins = mins.reshape(-1, 2).min(axis=1)
+            maxs = maxs.reshape(-1, 2).max(axis=1)
+            spp *= 2
+            levels.append((spp, mins, maxs))
+        return levels
+
+
+def compute_peaks_from_file(path: str) -> Tuple[List[Level], int]:
+    """Decode a file block by block and return its peak levels and sample rate."""
+    import soundfile as sf
+
+    builder = PeakBuilder()
+    with sf.SoundFile(path) as audio:
+        sample_rate = audio.samplerate
+        for block in audio.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype='float32'):
+            builder.add(block)
+    return builder.finish(), sample_rate
+
+
+# =============================================================================
+# BINARY FORMAT
+# =============================================================================
+
+def _quantize(values: np.ndarray, bits: int) -> np.ndarray:
+    scale = 127 if bits == 8 else 32767
+    dtype = np.int8 if bits == 8 else np.int16
+    return np.clip(np.round(values * scale), -scale, scale).astype(dtype)
+
+
+def encode_waveform(levels: List[Level], sample_rate: int, bits: int = 8) -> bytes:
+    """
+    Serialize peak levels, coarsest first so a client can draw an overview
+    from the first few kilobytes (or a Range request) before the rest.
+    Layout: header, one (samples per peak, count) entry per level, then each
+    level's interleaved min/max pairs as little-endian int8 or int16.
+    """
+    if bits not in (8, 16):
+        raise ValueError("bits must be 8 or 16")
+    ordered = sorted(levels, key=lambda level: -level[0])
+    out = io.BytesIO()
+    out.write(_HEADER.pack(WAVEFORM_MAGIC, WAVEFORM_VERSION, bits, len(ordered), sample_rate))
+    for spp, mins, _ in ordered:
+        out.write(_LEVEL.pack(spp, len(mins)))
+    for _, mins, maxs in ordered:
+        pairs = np.empty(len(mins) * 2, dtype=np.int8 if bits == 8 else np.int16)
+        pairs[0::2], pairs[1::2] = _quantize(mins, bits), _quantize(maxs, bits)
+        out.write(pairs.astype(pairs.dtype.newbyteorder('<')).tobytes())
+    return out.getvalue()
+
+
+def decode_waveform(data: bytes) -> Dict:
+    """Parse an encoded waveform back into levels of (count, 2) float arrays in [-1, 1]."""
+    magic, version, bits, count, sample_rate = _HEADER.unpack_from(data, 0)
+    if magic != WAVEFORM_MAGIC or version != WAVEFORM_VERSION:
+        raise ValueError("Not a Scriby waveform")
+    position = _HEADER.size
+    entries = []
+    for _ in range(count):
+        entries.append(_LEVEL.unpack_from(data, position))
+        position += _LEVEL.size
+
+    dtype = np.dtype('<i1') if bits == 8 else np.dtype('<i2')
+    scale = 127 if bits == 8 else 32767
+    levels = []
+    for spp, peaks in entries:
+        values = np.frombuffer(data, dtype=dtype, count=peaks * 2, offset=position)
+        position += peaks * 2 * dtype.itemsize
+        levels.append({'samples_per_peak': spp, 'peaks': values.reshape(-1, 2).astype(np.float32) / scale})
+    return {'sample_rate': sample_rate, 'bits': bits, 'levels': levels}
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+def waveform_version(recording):
+    """Changes whenever the artifact does; used as ETag and cache-busting query value."""
+    if not recording.waveform_file:
+        return None
+    return hashlib.sha1(recording.waveform_file.name.encode()).hexdigest()[:20]
+
+
+def store_waveform(recording, pcm_path: str, bits: int = 8) -> int:
+    """Compute and save the recording's waveform artifact. Returns its size in bytes."""
+    levels, sample_rate = compute_peaks_from_file(pcm_path)
+    data = encode_waveform(levels, sample_rate, bits)
+    previous = recording.waveform_file.name if recording.waveform_file else None
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    recording.waveform_file.save(f'{recording.pk}-{digest}.peaks', ContentFile(data), save=False)
+    recording.save(update_fields=['waveform_file', 'updated_at'])
+    if previous and previous != recording.waveform_file.name:
+        recording.waveform_file.storage.delete(previous)
+    return len(data)